@@ -0,0 +1,70 @@
+"""
+Compares peak Python-heap allocations of the band-math engine against the
+previous whole-array NDVI implementation.
+
+Usage:
+    python benchmarks/bench_band_math.py [size] [index]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from safe_ro.core.band_math import INDICES, BandMath  # noqa: E402
+
+
+def naive_ndvi(red, nir):
+    """The pre-engine NDVIProcessor.compute_ndvi arithmetic."""
+    denom = nir + red
+    denom[denom == 0] = 1e-6
+    ndvi = (nir - red) / denom
+    return np.clip(ndvi, -1.0, 1.0)
+
+
+def naive_index(bands, formula):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return eval(formula, {}, dict(bands))
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    index = sys.argv[2].upper() if len(sys.argv) > 2 else "NDVI"
+    rng = np.random.default_rng(0)
+    names = ("BLUE", "GREEN", "RED", "NIR", "SWIR1", "SWIR2")
+    engine = BandMath(index)
+    bands = {n: rng.uniform(0.01, 0.6, (size, size)).astype(np.float32) for n in engine.bands}
+    result_mb = size * size * 4 / 1e6
+
+    if index == "NDVI":
+        naive = lambda: naive_ndvi(bands["RED"], bands["NIR"])  # noqa: E731
+    else:
+        naive = lambda: naive_index(bands, INDICES[index])  # noqa: E731
+    t_naive, peak_naive = measure(naive)
+    t_engine, peak_engine = measure(lambda: engine.evaluate(bands))
+
+    print(f"{index} on {size}x{size} float32 (result alone: {result_mb:.0f} MB)")
+    print(f"  bands read: {', '.join(engine.bands)} of {', '.join(names)}")
+    print(f"  {'':8} {'time (s)':>10} {'peak (MB)':>10} {'temporaries (MB)':>18}")
+    for label, t, peak in (("numpy", t_naive, peak_naive), ("engine", t_engine, peak_engine)):
+        temporaries = peak / 1e6 - result_mb
+        print(f"  {label:8} {t:10.3f} {peak / 1e6:10.1f} {temporaries:18.1f}")
+    print(f"  allocation savings: {peak_naive / max(peak_engine, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Measures cold-start cost: module import time (via `python -X importtime`) and
+the time from spawning a uvicorn worker to its first successful /health.
+
+Usage:
+    python benchmarks/bench_startup.py                       # API module + core, /health
+    python benchmarks/bench_startup.py --modules safe_ro.core.zonal --repeat 10
+    python benchmarks/bench_startup.py --top 15 --json startup.json
+
+Each measurement runs in a fresh interpreter; the median over --repeat runs
+is reported. The --top heaviest top-level packages of the first module show
+where the import time goes.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+DEFAULT_MODULES = ("safe_ro.interfaces.safe_ro_api", "safe_ro.core.safe_ro_core")
+DEFAULT_APP = "safe_ro.interfaces.safe_ro_api:app"
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output into [(module, self_us, cumulative_us, depth)].
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def import_time(module):
+    """Returns (total ms, {top-level package: ms}) for importing `module` cold."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_env(),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {proc.stderr.strip().splitlines()[-1]}")
+    entries = parse_importtime(proc.stderr)
+    packages = {}
+    for name, self_us, _, _ in entries:
+        top = name.split(".")[0]
+        packages[top] = packages.get(top, 0) + self_us / 1000
+    total = next(cum for name, _, cum, _ in reversed(entries) if name == module) / 1000
+    return total, packages
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_health(app, timeout=30.0):
+    """Seconds from spawning `uvicorn app` until GET /health answers 200."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+                time.sleep(0.005)
+        raise RuntimeError(f"/health did not answer within {timeout} s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAFE-RO cold-start benchmark.")
+    parser.add_argument("--modules", nargs="+", default=list(DEFAULT_MODULES))
+    parser.add_argument("--app", default=DEFAULT_APP, help="uvicorn app for /health ('' to skip)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {"imports_ms": {}, "packages_ms": {}}
+    for module in args.modules:
+        runs = [import_time(module) for _ in range(args.repeat)]
+        results["imports_ms"][module] = round(statistics.median(t for t, _ in runs), 1)
+        if module == args.modules[0]:
+            names = set().union(*(p for _, p in runs))
+            packages = {n: statistics.median(p.get(n, 0.0) for _, p in runs) for n in names}
+            heaviest = sorted(packages.items(), key=lambda kv: -kv[1])[: args.top]
+            results["packages_ms"] = {name: round(ms, 1) for name, ms in heaviest}
+
+    print(f"Import time (median of {args.repeat} cold runs):")
+    for module, ms in results["imports_ms"].items():
+        print(f"  {module:45} {ms:8.1f} ms")
+    print(f"\nHeaviest packages imported by {args.modules[0]} (self time):")
+    for name, ms in results["packages_ms"].items():
+        print(f"  {name:45} {ms:8.1f} ms")
+
+    if args.app:
+        runs = [time_to_health(args.app) for _ in range(args.repeat)]
+        results["time_to_health_s"] = round(statistics.median(runs), 3)
+        print(f"\nTime to first /health ({args.app}): {results['time_to_health_s'] * 1000:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
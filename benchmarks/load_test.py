@@ -0,0 +1,451 @@
+"""
+Load tests of the API, with local stand-ins for Earth Engine downloads and
+the Google Drive sync folder (see stand_ins.py) instead of live services.
+
+    python benchmarks/load_test.py                                     # "steady" scenario
+    python benchmarks/load_test.py --scenario flood_event --workers 4 --json flood.json
+    python benchmarks/load_test.py --scenario my_spike.json --url http://127.0.0.1:8000
+    python benchmarks/load_test.py --scenario flood_event --time-scale 0.1   # smoke run
+
+A scenario is JSON: latency and failure profiles for the stand-ins, extra
+requests it may send, and phases, each held for `duration_s` with
+`concurrency` requests in flight, drawn from a weighted `mix`:
+
+    {
+      "stand_ins": {"gee": {"latency_ms": 80, "jitter_ms": 40, "failure_rate": 0.02}},
+      "requests": {"zones": {"method": "POST", "path": "/zonal",
+                             "json": {"zones_path": "data/zones.geojson", "product": "flood",
+                                      "s1_path": "{vv}"}}},
+      "phases": [
+        {"name": "calm", "duration_s": 20, "concurrency": 2, "mix": {"ndvi": 3, "health": 1}},
+        {"name": "spike", "duration_s": 60, "concurrency": 48, "mix": {"flood": 5, "zones": 2}}
+      ]
+    }
+
+Request bodies may refer to {red}, {nir} and {vv}, the stand-in GeoTIFFs as
+GDAL /vsicurl/ paths to the "gee" service (so analyses pay its latency for
+whatever GDAL has not yet cached in that worker); {drive_red}, {drive_nir}
+and {drive_vv}, the same rasters as files in the "drive" folder; {red_file},
+{nir_file} and {vv_file}, their local paths, for multipart uploads
+("files"); {zones}, a GeoJSON of four zones over the rasters; and
+{stand_ins}, the stand-ins' base URL. Requests with a "poll" path follow a
+preview job until it has the full-resolution result; their latency is the
+time until then. REQUESTS has the built-in requests; SCENARIOS the built-in
+scenarios, including a "flood_event" traffic spike.
+
+The API itself only reads rasters from the stand-ins; CDSE search and FIRMS
+are called by the dashboard, not the API, so their stand-ins get no traffic
+here (see test_load_test.py for driving the clients against them).
+
+Unless --url is given, the API is started here with uvicorn --workers N.
+For every phase and request the report gives the number of requests,
+throughput, p50 / p95 / p99 latency and error rate (HTTP status >= 400, a
+connection error, or an "error" in the JSON answer), and the peak RSS of
+every API worker, sampled from /proc. Exits with status 1 if a phase's
+error rate is above --max-error-rate.
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_startup import DEFAULT_APP, _env, _free_port  # noqa: E402
+import synthetic  # noqa: E402
+from stand_ins import StandIns  # noqa: E402
+
+REQUESTS = {
+    "health": {"method": "GET", "path": "/health"},
+    "ndvi": {"method": "POST", "path": "/ndvi", "json": {"red_path": "{red}", "nir_path": "{nir}"}},
+    "ndvi_preview": {
+        "method": "POST", "path": "/ndvi", "poll": "/jobs/{job_id}",
+        "json": {"red_path": "{red}", "nir_path": "{nir}", "preview": True},
+    },
+    "ndvi_drive": {"method": "POST", "path": "/ndvi", "json": {"red_path": "{drive_red}", "nir_path": "{drive_nir}"}},
+    "ndvi_upload": {"method": "POST", "path": "/ndvi/upload", "files": {"red": "{red_file}", "nir": "{nir_file}"}},
+    "flood": {"method": "POST", "path": "/flood", "json": {"s1_path": "{vv}"}},
+    "flood_preview": {
+        "method": "POST", "path": "/flood", "poll": "/jobs/{job_id}", "json": {"s1_path": "{vv}", "preview": True},
+    },
+    "flood_filtered": {"method": "POST", "path": "/flood", "json": {"s1_path": "{vv}", "speckle_filter": "median"}},
+    "flood_drive": {"method": "POST", "path": "/flood", "json": {"s1_path": "{drive_vv}"}},
+    "flood_upload": {"method": "POST", "path": "/flood/upload", "files": {"s1": "{vv_file}"}},
+    "flood_polygons": {"method": "POST", "path": "/flood/polygons", "json": {"s1_path": "{vv}"}},
+    "zonal_ndvi": {
+        "method": "POST", "path": "/zonal",
+        "json": {"zones_path": "{zones}", "product": "ndvi", "red_path": "{red}", "nir_path": "{nir}"},
+    },
+    "zonal_flood": {
+        "method": "POST", "path": "/zonal", "json": {"zones_path": "{zones}", "product": "flood", "s1_path": "{vv}"},
+    },
+}
+POLL_INTERVAL_S = 0.1
+
+SCENARIOS = {
+    "steady": {
+        "stand_ins": {"gee": {"latency_ms": 20, "jitter_ms": 10}},
+        "phases": [
+            {"name": "steady", "duration_s": 30, "concurrency": 4,
+             "mix": {"ndvi": 2, "flood": 2, "health": 1}},
+        ],
+    },
+    # Quiet monitoring, then everyone looks at the same flooded region at
+    # once: Earth Engine downloads slow down and the Drive folder, which the
+    # field teams' uploads also go through, starts failing.
+    "flood_event": {
+        "stand_ins": {
+            "gee": {"latency_ms": 40, "jitter_ms": 20, "failure_rate": 0.005},
+            "drive": {"latency_ms": 150, "jitter_ms": 50, "failure_rate": 0.01},
+        },
+        "phases": [
+            {"name": "baseline", "duration_s": 20, "concurrency": 2,
+             "mix": {"ndvi": 3, "ndvi_drive": 1, "flood": 1, "zonal_ndvi": 1, "health": 1}},
+            {"name": "spike", "duration_s": 60, "concurrency": 32,
+             "mix": {"flood": 6, "flood_drive": 2, "flood_polygons": 3, "flood_preview": 2, "zonal_flood": 2,
+                     "flood_upload": 1, "flood_filtered": 1, "health": 1}},
+            {"name": "recovery", "duration_s": 20, "concurrency": 4,
+             "mix": {"flood": 2, "ndvi": 1, "ndvi_upload": 1, "health": 1}},
+        ],
+    },
+}
+
+
+def load_scenario(name_or_path):
+    """A built-in scenario by name, or one from a JSON file."""
+    if name_or_path in SCENARIOS:
+        return copy.deepcopy(SCENARIOS[name_or_path])
+    with open(name_or_path) as f:
+        return json.load(f)
+
+
+def _fill(value, values):
+    """Substitutes {red}, {vv}, ... in every string of a request body."""
+    if isinstance(value, str):
+        for key, replacement in values.items():
+            value = value.replace(f"{{{key}}}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {k: _fill(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, values) for v in value]
+    return value
+
+
+def write_zones(path, bounds=synthetic.BOUNDS):
+    """A GeoJSON of four zones, the quadrants of `bounds`, for /zonal requests."""
+    west, south, east, north = bounds
+    mid_x, mid_y = (west + east) / 2, (south + north) / 2
+    features = []
+    for i, (w, s, e, n) in enumerate([
+        (west, mid_y, mid_x, north), (mid_x, mid_y, east, north),
+        (west, south, mid_x, mid_y), (mid_x, south, east, mid_y),
+    ]):
+        features.append({
+            "type": "Feature", "id": i + 1, "properties": {"name": f"zone {i + 1}"},
+            "geometry": {"type": "Polygon", "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+        })
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return path
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list; None if it is empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, seconds):
+    """Throughput, latency percentiles and errors of [(latency_s, ok, status)]."""
+    latencies = sorted(latency for latency, _, _ in samples)
+    errors = defaultdict(int)
+    for _, ok, status in samples:
+        if not ok:
+            errors[status] += 1
+    failed = sum(errors.values())
+
+    def ms(q):
+        value = percentile(latencies, q)
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds > 0 else 0.0,
+        "p50_ms": ms(50),
+        "p95_ms": ms(95),
+        "p99_ms": ms(99),
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "errors": dict(errors),
+    }
+
+
+def _has_error(response):
+    """The API answers some failures with 200 and an "error" field."""
+    if "json" not in response.headers.get("Content-Type", ""):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and "error" in body
+
+
+# Worker memory
+# -----------------------------------------------------------------------------
+def _proc_status(pid, field):
+    """A /proc/<pid>/status field in MB, or None once the process is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def worker_pids(server_pid):
+    """The uvicorn worker processes of `server_pid` (itself if it has none)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == server_pid and b"resource_tracker" not in cmdline:
+            children.append(int(entry))
+    return sorted(children) or [server_pid]
+
+
+class RssSampler:
+    """Samples the peak RSS (VmHWM) of every API worker in the background."""
+
+    def __init__(self, server_pid, interval=0.5):
+        self.server_pid = server_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        for pid in worker_pids(self.server_pid):
+            peak = _proc_status(pid, "VmHWM")
+            if peak is not None:
+                self.peaks[pid] = round(max(peak, self.peaks.get(pid, 0.0)), 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+# Running
+# -----------------------------------------------------------------------------
+def start_api(workers=1, app=DEFAULT_APP, timeout=60.0):
+    """Starts uvicorn with `workers` workers; returns (process, base URL) once /health answers."""
+    port = _free_port()
+    env = _env()
+    env.setdefault("GDAL_DISABLE_READDIR_ON_OPEN", "EMPTY_DIR")  # no directory listing over /vsicurl/
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1) as response:
+                if response.status == 200:
+                    return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"/health did not answer within {timeout} s")
+
+
+def send(session, url, spec, values, timeout):
+    """Sends one request of the table, following a preview job to its end if the request has a "poll" path."""
+    files = {field: open(path, "rb") for field, path in _fill(spec.get("files", {}), values).items()}
+    try:
+        response = session.request(
+            spec["method"], f"{url}{spec['path']}", json=_fill(spec.get("json"), values),
+            data=_fill(spec.get("data"), values), files=files or None, timeout=timeout,
+        )
+    finally:
+        for f in files.values():
+            f.close()
+    while spec.get("poll") and response.status_code < 400 and not _has_error(response):
+        body = response.json()
+        if body.get("status") != "running":
+            break
+        time.sleep(POLL_INTERVAL_S)
+        response = session.get(f"{url}{_fill(spec['poll'], {'job_id': body['job_id']})}", timeout=timeout)
+    return response
+
+
+def run_phase(url, phase, requests_table, values, seconds, timeout=120.0, seed=0):
+    """
+    Keeps `concurrency` requests in flight for `seconds`. Returns
+    ({request name: [(latency_s, ok, status)]}, elapsed seconds).
+    """
+    import requests
+
+    names = list(phase["mix"])
+    weights = [phase["mix"][name] for name in names]
+    results = defaultdict(list)
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    def client(i):
+        rng = random.Random(seed * 10007 + i)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            spec = requests_table[name]
+            t0 = time.perf_counter()
+            try:
+                response = send(session, url, spec, values, timeout)
+                ok, status = response.status_code < 400 and not _has_error(response), str(response.status_code)
+            except requests.RequestException as e:
+                ok, status = False, type(e).__name__
+            with lock:
+                results[name].append((time.perf_counter() - t0, ok, status))
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(phase["concurrency"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(results), time.perf_counter() - started
+
+
+def run_scenario(scenario, url=None, workers=1, data_dir=None, size=1024, time_scale=1.0,
+                 timeout=120.0, seed=0, progress=print):
+    """Runs every phase of `scenario` and returns the report (see the module docstring)."""
+    table = {**REQUESTS, **scenario.get("requests", {})}
+    for phase in scenario["phases"]:
+        unknown = set(phase["mix"]) - set(table)
+        if unknown:
+            raise ValueError(f"Phase '{phase['name']}' uses unknown request(s): {', '.join(sorted(unknown))}")
+
+    data_dir = data_dir or os.path.join("data", "load_test")
+    with StandIns(data_dir, scenario.get("stand_ins"), size=size, seed=seed) as stand_ins:
+        values = {"stand_ins": stand_ins.base_url, "zones": write_zones(os.path.join(data_dir, "zones.geojson"))}
+        for kind, path in stand_ins.rasters.items():
+            drive_file = next(f for f in stand_ins.drive_files if f["title"].endswith(f"_{kind.upper()}.tif"))
+            values[kind] = stand_ins.vsi("gee", f"{kind}.tif")
+            values[f"drive_{kind}"] = stand_ins.vsi("drive", drive_file["id"])
+            values[f"{kind}_file"] = path
+        proc = None
+        if url is None:
+            proc, url = start_api(workers)
+        sampler = RssSampler(proc.pid).start() if proc is not None else None
+        try:
+            phases = []
+            for i, phase in enumerate(scenario["phases"]):
+                seconds = phase["duration_s"] * time_scale
+                progress(f"[LOAD] {phase['name']}: {phase['concurrency']} in flight for {seconds:.1f} s")
+                samples, elapsed = run_phase(url, phase, table, values, seconds, timeout, seed + i)
+                phases.append({
+                    "name": phase["name"],
+                    "concurrency": phase["concurrency"],
+                    "seconds": round(elapsed, 2),
+                    "total": summarize([s for batch in samples.values() for s in batch], elapsed),
+                    "requests": {name: summarize(batch, elapsed) for name, batch in sorted(samples.items())},
+                })
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+        return {
+            "url": url,
+            "workers": workers if proc is not None else None,
+            "phases": phases,
+            "worker_peak_rss_mb": sampler.peaks if sampler is not None else {},
+            "stand_ins": copy.deepcopy(stand_ins.stats),
+        }
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:.0f}"
+
+    print(f"\n{'phase / request':32} {'reqs':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for phase in report["phases"]:
+        rows = [(f"{phase['name']} (x{phase['concurrency']})", phase["total"])]
+        rows += [(f"  {name}", summary) for name, summary in phase["requests"].items()]
+        for label, s in rows:
+            print(
+                f"{label:32} {s['requests']:6d} {s['throughput_rps']:8.1f} {fmt(s['p50_ms']):>8} "
+                f"{fmt(s['p95_ms']):>8} {fmt(s['p99_ms']):>8} {s['error_rate']:7.1%}"
+            )
+    if report["worker_peak_rss_mb"]:
+        print("\nPeak RSS per API worker: " + ", ".join(
+            f"pid {pid}: {mb:.0f} MB" for pid, mb in report["worker_peak_rss_mb"].items()
+        ))
+    print("Stand-in requests: " + ", ".join(
+        f"{service} {s['requests']} ({s['failures']} failed)" for service, s in report["stand_ins"].items()
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAFE-RO API load test against local stand-ins.")
+    parser.add_argument("--scenario", default="steady", help=f"{', '.join(SCENARIOS)} or a JSON file")
+    parser.add_argument("--url", help="test a running API instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers to start (default: 1)")
+    parser.add_argument("--size", type=int, default=1024, help="edge length of the stand-in rasters")
+    parser.add_argument("--data-dir", help="where the stand-in rasters are generated (default: data/load_test)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplies every phase duration")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-error-rate", type=float, default=1.0, help="fail above this error rate")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_scenario(
+        load_scenario(args.scenario), url=args.url, workers=args.workers, data_dir=args.data_dir,
+        size=args.size, time_scale=args.time_scale, timeout=args.timeout, seed=args.seed,
+    )
+    report["scenario"] = args.scenario
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(p["total"]["error_rate"] > args.max_error_rate for p in report["phases"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
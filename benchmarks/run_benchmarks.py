@@ -0,0 +1,334 @@
+"""
+Benchmark suite for the core processing stages.
+
+Generates deterministic synthetic GeoTIFFs (see synthetic.py) and measures,
+for every stage / size / file layout:
+
+    wall_s               best wall time over --repeat runs
+    mpx_per_s            output megapixels per second at that time
+    peak_rss_mb          process peak RSS (interpreter + libraries included)
+    rss_growth_mb        peak RSS growth caused by the stage itself
+    tracemalloc_peak_mb  peak Python/numpy heap during one traced run
+                         (GDAL's own buffers are not visible to tracemalloc)
+
+Each case runs in a fresh interpreter so RSS peaks do not leak between
+cases, and a case that crashes or is OOM-killed is recorded as failed
+instead of aborting the run.
+
+Stages:
+    load             RasterBand.load() of a uint16 band
+    ndvi             NDVIProcessor.compute_ndvi() on a same-grid pair
+    ndvi_mismatched  compute_ndvi() with NIR at half resolution (resize path)
+    detect           Sentinel1FloodDetector.detect() with the default percentile
+    map              build_folium_map() + HTML render of an NDVI result
+    first_map        time-to-first-map: progressive NDVI preview + map render
+    transcode        one-off ingest of red + nir to COGs (safe_ro.core.ingest)
+
+Layouts: "tiled" and "striped" GeoTIFFs by default; "jp2" (red / nir as
+lossless JPEG2000, as Copernicus delivers them) and "cog" (what ingest
+transcodes them into) on request. Comparing the two shows what transcoding
+saves on every analysis against what it costs once:
+
+    python benchmarks/run_benchmarks.py --layouts jp2 cog --stages load ndvi first_map transcode
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # full matrix, 1k..10k
+    python benchmarks/run_benchmarks.py --quick              # 1k and 2k, one run each
+    python benchmarks/run_benchmarks.py --update-baseline    # store results as baseline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.25
+
+Exits with status 1 if any case failed or regressed beyond the threshold.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+import synthetic  # noqa: E402
+
+STAGES = ("load", "ndvi", "ndvi_mismatched", "ndvi_memoized", "detect", "map", "first_map", "transcode")
+# Stages that read files are run for every layout; the others once per size.
+FILE_STAGES = ("load", "ndvi", "ndvi_mismatched", "ndvi_memoized", "detect", "first_map", "transcode")
+DEFAULT_SIZES = (1024, 2048, 4096, 10240)
+QUICK_SIZES = (1024, 2048)
+DEFAULT_DATA_DIR = os.environ.get("SAFE_RO_BENCH_DIR", os.path.join("data", "benchmarks"))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+COMPARED_METRICS = ("wall_s", "tracemalloc_peak_mb", "peak_rss_mb")
+# Differences below these are measurement noise, whatever the ratio.
+NOISE_FLOOR = {"wall_s": 0.02, "tracemalloc_peak_mb": 1.0, "peak_rss_mb": 10.0}
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# -----------------------------------------------------------------------------
+# Stages (run inside the worker process)
+# -----------------------------------------------------------------------------
+def _prepare(case, data_dir):
+    """Returns a zero-argument callable running the stage, after any untimed setup."""
+    from safe_ro.core.safe_ro_core import NDVIProcessor, RasterBand, Sentinel1FloodDetector
+
+    stage, size = case["stage"], case["size"]
+    layout, compress = case.get("layout", "tiled"), case.get("compress", "deflate")
+    paths = synthetic.ensure_dataset(data_dir, size, layout, compress)
+
+    if stage == "load":
+        return lambda: RasterBand(paths["red"]).load()
+    # Processing stages measure the computation itself, not the memo (see core.memoize).
+    if stage == "ndvi":
+        return lambda: NDVIProcessor(paths["red"], paths["nir"], memo=None).compute_ndvi()
+    if stage == "ndvi_mismatched":
+        return lambda: NDVIProcessor(paths["red"], paths["nir_half"], memo=None).compute_ndvi()
+    if stage == "ndvi_memoized":
+        from safe_ro.core.memoize import DiskMemo
+
+        memo = DiskMemo(os.path.join(data_dir, "memo"))
+        NDVIProcessor(paths["red"], paths["nir"], memo=memo).compute_ndvi()
+        return lambda: NDVIProcessor(paths["red"], paths["nir"], memo=memo).compute_ndvi()
+    if stage == "detect":
+        return lambda: Sentinel1FloodDetector(paths["vv"], memo=None).detect()
+    if stage in ("map", "first_map"):
+        from safe_ro.interfaces.map_render import build_folium_map
+
+    if stage == "map":
+        ndvi, bounds = NDVIProcessor(paths["red"], paths["nir"], memo=None).compute_ndvi()
+        return lambda: build_folium_map(ndvi, bounds).get_root().render()
+    if stage == "first_map":
+        from safe_ro.core.progressive import preview_factor
+
+        def first_map():
+            proc = NDVIProcessor(paths["red"], paths["nir"], memo=None)
+            factor = preview_factor(proc.red_band.probe())
+            ndvi, bounds = proc.compute_ndvi(downsample_factor=factor)
+            return build_folium_map(ndvi, bounds).get_root().render()
+
+        return first_map
+    if stage == "transcode":
+        from safe_ro.core.ingest import transcode_bands
+
+        out_dir = os.path.join(data_dir, "transcoded")
+
+        def transcode():
+            outputs = transcode_bands([paths["red"], paths["nir"]], out_dir=out_dir)
+            # Failed bands come back as their source path.
+            return (outputs if all(p.startswith(out_dir) for p in outputs) else None), None
+
+        return transcode
+    raise ValueError(f"Unknown stage '{stage}'. Choose from {list(STAGES)}.")
+
+
+def _check(result, stage):
+    # Processors report errors by printing and returning None.
+    if stage not in ("map", "first_map") and (result is None or result[0] is None):
+        raise RuntimeError(f"Stage '{stage}' returned no data.")
+
+
+def run_case(case, data_dir, repeat):
+    """Measures one case in the current process and returns its metrics."""
+    run = _prepare(case, data_dir)
+    rss_before = _max_rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+        _check(result, case["stage"])
+        del result
+    peak_rss = _max_rss_mb()
+
+    tracemalloc.start()
+    run()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall = min(times)
+    mpx = case["size"] ** 2 / 1e6
+    return {
+        "wall_s": round(wall, 4),
+        "runs_s": [round(t, 4) for t in times],
+        "mpx": round(mpx, 3),
+        "mpx_per_s": round(mpx / wall, 2) if wall > 0 else None,
+        "peak_rss_mb": round(peak_rss, 1),
+        "rss_growth_mb": round(max(peak_rss - rss_before, 0.0), 1),
+        "tracemalloc_peak_mb": round(traced_peak / 1e6, 1),
+    }
+
+
+# -----------------------------------------------------------------------------
+# Driver
+# -----------------------------------------------------------------------------
+def case_id(case):
+    if case["stage"] in FILE_STAGES:
+        return f"{case['stage']}/{case['size']}/{case['layout']}-{case['compress']}"
+    return f"{case['stage']}/{case['size']}"
+
+
+def build_cases(stages, sizes, layouts, compressions):
+    cases = []
+    for size in sizes:
+        for stage in stages:
+            if stage in FILE_STAGES:
+                for layout in layouts:
+                    for compress in compressions:
+                        cases.append(
+                            {"stage": stage, "size": size, "layout": layout, "compress": compress}
+                        )
+            else:
+                cases.append({"stage": stage, "size": size})
+    return cases
+
+
+def _run_isolated(case, data_dir, repeat, timeout):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", json.dumps(case),
+        "--data-dir", data_dir, "--repeat", str(repeat),
+    ]
+    try:
+        proc = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout} s"}
+    if proc.returncode != 0:
+        tail = (proc.stderr.strip().splitlines() or [""])[-1]
+        return {"error": f"exit code {proc.returncode}: {tail}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _environment():
+    import numpy as np
+    import rasterio
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares result cases to baseline cases with the same id. A metric
+    regresses when it grows by more than `threshold` (0.25 = 25 %) and by more
+    than its noise floor. Returns a list of regression dicts.
+    """
+    previous = {case["id"]: case for case in baseline.get("cases", []) if "error" not in case}
+    regressions = []
+    for case in results.get("cases", []):
+        before = previous.get(case["id"])
+        if before is None or "error" in case:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > NOISE_FLOOR[metric]:
+                regressions.append(
+                    {"id": case["id"], "metric": metric, "baseline": old, "current": new,
+                     "change": round(new / old - 1, 3)}
+                )
+    return regressions
+
+
+def _print_table(cases):
+    print(f"{'case':40} {'time (s)':>9} {'Mpx/s':>8} {'RSS (MB)':>9} {'+RSS':>7} {'heap (MB)':>10}")
+    for case in cases:
+        if "error" in case:
+            print(f"{case['id']:40} FAILED: {case['error']}")
+            continue
+        print(
+            f"{case['id']:40} {case['wall_s']:9.3f} {case['mpx_per_s'] or 0:8.1f} "
+            f"{case['peak_rss_mb']:9.1f} {case['rss_growth_mb']:7.1f} {case['tracemalloc_peak_mb']:10.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SAFE-RO core performance benchmarks.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=None)
+    parser.add_argument(
+        "--layouts", nargs="+", choices=synthetic.LAYOUTS + synthetic.INGEST_LAYOUTS,
+        default=list(synthetic.LAYOUTS),
+    )
+    parser.add_argument(
+        "--compress", nargs="+", choices=synthetic.COMPRESSIONS, default=list(synthetic.COMPRESSIONS)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="1k and 2k rasters, one run each")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", default=None, help="results JSON (default: <data-dir>/results.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_case(json.loads(args.worker), args.data_dir, args.repeat)))
+        return 0
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    repeat = 1 if args.quick else args.repeat
+    cases = build_cases(args.stages, sizes, args.layouts, args.compress)
+
+    # Generate the inputs up front so no case pays for it.
+    for size in sizes:
+        for layout in args.layouts:
+            for compress in args.compress:
+                synthetic.ensure_dataset(args.data_dir, size, layout, compress)
+
+    measured = []
+    for case in cases:
+        print(f"running {case_id(case)} ...", file=sys.stderr)
+        metrics = _run_isolated(case, args.data_dir, repeat, args.timeout)
+        measured.append({"id": case_id(case), **case, **metrics})
+
+    results = {"environment": _environment(), "repeat": repeat, "cases": measured}
+    output = args.output or os.path.join(args.data_dir, "results.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    _print_table(measured)
+    print(f"\nResults written to {output}")
+
+    failed = [case["id"] for case in measured if "error" in case]
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 1 if failed else 0
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(
+                f"REGRESSION {r['id']} {r['metric']}: {r['baseline']} -> {r['current']} "
+                f"(+{r['change'] * 100:.0f} %)"
+            )
+        if not regressions:
+            print(f"No regressions beyond {args.threshold * 100:.0f} % against {args.baseline}.")
+    else:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Local stand-ins for the external services SAFE-RO depends on, for load tests
+(see load_test.py) and offline development. All of them are served from one
+HTTP server:
+
+    gee    /gee/<kind>.tif                  canned GeoTIFFs (red, nir, vv), as
+                                            Earth Engine download URLs serve them;
+                                            Range requests are supported, so GDAL
+                                            can read them through /vsicurl/
+    cdse   /odata/v1/Products               OData product search, paged with
+                                            $top / $skip and @odata.nextLink
+    drive  /drive/v2/files                  listing of the cloud sync folder;
+           /drive/v2/files/<id>?alt=media   a file's content
+    firms  /api/area/csv/<key>/<source>/<west,south,east,north>/<days>
+                                            active fire detections as CSV
+
+Each service gets its own latency (mean and jitter) and failure rate
+(answered with 503), drawn from a seeded generator so a scenario replays
+the same way:
+
+    with StandIns("data/stand_ins", {"cdse": Profile(latency_ms=300, failure_rate=0.05)}) as s:
+        s.url("gee", "red.tif")   # -> http://127.0.0.1:<port>/gee/red.tif
+        s.vsi("gee", "red.tif")   # -> /vsicurl/http://... for an API request
+
+Run on its own to point a client at it by hand:
+
+    python benchmarks/stand_ins.py --port 8765 --latency-ms 50 --failure-rate 0.02
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+import synthetic  # noqa: E402
+from safe_ro.core.regions import REGIONS  # noqa: E402
+
+SERVICES = ("gee", "cdse", "drive", "firms")
+RASTERS = ("red", "nir", "vv")
+
+
+class Profile(NamedTuple):
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0  # standard deviation around latency_ms
+    failure_rate: float = 0.0
+
+
+def _catalogue(scenes, seed):
+    """
+    Canned CDSE OData entries, `scenes` S2 and S1 products per region (oldest
+    first), and the Drive folder the cloud sync would have filled from them.
+    """
+    rng = random.Random(seed)
+    products, files = [], []
+    for r, (region, (w, s, e, n)) in enumerate(REGIONS.items()):
+        for i in range(scenes):
+            day = 1 + (i * 7 + r) % 28
+            stamp = f"2024{6 + i // 4:02d}{day:02d}T09{r:02d}{i % 60:02d}"
+            for collection, name, bands in (
+                ("SENTINEL-2", f"S2A_MSIL2A_{stamp}_N0510_R093_T35{r:02d}{i:02d}_{stamp}", ("red", "nir")),
+                ("SENTINEL-1", f"S1A_IW_GRDH_1SDV_{stamp}_{stamp}_0{r:02d}{i:02d}", ("vv",)),
+            ):
+                products.append({
+                    "Id": hashlib.md5(name.encode()).hexdigest(), "Name": f"{name}.SAFE",
+                    "Collection": collection, "ContentLength": 800_000_000,
+                    "ContentDate": {"Start": f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}T"
+                                             f"{stamp[9:11]}:{stamp[11:13]}:{stamp[13:15]}.000Z"},
+                    "GeoFootprint": {"type": "Polygon", "coordinates": [[
+                        [w - 0.3, s - 0.3], [e + 0.3, s - 0.3], [e + 0.3, n + 0.3], [w - 0.3, n + 0.3],
+                        [w - 0.3, s - 0.3],
+                    ]]},
+                    "Attributes": [{"Name": "cloudCover", "Value": round(rng.uniform(0, 60), 1)}],
+                })
+                for band in bands:
+                    title = f"{region}_{name}_{band.upper()}.tif"
+                    digest = hashlib.md5(title.encode()).hexdigest()
+                    files.append({"id": digest[:16], "title": title, "raster": band,
+                                  "md5Checksum": digest, "mimeType": "image/tiff"})
+    products.sort(key=lambda p: p["ContentDate"]["Start"])
+    files.sort(key=lambda f: f["title"], reverse=True)
+    return products, files
+
+
+class StandIns:
+    def __init__(self, data_dir, profiles=None, size=512, scenes=4, seed=0, host="127.0.0.1", port=0):
+        self.profiles = {service: Profile() for service in SERVICES}
+        for service, profile in (profiles or {}).items():
+            self.profiles[service] = profile if isinstance(profile, Profile) else Profile(**profile)
+        self.rasters = {
+            kind: path for kind, path in synthetic.ensure_dataset(data_dir, size, "tiled", "deflate", seed).items()
+            if kind in RASTERS
+        }
+        self.products, self.drive_files = _catalogue(scenes, seed)
+        self._drive_rasters = {}
+        for f in self.drive_files:
+            self._drive_rasters[f["id"]] = self.rasters[f.pop("raster")]
+            f["fileSize"] = str(os.path.getsize(self._drive_rasters[f["id"]]))
+        self.stats = {service: {"requests": 0, "failures": 0} for service in SERVICES}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, service, path=""):
+        prefix = {"gee": "/gee", "cdse": "/odata/v1/Products", "drive": "/drive/v2/files",
+                  "firms": "/api/area/csv"}[service]
+        return f"{self.base_url}{prefix}{'/' if path else ''}{path}"
+
+    def vsi(self, service, path):
+        """The GDAL /vsicurl/ path of a stand-in file, readable by rasterio."""
+        return f"/vsicurl/{self.url(service, path)}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _delay_or_fail(self, service):
+        """Sleeps for the service's latency; True if this request should fail."""
+        profile = self.profiles[service]
+        with self._lock:
+            self.stats[service]["requests"] += 1
+            delay = max(0.0, self._random.gauss(profile.latency_ms, profile.jitter_ms)) / 1000
+            failed = self._random.random() < profile.failure_rate
+            if failed:
+                self.stats[service]["failures"] += 1
+        time.sleep(delay)
+        return failed
+
+    # Responses
+    # -------------------------------------------------------------------------
+    def _odata(self, params):
+        query = params.get("$filter", [""])[0]
+        collection = re.search(r"Collection/Name eq '([^']+)'", query)
+        since = re.search(r"ContentDate/Start (ge|gt) (\S+?)\)?(?: |$)", query)
+        found = [
+            p for p in self.products
+            if (collection is None or p["Collection"] == collection.group(1))
+            and (since is None or (p["ContentDate"]["Start"] > since.group(2) if since.group(1) == "gt"
+                                   else p["ContentDate"]["Start"] >= since.group(2)))
+        ]
+        if "desc" in params.get("$orderby", [""])[0]:
+            found.reverse()
+        top, skip = int(params.get("$top", ["20"])[0]), int(params.get("$skip", ["0"])[0])
+        page = {"value": found[skip:skip + top]}
+        if skip + top < len(found):
+            args = {key: values[0] for key, values in params.items()}
+            page["@odata.nextLink"] = f"{self.url('cdse')}?{urlencode({**args, '$skip': skip + top})}"
+        return page
+
+    def _firms_csv(self, bbox, days):
+        west, south, east, north = (float(v) for v in bbox.split(","))
+        rng = random.Random(f"{bbox}/{days}")
+        rows = ["latitude,longitude,bright_ti4,confidence,acq_date"]
+        for _ in range(rng.randint(0, 25) * max(1, int(days))):
+            rows.append(
+                f"{rng.uniform(south, north):.5f},{rng.uniform(west, east):.5f},"
+                f"{rng.uniform(300, 400):.1f},{rng.choice('lnh')},2024-07-{rng.randint(1, 28):02d}"
+            )
+        return "\n".join(rows) + "\n"
+
+    def _handler(self):
+        stand_ins = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, as GDAL and requests expect
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._respond(head=True)
+
+            def do_GET(self):
+                self._respond()
+
+            def _send(self, status, body, content_type, headers=None, head=False):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def _file(self, path, head):
+                size = os.path.getsize(path)
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if not match:
+                    with open(path, "rb") as f:
+                        body = f.read()
+                    return self._send(200, body, "image/tiff", {"Accept-Ranges": "bytes"}, head)
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    body = f.read(end - start + 1)
+                self._send(206, body, "image/tiff", {
+                    "Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}",
+                }, head)
+
+            def _respond(self, head=False):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                parts = url.path.strip("/").split("/")
+                service = {"gee": "gee", "odata": "cdse", "drive": "drive", "api": "firms"}.get(parts[0])
+                if service is None:
+                    return self._send(404, b"{}", "application/json", head=head)
+                if stand_ins._delay_or_fail(service):
+                    return self._send(503, b'{"error": "stand-in failure"}', "application/json", head=head)
+
+                if service == "gee" and len(parts) == 2 and parts[1][:-4] in stand_ins.rasters:
+                    return self._file(stand_ins.rasters[parts[1][:-4]], head)
+                if service == "cdse":
+                    body = json.dumps(stand_ins._odata(params)).encode()
+                    return self._send(200, body, "application/json", head=head)
+                if service == "drive" and len(parts) == 3:
+                    return self._send(200, json.dumps({"items": stand_ins.drive_files}).encode(),
+                                      "application/json", head=head)
+                if service == "drive" and len(parts) == 4 and parts[3] in stand_ins._drive_rasters:
+                    return self._file(stand_ins._drive_rasters[parts[3]], head)
+                if service == "firms" and len(parts) == 7:
+                    body = stand_ins._firms_csv(parts[5], parts[6]).encode()
+                    return self._send(200, body, "text/csv", head=head)
+                return self._send(404, b"{}", "application/json", head=head)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for GEE, CDSE, Drive and FIRMS.")
+    parser.add_argument("--data-dir", default=os.path.join("data", "stand_ins"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--size", type=int, default=1024, help="edge length of the canned rasters")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    profile = Profile(args.latency_ms, args.jitter_ms, args.failure_rate)
+    stand_ins = StandIns(args.data_dir, {s: profile for s in SERVICES}, size=args.size, port=args.port)
+    print(f"Stand-ins at {stand_ins.base_url}:")
+    for kind in RASTERS:
+        print(f"  {stand_ins.vsi('gee', f'{kind}.tif')}")
+    for service in ("cdse", "drive", "firms"):
+        print(f"  {stand_ins.url(service)}")
+    stand_ins.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stand_ins.stop()
+
+
+if __name__ == "__main__":
+    main()
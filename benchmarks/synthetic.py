@@ -0,0 +1,136 @@
+"""
+Deterministic synthetic Sentinel-like GeoTIFFs for the benchmark suite.
+
+Every raster is a smooth random field (one value per CELL x CELL pixels, so
+compression behaves as on real scenes) plus per-pixel noise. Rows are
+generated block by block from generators seeded by (seed, kind, size, block),
+so the same arguments always produce byte-identical files and a 10k x 10k
+raster never has to be held in memory at once.
+
+    red / nir   uint16 reflectance x 10000, like Sentinel-2 L2A B04 / B08
+    vv          float32 linear backscatter with dark (water) patches and
+                gamma-distributed speckle, like Sentinel-1 GRD
+
+Besides plain tiled / striped GeoTIFFs, red and nir can be written as
+lossless JPEG2000 (the "jp2" layout, as delivered by Copernicus) or as the
+COG ingest transcodes that into (the "cog" layout).
+"""
+
+import os
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+
+# Roughly the Fagaras region used in the app.
+BOUNDS = (24.5, 45.5, 25.5, 46.0)
+CELL = 64
+BLOCK_ROWS = 512
+LAYOUTS = ("tiled", "striped")
+# Sentinel-2 delivery format, and the COG ingest turns it into
+# (safe_ro.core.ingest). Only the uint16 bands are JPEG2000; vv stays GeoTIFF.
+INGEST_LAYOUTS = ("jp2", "cog")
+COMPRESSIONS = ("deflate", "none")
+
+_KINDS = {"red": 1, "nir": 2, "vv": 3}
+
+
+def _rng(seed, kind, size, block):
+    return np.random.default_rng([seed, _KINDS[kind], size, block])
+
+
+def _coarse_field(seed, size):
+    """Smooth field in 0..1 shared by all bands of one size (land cover)."""
+    cells = -(-size // CELL)
+    return np.random.default_rng([seed, 0, size]).random((cells, cells))
+
+
+def _block(kind, field, seed, size, r0, rows):
+    cells_rows = field[r0 // CELL : -(-(r0 + rows) // CELL)]
+    upsampled = np.repeat(np.repeat(cells_rows, CELL, axis=0), CELL, axis=1)
+    offset = r0 % CELL
+    cover = upsampled[offset : offset + rows, :size]
+    rng = _rng(seed, kind, size, r0 // BLOCK_ROWS)
+    noise = rng.normal(0.0, 0.02, cover.shape)
+
+    if kind == "red":
+        # Vegetation (high cover) is dark in red.
+        return np.clip((0.25 - 0.2 * cover + noise) * 10000, 1, 10000).astype(np.uint16)
+    if kind == "nir":
+        return np.clip((0.15 + 0.4 * cover + noise) * 10000, 1, 10000).astype(np.uint16)
+    water = cover < 0.2
+    backscatter = np.where(water, 0.005, 0.05 + 0.1 * cover)
+    return (backscatter * rng.gamma(4.4, 1 / 4.4, cover.shape)).astype(np.float32)
+
+
+def write_raster(path, kind, size, layout="tiled", compress="deflate", seed=0):
+    """Writes one synthetic size x size raster of `kind` to `path`."""
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "float32" if kind == "vv" else "uint16",
+        "crs": CRS.from_epsg(4326),
+        "transform": from_bounds(*BOUNDS, size, size),
+    }
+    converted = layout in INGEST_LAYOUTS and kind != "vv"
+    if layout in ("tiled",) + INGEST_LAYOUTS:
+        profile.update(tiled=True, blockxsize=512, blockysize=512)
+    else:
+        profile.update(tiled=False, blockysize=min(16, size))
+    if compress != "none" and not converted:
+        profile["compress"] = compress
+
+    field = _coarse_field(seed, size)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with rasterio.open(tmp_path, "w", **profile) as dst:
+        for r0 in range(0, size, BLOCK_ROWS):
+            rows = min(BLOCK_ROWS, size - r0)
+            data = _block(kind, field, seed, size, r0, rows)
+            dst.write(data, 1, window=rasterio.windows.Window(0, r0, size, rows))
+    if converted:
+        _convert(tmp_path, path, layout, compress)
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return path
+
+
+def _convert(staged, path, layout, compress):
+    if layout == "jp2":
+        # Copernicus delivers lossless, 1024-pixel-tiled JPEG2000.
+        rasterio.shutil.copy(
+            staged, path, driver="JP2OpenJPEG", reversible="YES", quality="100",
+            blockxsize=1024, blockysize=1024,
+        )
+    else:
+        from safe_ro.core.ingest import transcode_band
+
+        transcode_band(staged, path, compress=compress, verify=False)
+
+
+def dataset_path(data_dir, kind, size, layout, compress):
+    ext = "jp2" if layout == "jp2" and kind != "vv" else "tif"
+    return os.path.join(data_dir, f"{kind}_{size}_{layout}_{compress}.{ext}")
+
+
+def ensure_dataset(data_dir, size, layout, compress, seed=0):
+    """
+    Returns {"red", "nir", "vv", "nir_half"} paths for one size/variant,
+    generating missing files. "nir_half" is a NIR band at half resolution,
+    for the mismatched-shape path of NDVIProcessor.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for kind in ("red", "nir", "vv"):
+        paths[kind] = dataset_path(data_dir, kind, size, layout, compress)
+        if not os.path.exists(paths[kind]):
+            write_raster(paths[kind], kind, size, layout, compress, seed)
+    half = max(1, size // 2)
+    paths["nir_half"] = dataset_path(data_dir, "nir", half, layout, compress)
+    if not os.path.exists(paths["nir_half"]):
+        write_raster(paths["nir_half"], "nir", half, layout, compress, seed)
+    return paths
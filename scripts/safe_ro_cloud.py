@@ -8,6 +8,9 @@ from pydrive2.drive import GoogleDrive
 
 # Add src directory to path to allow for sibling imports
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from safe_ro.clients.cdse_client import S1_FILTER, S2_FILTER, CDSESearch  # noqa: E402
 
 # --- DEFINING REGIONS ---
 REGIONS = {
@@ -16,6 +19,10 @@ REGIONS = {
     "Timisoara": [21.1, 45.6, 21.4, 45.9],
 }
 
+# Sentinel-2 products fetched per region; more than one allows a cloud-free
+# median composite (python -m safe_ro composite).
+S2_SCENES = int(os.environ.get("SAFE_RO_S2_SCENES", "1"))
+
 
 # ==========================================
 # 1. GOOGLE DRIVE MANAGER
@@ -98,10 +105,11 @@ class HybridDownloader:
     AUTH_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
     SEARCH_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
 
-    def __init__(self, username, password):
+    def __init__(self, username, password, search=None):
         self.username = username
         self.password = password
         self.token = None
+        self.search = search or CDSESearch()
 
     def authenticate(self):
         r = requests.post(
@@ -183,6 +191,13 @@ class HybridDownloader:
                                 "RED.jp2" if "_B04_" in info.filename else "NIR.jp2"
                             )
                             target = os.path.join(temp_dir, f"{prod_name}_{suffix}")
+                        elif (
+                            "_SCL_" in info.filename
+                            and info.filename.endswith(".jp2")
+                            and "R60m" not in info.filename
+                        ):
+                            # Scene classification, for cloud masking in composites.
+                            target = os.path.join(temp_dir, f"{prod_name}_SCL.jp2")
                     elif mode == "S1":
                         if (
                             "measurement" in info.filename
@@ -197,47 +212,49 @@ class HybridDownloader:
                         files.append(target)
         except Exception as e:
             print(f"Extract Error: {e}")
+
+        # 3. Transcode the JPEG2000 bands once into COGs, which are what gets
+        # uploaded and analysed (see safe_ro.core.ingest).
+        if mode == "S2" and files:
+            from safe_ro.core.ingest import transcode_bands
+
+            print(f"[INGEST] 🔄 Transcoding {len(files)} band(s) to COG...")
+            files = transcode_bands(files, remove_source=True)
         return files
 
-    def process_region(self, region_name, bbox, temp_dir):
+    def search_regions(self, regions, s2_scenes=S2_SCENES):
+        """
+        {region: (mode, products)}: the `s2_scenes` most recent Sentinel-2
+        products under 20% cloud for each region (several of them feed a
+        local median composite, see safe_ro.core.composite), or the latest
+        Sentinel-1 GRD where there are none. Each collection is searched once
+        for all regions, through the local cache (see
+        safe_ro.clients.cdse_client), rather than once per region.
+        """
         if not self.token:
             self.authenticate()
-        polygon = f"SRID=4326;POLYGON(({bbox[0]} {bbox[1]}, {bbox[2]} {bbox[1]}, {bbox[2]} {bbox[3]}, {bbox[0]} {bbox[3]}, {bbox[0]} {bbox[1]}))"
+        self.search.token = self.token
+        s2 = self.search.search(S2_FILTER, regions, top=s2_scenes)
+        plan = {name: ("S2", products) for name, products in s2.items() if products}
 
-        # Try S2 (Clear)
-        print(f"\n--- Processing Region: {region_name} ---")
-        filter_s2 = f"Collection/Name eq 'SENTINEL-2' and OData.CSC.Intersects(area=geography'{polygon}') and ContentDate/Start ge 2024-01-01T00:00:00.000Z and Attributes/OData.CSC.DoubleAttribute/any(att:att/Name eq 'cloudCover' and att/Value lt 20.00)"
-        r = requests.get(
-            self.SEARCH_URL,
-            params={
-                "$filter": filter_s2,
-                "$orderby": "ContentDate/Start desc",
-                "$top": 1,
-            },
-            headers={"Authorization": f"Bearer {self.token}"},
-        )
-        s2_res = r.json().get("value", [])
-
-        if s2_res:
-            return self._download_and_extract(s2_res[0], temp_dir, "S2")
-
-        # Try S1 (Radar)
-        print(f"[CDSE] {region_name} is cloudy. Switching to Radar.")
-        filter_s1 = f"Collection/Name eq 'SENTINEL-1' and OData.CSC.Intersects(area=geography'{polygon}') and ContentDate/Start ge 2024-01-01T00:00:00.000Z and Attributes/OData.CSC.StringAttribute/any(att:att/Name eq 'productType' and att/Value eq 'GRD') and Attributes/OData.CSC.StringAttribute/any(att:att/Name eq 'sensorMode' and att/Value eq 'IW')"
-        r = requests.get(
-            self.SEARCH_URL,
-            params={
-                "$filter": filter_s1,
-                "$orderby": "ContentDate/Start desc",
-                "$top": 1,
-            },
-            headers={"Authorization": f"Bearer {self.token}"},
-        )
-        s1_res = r.json().get("value", [])
+        cloudy = {name: bbox for name, bbox in regions.items() if name not in plan}
+        if cloudy:
+            print(f"[CDSE] {', '.join(cloudy)}: no clear optical scene. Switching to Radar.")
+            s1 = self.search.search(S1_FILTER, cloudy, top=1)
+            plan.update((name, ("S1", products)) for name, products in s1.items())
+        return plan
 
-        if s1_res:
-            return self._download_and_extract(s1_res[0], temp_dir, "S1")
-        return []
+    def download_products(self, products, temp_dir, mode):
+        files = []
+        for product in products:
+            files.extend(self._download_and_extract(product, temp_dir, mode))
+        return files
+
+    def process_region(self, region_name, bbox, temp_dir, s2_scenes=S2_SCENES):
+        """Searches and downloads a single region; see search_regions."""
+        print(f"\n--- Processing Region: {region_name} ---")
+        mode, products = self.search_regions({region_name: bbox}, s2_scenes)[region_name]
+        return self.download_products(products, temp_dir, mode)
 
 
 if __name__ == "__main__":
@@ -255,8 +272,14 @@ if __name__ == "__main__":
         drive = DriveManager("SAFE_RO_Cloud_Data")
         if drive.folder_id:
             dl = HybridDownloader(COP_USER, COP_PASS)
-            for region_name, bbox in REGIONS.items():
-                files = dl.process_region(region_name, bbox, DOWNLOAD_LOCATION)
+            plan = dl.search_regions(REGIONS)
+
+            from safe_ro.core.catalog import Catalog
+
+            Catalog().index_cdse(p for _, products in plan.values() for p in products)
+            for region_name, (mode, products) in plan.items():
+                print(f"\n--- Processing Region: {region_name} ---")
+                files = dl.download_products(products, DOWNLOAD_LOCATION, mode)
                 for f in files:
                     drive.upload_file(f, region_name)
             print("\n🎉 All Regions Updated Successfully!")
@@ -0,0 +1,175 @@
+"""
+Command-line entry point:
+
+    python -m safe_ro batch data/archive --out data/batch --workers 16
+    python -m safe_ro batch S2A_MSIL2A_*.zip --products ndvi --parquet
+    python -m safe_ro batch data/archive --bbox 27.5 47.0 27.8 47.3 --start 2024-05-01 --max-cloud 20
+    python -m safe_ro composite data/archive/Iasi --out data/composites/Iasi_NDVI.tif
+    python -m safe_ro catalog index data/archive
+    python -m safe_ro catalog query --bbox 27.5 47.0 27.8 47.3 --bands red nir --max-cloud 20 --latest
+"""
+
+import argparse
+import json
+import os
+import sys
+
+
+def _batch(args):
+    from safe_ro.core.batch import run_batch
+
+    options = {
+        "threshold": args.threshold,
+        "percentile": args.percentile,
+        "speckle_filter": args.speckle_filter,
+    }
+    scenes = None
+    if args.bbox or args.start or args.end or args.max_cloud is not None:
+        from safe_ro.core.catalog import Catalog
+
+        catalog = Catalog(args.catalog)
+        catalog.index_local(args.inputs)
+        scenes = catalog.batch_scenes(
+            args.products, bbox=args.bbox, start=args.start, end=args.end, max_cloud=args.max_cloud,
+        )
+        print(f"[BATCH] {len(scenes)} scene product(s) match the catalog query")
+    try:
+        summary = run_batch(
+            args.inputs, args.out, products=args.products, workers=args.workers,
+            force=args.force, options=options, parquet=args.parquet, scenes=scenes,
+        )
+    except ImportError as e:
+        print(f"[BATCH] {e}")
+        return 2
+    if args.json:
+        print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+def _composite(args):
+    from safe_ro.core.composite import discover_composite_scenes, median_composite
+
+    scenes = discover_composite_scenes(args.inputs)
+    if not scenes:
+        print("[COMPOSITE] No scenes with RED and NIR bands found.")
+        return 1
+    print(f"[COMPOSITE] Compositing {len(scenes)} scene(s) into {args.out}")
+    summary = median_composite(scenes, args.out, window_size=args.window, workers=args.workers)
+    if summary is None:
+        return 1
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(
+            f"[COMPOSITE] {summary['width']}x{summary['height']} px, "
+            f"{summary['clear_fraction']:.1%} with a clear observation, "
+            f"{summary['mean_observations']:.1f} per pixel on average ({summary['seconds']} s)"
+        )
+    return 0
+
+
+def _catalog(args):
+    from safe_ro.core.catalog import Catalog
+
+    catalog = Catalog(args.catalog)
+    if args.action == "index":
+        stats = catalog.index_local(args.inputs)
+        print(json.dumps(stats) if args.json else (
+            f"[CATALOG] {stats['indexed']} band(s) indexed, {stats['unchanged']} unchanged, "
+            f"{stats['removed']} removed, {stats['failed']} failed"
+        ))
+        return 1 if stats["failed"] else 0
+
+    scenes = catalog.find(
+        bbox=args.bbox, bands=args.bands, sensor=args.sensor, start=args.start, end=args.end,
+        max_cloud=args.max_cloud, limit=1 if args.latest else args.limit,
+    )
+    if args.json:
+        print(json.dumps(scenes))
+    for scene in [] if args.json else scenes:
+        cloud = "?" if scene["cloud_cover"] is None else f"{scene['cloud_cover']:.0f}%"
+        print(f"{scene['acquired'] or '-':20}  {cloud:>4}  {scene['name']}")
+        for band, info in scene["bands"].items():
+            print(f"    {band:4} {info['location']}")
+    return 0 if scenes else 1
+
+
+def _add_query_arguments(parser):
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                        help="only scenes covering this WGS84 box")
+    parser.add_argument("--start", help="only scenes acquired on or after this ISO date")
+    parser.add_argument("--end", help="only scenes acquired on or before this ISO date")
+    parser.add_argument("--max-cloud", type=float, help="only scenes with at most this cloud percentage")
+
+
+def main(argv=None):
+    from safe_ro.core.batch import DEFAULT_BATCH_DIR, PRODUCTS
+    from safe_ro.core.catalog import DEFAULT_CATALOG_PATH
+    from safe_ro.core.composite import DEFAULT_COMPOSITE_DIR, WINDOW_SIZE
+
+    parser = argparse.ArgumentParser(prog="safe_ro", description="SAFE-RO command-line tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser(
+        "batch",
+        help="compute NDVI / flood products for every scene in directories or zips",
+        description="Discovers *_RED.jp2 + *_NIR.jp2 pairs and *_VV.tiff scenes (loose or in "
+        "product zips), processes them in a process pool and writes COGs plus a stats "
+        "manifest. Outputs newer than their inputs are skipped.",
+    )
+    batch.add_argument("inputs", nargs="+", help="directories, zips or band files")
+    batch.add_argument("--out", default=DEFAULT_BATCH_DIR, help="output directory (default: %(default)s)")
+    batch.add_argument("--products", nargs="+", choices=PRODUCTS, default=list(PRODUCTS))
+    batch.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    batch.add_argument("--force", action="store_true", help="reprocess scenes that are up to date")
+    batch.add_argument("--threshold", type=float, help="fixed flood threshold (default: percentile)")
+    batch.add_argument("--percentile", type=float, default=20.0)
+    batch.add_argument("--speckle-filter", choices=("median", "median_exact", "lee", "refined_lee"))
+    batch.add_argument("--parquet", action="store_true", help="also write manifest.parquet (needs pyarrow)")
+    batch.add_argument("--json", action="store_true", help="print the run summary as JSON")
+    _add_query_arguments(batch)
+    batch.add_argument("--catalog", default=DEFAULT_CATALOG_PATH,
+                       help="scene catalog used by the query options (default: %(default)s)")
+    batch.set_defaults(handler=_batch)
+
+    composite = commands.add_parser(
+        "composite",
+        help="build a cloud-free median NDVI composite from several Sentinel-2 scenes",
+        description="Aligns every *_RED.jp2 + *_NIR.jp2 scene found (loose or in product zips) "
+        "on the first scene's grid, masks clouds with the *_SCL.jp2 scene classification "
+        "where available and writes the per-pixel median NDVI as a COG.",
+    )
+    composite.add_argument("inputs", nargs="+", help="directories, zips or band files of one region")
+    composite.add_argument(
+        "--out", default=os.path.join(DEFAULT_COMPOSITE_DIR, "composite_NDVI.tif"),
+        help="output COG (default: %(default)s)",
+    )
+    composite.add_argument("--window", type=int, default=WINDOW_SIZE, help="window size in pixels")
+    composite.add_argument("--workers", type=int, help="worker threads (default: one per CPU)")
+    composite.add_argument("--json", action="store_true", help="print the summary as JSON")
+    composite.set_defaults(handler=_composite)
+
+    catalog = commands.add_parser(
+        "catalog",
+        help="index scenes into the scene catalog or query it",
+        description="'index' records every band found in directories or zips (sensor, time, "
+        "footprint, CRS, resolution, checksum); unchanged files are skipped and vanished ones "
+        "dropped. 'query' lists the newest scenes having all --bands.",
+    )
+    catalog.add_argument("action", choices=("index", "query"))
+    catalog.add_argument("inputs", nargs="*", help="directories, zips or band files to index")
+    catalog.add_argument("--catalog", default=DEFAULT_CATALOG_PATH, help="catalog file (default: %(default)s)")
+    catalog.add_argument("--bands", nargs="+", default=["red", "nir"])
+    catalog.add_argument("--sensor", choices=("S1", "S2"))
+    _add_query_arguments(catalog)
+    catalog.add_argument("--limit", type=int, default=20)
+    catalog.add_argument("--latest", action="store_true", help="only the newest matching scene")
+    catalog.add_argument("--json", action="store_true", help="print the result as JSON")
+    catalog.set_defaults(handler=_catalog)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Batched, cached search of the Copernicus Data Space (CDSE) OData catalogue.
+
+    search = CDSESearch()
+    by_region = search.search(S2_FILTER, REGIONS, top=3)  # {region: [product, ...] newest first}
+
+Instead of one request per region, the footprints of up to
+REGIONS_PER_QUERY regions are OR-ed into a single filter, the result is
+paged through, and each product is handed to the regions its footprint
+intersects. Responses are cached in SAFE_RO_CDSE_CACHE (default
+data/cdse_cache), one JSON file per filter and start of the time window.
+Cached results younger than `max_age` are returned as they are; older ones
+are refreshed incrementally, asking only for products newer than the last
+ContentDate/Start seen. If a refresh fails, the cached products are used.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from safe_ro.core.catalog import cdse_footprint
+from safe_ro.core.instrumentation import count, record_error, span
+
+SEARCH_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
+DEFAULT_CACHE_DIR = os.environ.get("SAFE_RO_CDSE_CACHE", os.path.join("data", "cdse_cache"))
+# Seconds during which cached results are used without asking for newer products.
+CACHE_MAX_AGE = float(os.environ.get("SAFE_RO_CDSE_CACHE_MAX_AGE", "3600"))
+SEARCH_START = "2024-01-01T00:00:00.000Z"
+PAGE_SIZE = 1000  # the largest $top CDSE accepts
+# Region footprints per request; keeps the URL well under server limits.
+REGIONS_PER_QUERY = 25
+
+S2_FILTER = (
+    "Collection/Name eq 'SENTINEL-2' and Attributes/OData.CSC.DoubleAttribute/any("
+    "att:att/Name eq 'cloudCover' and att/Value lt 20.00)"
+)
+S1_FILTER = (
+    "Collection/Name eq 'SENTINEL-1' and Attributes/OData.CSC.StringAttribute/any("
+    "att:att/Name eq 'productType' and att/Value eq 'GRD') and Attributes/OData.CSC."
+    "StringAttribute/any(att:att/Name eq 'sensorMode' and att/Value eq 'IW')"
+)
+
+
+def polygon_wkt(bbox):
+    """The OData geography literal of a [west, south, east, north] box."""
+    w, s, e, n = bbox
+    return f"SRID=4326;POLYGON(({w} {s}, {e} {s}, {e} {n}, {w} {n}, {w} {s}))"
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _started(product):
+    return product.get("ContentDate", {}).get("Start", "")
+
+
+class CDSESearch:
+    def __init__(self, search_url=SEARCH_URL, cache_dir=DEFAULT_CACHE_DIR, max_age=CACHE_MAX_AGE,
+                 page_size=PAGE_SIZE, regions_per_query=REGIONS_PER_QUERY, session=None):
+        import requests
+
+        self.search_url = search_url
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.page_size = page_size
+        self.regions_per_query = regions_per_query
+        self.session = session or requests.Session()
+        self.token = None  # sent as a bearer token when set
+
+    def search(self, base_filter, regions, start=SEARCH_START, top=None):
+        """
+        Products matching the OData `base_filter` acquired since `start`, for
+        each of `regions` ({name: [west, south, east, north]}): {name:
+        [product, ...]}, newest first, at most `top` per region.
+        """
+        results = {name: [] for name in regions}
+        names = list(regions)
+        with span("cdse.search"):
+            for i in range(0, len(names), self.regions_per_query):
+                group = {name: regions[name] for name in names[i:i + self.regions_per_query]}
+                for product in self._query(base_filter, list(group.values()), start):
+                    footprint = cdse_footprint(product)
+                    for name, bbox in group.items():
+                        if footprint is None or _intersects(footprint, bbox):
+                            results[name].append(product)
+        for name, products in results.items():
+            products.sort(key=_started, reverse=True)
+            results[name] = products[:top] if top else products
+        return results
+
+    def _query(self, base_filter, bboxes, start):
+        """All products of one batched filter, from the cache and newer pages."""
+        area = " or ".join(f"OData.CSC.Intersects(area=geography'{polygon_wkt(b)}')" for b in bboxes)
+        query = f"{base_filter} and ({area})"
+        key = hashlib.sha256(f"{query}|{start}".encode()).hexdigest()[:32]
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        cached = None
+        if os.path.exists(path):
+            with open(path) as f:
+                cached = json.load(f)
+            if time.time() - cached["fetched"] < self.max_age:
+                count("safe_ro_cdse_cache_total", result="hit")
+                return cached["products"]
+
+        if cached and cached["latest"]:
+            since = f"ContentDate/Start gt {cached['latest']}"
+        else:
+            since = f"ContentDate/Start ge {start}"
+        try:
+            fresh = self._fetch_all(f"{query} and {since}")
+        except Exception as e:
+            if cached is None:
+                raise
+            record_error("cdse.search", f"Refresh failed, using cached results: {e}")
+            return cached["products"]
+        count("safe_ro_cdse_cache_total", result="refresh" if cached else "miss")
+
+        products = {p["Id"]: p for p in (cached or {}).get("products", [])}
+        products.update((p["Id"], p) for p in fresh)
+        products = sorted(products.values(), key=_started)
+        entry = {
+            "filter": query, "start": start, "fetched": time.time(),
+            "latest": _started(products[-1]) if products else None, "products": products,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(f"{path}.part", "w") as f:
+            json.dump(entry, f)
+        os.replace(f"{path}.part", path)
+        return products
+
+    def _fetch_all(self, query):
+        """Pages through a search, oldest first, following @odata.nextLink."""
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        url, params = self.search_url, {
+            "$filter": query, "$orderby": "ContentDate/Start asc", "$top": self.page_size,
+            "$expand": "Attributes",
+        }
+        products = []
+        while url:
+            count("safe_ro_cdse_requests_total")
+            r = self.session.get(url, params=params, headers=headers, timeout=60)
+            r.raise_for_status()
+            page = r.json()
+            values = page.get("value", [])
+            products.extend(values)
+            if page.get("@odata.nextLink"):
+                url, params = page["@odata.nextLink"], None
+            elif len(values) == self.page_size and params is not None:
+                params = {**params, "$skip": params.get("$skip", 0) + self.page_size}
+            else:
+                url = None
+        return products
@@ -4,11 +4,14 @@ import streamlit as st
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 
+from safe_ro.core.instrumentation import timed
+
 
 class GDriveClient:
     def __init__(self):
         self.drive = self._auth()
 
+    @timed("gdrive.auth")
     def _auth(self):
         """
         Authenticates with Google Drive using a local 'mycreds.txt' file.
@@ -55,6 +58,7 @@ class GDriveClient:
 
         return GoogleDrive(gauth)
 
+    @timed("gdrive.list")
     def get_file_list(self, folder_name="SAFE_RO_Cloud_Data"):
         """Lists all files in a specified Google Drive folder."""
         if not self.drive:
@@ -81,6 +85,7 @@ class GDriveClient:
             st.error(f"Failed to list files from Google Drive: {e}")
             return []
 
+    @timed("gdrive.download")
     def download_file(self, file_obj):
         """Downloads a Google Drive file to a temporary local file."""
         if not self.drive:
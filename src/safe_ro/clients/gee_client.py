@@ -2,17 +2,34 @@ import ee
 import numpy as np
 import requests
 import io
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
 import rasterio
 
+from safe_ro.clients.product_cache import ProductCache
+from safe_ro.core.encodings import encode_result
+from safe_ro.core.instrumentation import count, record_error, span, timed
+from safe_ro.core.singleflight import coalesced
+
 
 class GEEClient:
+    # Shared by all clients so speculative requests never pile up unbounded threads.
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gee")
+    # Native pixel size, in metres, of the bands get_stats() reduces.
+    STATS_SCALE = {"ndvi": 10, "flood": 10}
+    NDVI_HISTOGRAM_BINS = 20
+
     def __init__(self, project=None):
+        self._product_cache = ProductCache()
+        self._inflight = {}
+        self._cache_lock = threading.Lock()
         try:
             ee.Initialize(project=project)
         except Exception as e:
             # If already initialized or other error, check for specific messages
             if "Already initialized" not in str(e):
-                print(f"GEE Initialization Error: {e}")
+                record_error("gee.init", f"GEE Initialization Error: {e}")
                 raise  # Re-raise if it's an unexpected error
 
     def _mask_s2_clouds(self, image):
@@ -37,10 +54,117 @@ class GEEClient:
         # For now, we'll keep the scaling within _mask_s2_clouds
         return image
 
-    def get_ndvi(self, aoi, start_date, end_date):
+    def _get_info(self, obj):
+        """Runs a blocking getInfo() round-trip, timed as its own stage."""
+        with span("gee.getinfo"):
+            return obj.getInfo()
+
+    def _download(self, url):
+        with span("gee.download"):
+            response = requests.get(url, stream=True)
+            response.raise_for_status()
+            return response.content
+
+    def _product_key(self, product, aoi, start_date, end_date):
+        # serialize() is computed client-side, so building the key costs no round-trip.
+        return (product, aoi.serialize(), str(start_date), str(end_date))
+
+    def _fetch_product(self, product, aoi, start_date, end_date):
+        """
+        Returns a future for the given product, reusing a cached result or a request
+        that is already running for the same AOI and dates.
+        """
+        fetchers = {"ndvi": self.get_ndvi, "flood": self.get_flood_data}
+        key = self._product_key(product, aoi, start_date, end_date)
+
+        with self._cache_lock:
+            cached = self._product_cache.get(key)
+            if cached is not None:
+                count("safe_ro_gee_requests_total", product=product, source="cache")
+                future = Future()
+                future.set_result(cached)
+                return future
+            if key in self._inflight:
+                count("safe_ro_gee_requests_total", product=product, source="inflight")
+                return self._inflight[key]
+
+            count("safe_ro_gee_requests_total", product=product, source="earth_engine")
+            # The worker inherits the caller's context so its spans join the caller's trace.
+            future = self._executor.submit(
+                contextvars.copy_context().run, fetchers[product], aoi, start_date, end_date
+            )
+            self._inflight[key] = future
+
+        def _store(done):
+            with self._cache_lock:
+                self._inflight.pop(key, None)
+                if not done.cancelled() and done.exception() is None:
+                    data, bounds, error_msg = done.result()
+                    # Only successful results are cached; failures are retried next time.
+                    if data is not None:
+                        self._product_cache.put(key, (data, bounds, error_msg))
+
+        future.add_done_callback(_store)
+        return future
+
+    def get_first_available(
+        self, aoi, start_date, end_date, products=("ndvi", "flood")
+    ):
+        """
+        Requests all products concurrently and returns the first one, in order of
+        preference, that yields data. Requests that lose the race keep running in
+        the background so their results are cached for the next call.
+
+        Returns (data, bounds, product, error_msg).
+        """
+        futures = [
+            (product, self._fetch_product(product, aoi, start_date, end_date))
+            for product in products
+        ]
+
+        errors = []
+        for product, future in futures:
+            try:
+                data, bounds, error_msg = future.result()
+            except Exception as e:
+                data, bounds, error_msg = None, None, str(e)
+            if data is not None:
+                return data, bounds, product, None
+            errors.append(f"{product.upper()}: {error_msg}")
+
+        return None, None, None, " | ".join(errors)
+
+    def get_progressive(
+        self, product, aoi, start_date, end_date, encoding=None, preview_scale=8
+    ):
+        """
+        Starts the full-resolution request for `product` ("ndvi" or "flood") in
+        the background, then fetches a preview at `preview_scale` times the
+        nominal pixel size, a download 1/preview_scale² as large.
+
+        Returns ((data, bounds, error_msg) of the preview, a future of the
+        full-resolution (data, bounds, error_msg)).
+        """
+        fetchers = {"ndvi": self.get_ndvi, "flood": self.get_flood_data}
+        full = self._executor.submit(
+            contextvars.copy_context().run,
+            fetchers[product], aoi, start_date, end_date, encoding=encoding,
+        )
+        with span("progressive.preview"):
+            preview = fetchers[product](
+                aoi, start_date, end_date, encoding=encoding, scale_factor=preview_scale
+            )
+        return preview, full
+
+    # Sessions and API workers asking for the same AOI and dates share one request.
+    @coalesced("gee.ndvi")
+    @timed("gee.ndvi")
+    def get_ndvi(self, aoi, start_date, end_date, encoding=None, scale_factor=1):
         """
         Retrieves Sentinel-2 data, computes NDVI, and returns it as a NumPy array
-        along with its bounds.
+        along with its bounds. With `encoding` ("int16"/"uint8") the NDVI is
+        returned as a compact EncodedRaster instead. `scale_factor` > 1 downloads
+        pixels that many times coarser than the native 10 m, for previews.
         """
         try:
             # Load Sentinel-2 Surface Reflectance data.
@@ -58,9 +182,9 @@ class GEEClient:
                 "B4", "B8", "B3"
             )  # Red, NIR, Green for visualization if needed
 
-            if s2_collection.size().getInfo() == 0:
+            if self._get_info(s2_collection.size()) == 0:
                 msg = f"GEEClient: No Sentinel-2 images found for the selected region and dates."
-                print(msg)
+                record_error("gee.ndvi", msg)
                 return None, None, msg
 
             # Get the median image from the collection.
@@ -70,10 +194,10 @@ class GEEClient:
             ndvi = median_image.normalizedDifference(["B8", "B4"]).rename("NDVI")
 
             # --- Convert ee.Image to NumPy Array and get bounds ---
-            projection = ndvi.projection().getInfo()
+            projection = self._get_info(ndvi.projection())
             crs = projection["crs"]
-            region_geojson = aoi.getInfo()
-            nominal_scale = ndvi.projection().nominalScale().getInfo()
+            region_geojson = self._get_info(aoi)
+            nominal_scale = self._get_info(ndvi.projection().nominalScale()) * scale_factor
 
             download_args = {
                 "name": "ndvi_data",
@@ -85,10 +209,9 @@ class GEEClient:
             }
 
             download_url = ndvi.getDownloadUrl(download_args)
-            response = requests.get(download_url, stream=True)
-            response.raise_for_status()
+            content = self._download(download_url)
 
-            with rasterio.open(io.BytesIO(response.content)) as src:
+            with rasterio.open(io.BytesIO(content)) as src:
                 ndvi_array = src.read(1)
                 bounds = src.bounds
                 gee_bounds_format = [
@@ -101,29 +224,33 @@ class GEEClient:
             if src.nodata is not None:
                 ndvi_array[ndvi_array == src.nodata] = np.nan
 
-            return ndvi_array, gee_bounds_format, None
+            return encode_result(ndvi_array, "ndvi", encoding), gee_bounds_format, None
 
         except ee.EEException as e:
             msg = f"A Google Earth Engine error occurred during NDVI analysis: {e}"
-            print(msg)
+            record_error("gee.ndvi", msg)
             return None, None, msg
         except requests.exceptions.RequestException as e:
             msg = f"A network error occurred while downloading NDVI data: {e}"
-            print(msg)
+            record_error("gee.ndvi", msg)
             return None, None, msg
         except rasterio.errors.RasterioIOError as e:
             msg = f"An error occurred reading the downloaded NDVI data: {e}"
-            print(msg)
+            record_error("gee.ndvi", msg)
             return None, None, msg
         except Exception as e:
             msg = f"An unexpected error occurred in get_ndvi: {e}"
-            print(msg)
+            record_error("gee.ndvi", msg)
             return None, None, msg
 
-    def get_flood_data(self, aoi, start_date, end_date):
+    @coalesced("gee.flood")
+    @timed("gee.flood")
+    def get_flood_data(self, aoi, start_date, end_date, encoding=None, scale_factor=1):
         """
         Retrieves Sentinel-1 data, applies flood detection (thresholding),
-        and returns it as a NumPy array along with its bounds.
+        and returns it as a NumPy array along with its bounds. With `encoding`
+        ("uint8"/"packbits"/"rle") the mask is returned as a compact EncodedRaster.
+        `scale_factor` > 1 works on pixels that many times coarser, for previews.
         """
         try:
             # Step 1: Load collection
@@ -137,7 +264,7 @@ class GEEClient:
                     .select("VV")
                 )
 
-                if s1_collection.size().getInfo() == 0:
+                if self._get_info(s1_collection.size()) == 0:
                     return None, None, "No Sentinel-1 images found for the selected criteria."
             except Exception as e:
                 return None, None, f"Failed during data loading: {e}"
@@ -145,7 +272,7 @@ class GEEClient:
             # Step 2: Pre-processing
             try:
                 median_s1 = s1_collection.median()
-                nominal_scale = median_s1.projection().nominalScale().getInfo()
+                nominal_scale = self._get_info(median_s1.projection().nominalScale()) * scale_factor
                 filtered_s1 = median_s1.focal_median(3, "square", "pixels")
             except Exception as e:
                 return None, None, f"Failed during pre-processing (median/speckle filter): {e}"
@@ -178,9 +305,9 @@ class GEEClient:
 
             # Step 5: Prepare for download
             try:
-                projection = temp_flood.projection().getInfo()
+                projection = self._get_info(temp_flood.projection())
                 crs = projection["crs"]
-                region_geojson = aoi.getInfo()
+                region_geojson = self._get_info(aoi)
 
                 download_args = {
                     "name": "flood_data",
@@ -196,10 +323,10 @@ class GEEClient:
 
             # Step 6: Download and Read
             try:
-                response = requests.get(download_url, stream=True)
-                response.raise_for_status()
-                with rasterio.open(io.BytesIO(response.content)) as src:
-                    flood_array = src.read(1).astype(float)
+                content = self._download(download_url)
+                with rasterio.open(io.BytesIO(content)) as src:
+                    # float32 is enough for 0/1 plus NaN nodata.
+                    flood_array = src.read(1).astype(np.float32)
                     bounds = src.bounds
                     gee_bounds_format = [
                         bounds.left,
@@ -209,7 +336,11 @@ class GEEClient:
                     ]
                     if src.nodata is not None:
                         flood_array[flood_array == src.nodata] = np.nan
-                return flood_array, gee_bounds_format, None
+                return (
+                    encode_result(flood_array, "mask", encoding),
+                    gee_bounds_format,
+                    None,
+                )
             except requests.exceptions.RequestException as e:
                 return None, None, f"Network error during download: {e}"
             except rasterio.errors.RasterioIOError as e:
@@ -219,4 +350,151 @@ class GEEClient:
 
         except Exception as e:
             # Fallback for any other unexpected error
-            return None, None, f"An unexpected error occurred in get_flood_data: {e}"
\ No newline at end of file
+            return None, None, f"An unexpected error occurred in get_flood_data: {e}"
+
+    # -------------------------------------------------------------------------
+    # Server-side statistics
+    # -------------------------------------------------------------------------
+    def _regions_collection(self, regions):
+        """FeatureCollection of {name: [w, s, e, n] or ee.Geometry}, tagged with "region"."""
+        features = []
+        for name, region in regions.items():
+            geometry = ee.Geometry.Rectangle(list(region)) if isinstance(region, (list, tuple)) else region
+            features.append(ee.Feature(geometry, {"region": name}))
+        return ee.FeatureCollection(features)
+
+    def _ndvi_region_stats(self, ndvi, fc, scale):
+        reducer = (
+            ee.Reducer.mean()
+            .combine(ee.Reducer.stdDev(), sharedInputs=True)
+            .combine(ee.Reducer.minMax(), sharedInputs=True)
+            .combine(ee.Reducer.count(), sharedInputs=True)
+            .combine(ee.Reducer.fixedHistogram(-1, 1, self.NDVI_HISTOGRAM_BINS), sharedInputs=True)
+        )
+        return ndvi.reduceRegions(collection=fc, reducer=reducer, scale=scale, tileScale=4)
+
+    def _flood_region_stats(self, filtered_s1, fc, scale):
+        # occurrence is masked where water was never seen, hence the unmask.
+        not_permanent_water = (
+            ee.Image("JRC/GSW1_4/GlobalSurfaceWater").select("occurrence").unmask(0).lte(30)
+        )
+
+        def per_region(feature):
+            # Same recipe as get_flood_data: each region is thresholded at its own
+            # 15th VV percentile.
+            threshold = filtered_s1.reduceRegion(
+                reducer=ee.Reducer.percentile([15]),
+                geometry=feature.geometry(),
+                scale=scale,
+                bestEffort=True,
+            ).get("VV")
+            flooded = filtered_s1.lt(ee.Image.constant(threshold)).And(not_permanent_water).rename("flooded")
+            sums = (
+                ee.Image.pixelArea()
+                .multiply(flooded)
+                .rename("flooded_m2")
+                .addBands(flooded)
+                .reduceRegion(
+                    reducer=ee.Reducer.sum()
+                    .combine(ee.Reducer.mean(), sharedInputs=True)
+                    .combine(ee.Reducer.count(), sharedInputs=True),
+                    geometry=feature.geometry(),
+                    scale=scale,
+                    bestEffort=True,
+                    maxPixels=1e10,
+                    tileScale=4,
+                )
+            )
+            return feature.set({
+                "threshold": threshold,
+                "flooded_m2": sums.get("flooded_m2_sum"),
+                "flooded_fraction": sums.get("flooded_mean"),
+                "valid_pixels": sums.get("flooded_count"),
+            })
+
+        return fc.map(per_region)
+
+    def _format_stats(self, product, props):
+        if product == "ndvi":
+            histogram = props.get("histogram") or []
+            step = 2.0 / self.NDVI_HISTOGRAM_BINS
+            return {
+                "mean": props.get("mean"),
+                "std": props.get("stdDev"),
+                "min": props.get("min"),
+                "max": props.get("max"),
+                "pixels": props.get("count"),
+                "histogram": {
+                    "edges": [round(-1 + i * step, 6) for i in range(self.NDVI_HISTOGRAM_BINS + 1)],
+                    "counts": [int(c) for _, c in histogram],
+                },
+            }
+        flooded_m2 = props.get("flooded_m2")
+        return {
+            "flooded_area_ha": flooded_m2 / 10000.0 if flooded_m2 is not None else None,
+            "flooded_fraction": props.get("flooded_fraction"),
+            "valid_pixels": props.get("valid_pixels"),
+            "threshold": props.get("threshold"),
+        }
+
+    @coalesced("gee.stats")
+    @timed("gee.stats")
+    def get_stats(self, product, regions, start_date, end_date, scale=None):
+        """
+        Computes per-region statistics of `product` ("ndvi" or "flood") entirely
+        on Earth Engine: after the image-count check, all regions are reduced
+        in one round-trip and no pixels are downloaded. `regions` maps names
+        to [west, south, east, north] boxes or ee.Geometry objects, e.g. all of
+        safe_ro.core.regions.
+
+        NDVI: mean, std, min, max, pixel count and a histogram over [-1, 1].
+        Flood: flooded_area_ha, flooded_fraction (of valid radar pixels),
+        valid_pixels and the VV threshold used.
+
+        Returns ({region name: stats}, error_msg).
+        """
+        try:
+            fc = self._regions_collection(regions)
+            scale = scale or self.STATS_SCALE.get(product)
+            if product == "ndvi":
+                collection = (
+                    ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+                    .filterDate(start_date, end_date)
+                    .filterBounds(fc.geometry())
+                    .map(self._mask_s2_clouds)
+                )
+                if self._get_info(collection.size()) == 0:
+                    return None, "No Sentinel-2 images found for the selected regions and dates."
+                ndvi = collection.median().normalizedDifference(["B8", "B4"]).rename("NDVI")
+                reduced = self._ndvi_region_stats(ndvi, fc, scale)
+            elif product == "flood":
+                collection = (
+                    ee.ImageCollection("COPERNICUS/S1_GRD")
+                    .filterDate(start_date, end_date)
+                    .filterBounds(fc.geometry())
+                    .filter(ee.Filter.listContains("transmitterReceiverPolarisation", "VV"))
+                    .filter(ee.Filter.eq("instrumentMode", "IW"))
+                    .select("VV")
+                )
+                if self._get_info(collection.size()) == 0:
+                    return None, "No Sentinel-1 images found for the selected regions and dates."
+                filtered_s1 = collection.median().focal_median(3, "square", "pixels")
+                reduced = self._flood_region_stats(filtered_s1, fc, scale)
+            else:
+                return None, f"Unknown product '{product}'"
+
+            count("safe_ro_gee_requests_total", product=product, source="stats")
+            features = self._get_info(reduced)["features"]
+            return {
+                f["properties"]["region"]: self._format_stats(product, f["properties"])
+                for f in features
+            }, None
+
+        except ee.EEException as e:
+            msg = f"A Google Earth Engine error occurred computing {product} statistics: {e}"
+            record_error("gee.stats", msg)
+            return None, msg
+        except Exception as e:
+            msg = f"An unexpected error occurred in get_stats: {e}"
+            record_error("gee.stats", msg)
+            return None, msg
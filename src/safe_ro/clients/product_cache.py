@@ -0,0 +1,54 @@
+"""
+Bounded in-memory cache of downloaded Earth Engine products, shared by all
+sessions using one GEEClient (e.g. through Streamlit's cache_resource).
+
+Entries are (data, bounds, error_msg) tuples. The cache keeps at most
+SAFE_RO_GEE_CACHE_ENTRIES of them and SAFE_RO_GEE_CACHE_MB of pixel data,
+evicting the least recently used first. It is not synchronized; GEEClient
+guards it with its own lock.
+"""
+
+import os
+from collections import OrderedDict
+
+from safe_ro.core.instrumentation import count
+
+MAX_ENTRIES = int(os.environ.get("SAFE_RO_GEE_CACHE_ENTRIES", "32"))
+MAX_MB = float(os.environ.get("SAFE_RO_GEE_CACHE_MB", "512"))
+
+
+class ProductCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The cached value of `key`, or None; marks it as most recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        """Caches `value` (a (data, bounds, error_msg) tuple), evicting as needed."""
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        nbytes = getattr(value[0], "nbytes", 0)
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        # The newest entry is kept even if it alone is over the limit.
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+            count("safe_ro_gee_cache_evictions_total")
@@ -0,0 +1,205 @@
+import ast
+from contextlib import ExitStack
+
+import numpy as np
+from rasterio.windows import Window
+
+# Spectral indices over named bands. Sentinel-2: BLUE=B02, GREEN=B03,
+# RED=B04, NIR=B08, SWIR1=B11, SWIR2=B12 (reflectance).
+INDICES = {
+    "NDVI": "(NIR - RED) / (NIR + RED)",
+    "NBR": "(NIR - SWIR2) / (NIR + SWIR2)",
+    "NDWI": "(GREEN - NIR) / (GREEN + NIR)",
+    "NDMI": "(NIR - SWIR1) / (NIR + SWIR1)",
+    "EVI": "2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)",
+    "SAVI": "1.5 * (NIR - RED) / (NIR + RED + 0.5)",
+}
+
+_UFUNCS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+
+class BandMath:
+    """
+    A small expression engine for band math such as "(NIR - RED) / (NIR + RED)".
+
+    The formula is compiled once into a linear program of in-place ufunc calls
+    over a handful of reusable window-sized registers; constant sub-expressions
+    are folded. `bands` lists the band names the formula needs, so callers
+    only read what is used. Evaluation then walks the rasters window by window:
+    each band is read straight into a preallocated float32 buffer and every
+    operation writes into a register via `out=`, so no full-size temporaries
+    are created besides the result itself.
+
+    Division by zero and nodata (dataset nodata values or NaN in array inputs)
+    are tracked in one invalid-pixel mask per window and filled with
+    `nodata` at the end.
+    """
+
+    def __init__(self, formula):
+        self.formula = INDICES.get(formula.upper(), formula) if formula.isalnum() else formula
+        tree = ast.parse(self.formula, mode="eval")
+        self.program = []
+        self.register_count = 0
+        self._free = []
+        self.bands = []
+        self.result = self._compile(tree.body)
+
+    # -------------------------------------------------------------------------
+    # Compilation
+    # -------------------------------------------------------------------------
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        self.register_count += 1
+        return self.register_count - 1
+
+    def _release(self, operand):
+        if operand[0] == "reg":
+            self._free.append(operand[1])
+
+    def _compile(self, node):
+        if isinstance(node, ast.Name):
+            if node.id not in self.bands:
+                self.bands.append(node.id)
+            return ("band", node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return ("const", float(node.value))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if operand[0] == "const":
+                return ("const", -operand[1])
+            return self._emit(np.negative, operand, None)
+        if isinstance(node, ast.BinOp) and type(node.op) in _UFUNCS:
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            ufunc = _UFUNCS[type(node.op)]
+            if left[0] == "const" and right[0] == "const":
+                with np.errstate(all="ignore"):
+                    return ("const", float(ufunc(left[1], right[1])))
+            return self._emit(ufunc, left, right)
+        raise ValueError(f"Unsupported expression in band math formula: {ast.dump(node)}")
+
+    def _emit(self, ufunc, left, right):
+        # Operand registers are released first so the result can reuse one in place.
+        self._release(left)
+        if right is not None:
+            self._release(right)
+        target = ("reg", self._allocate())
+        self.program.append((ufunc, target, left, right))
+        return target
+
+    # -------------------------------------------------------------------------
+    # Evaluation
+    # -------------------------------------------------------------------------
+    # Pixels per window buffer; keeps each buffer around 1 MB (cache-friendly).
+    BLOCK_PIXELS = 256 * 1024
+
+    def evaluate(self, sources, block_rows=None, nodata=np.nan, zero_division=None, clip=None):
+        """
+        Evaluates the formula. `sources` maps each name in `bands` to a file
+        path, a RasterBand or a 2-D array; all must share one shape.
+        Divisions by zero yield `zero_division` if given, otherwise `nodata`.
+        Returns a float32 array.
+        """
+        from safe_ro.core.safe_ro_core import RasterBand
+
+        missing = [name for name in self.bands if name not in sources]
+        if missing:
+            raise KeyError(f"Band math formula '{self.formula}' needs bands {missing}.")
+
+        with ExitStack() as stack:
+            readers = {}
+            shape = None
+            for name in self.bands:
+                source = sources[name]
+                if isinstance(source, np.ndarray):
+                    readers[name] = (source, None)
+                    band_shape = source.shape
+                else:
+                    band = source if isinstance(source, RasterBand) else RasterBand(source)
+                    src = stack.enter_context(band.open())
+                    band.remember(src)
+                    readers[name] = (src, src.nodata)
+                    band_shape = src.shape
+                if shape is None:
+                    shape = band_shape
+                elif band_shape != shape:
+                    raise ValueError(
+                        f"Band '{name}' has shape {band_shape}, expected {shape}."
+                    )
+            if shape is None:
+                raise ValueError(f"Band math formula '{self.formula}' uses no bands.")
+
+            height, width = shape
+            block_rows = min(block_rows or max(1, self.BLOCK_PIXELS // width), height)
+            buffers = {name: np.empty((block_rows, width), np.float32) for name in self.bands}
+            registers = [np.empty((block_rows, width), np.float32) for _ in range(self.register_count)]
+            invalid = np.empty((block_rows, width), bool)
+            scratch = np.empty((block_rows, width), bool)
+            result = np.empty(shape, np.float32)
+
+            for r0 in range(0, height, block_rows):
+                rows = min(block_rows, height - r0)
+                inv = invalid[:rows]
+                tmp = scratch[:rows]
+                inv.fill(False)
+
+                for name, (reader, band_nodata) in readers.items():
+                    buf = buffers[name][:rows]
+                    if isinstance(reader, np.ndarray):
+                        np.copyto(buf, reader[r0 : r0 + rows], casting="unsafe")
+                    else:
+                        reader.read(1, window=Window(0, r0, width, rows), out=buf)
+                        if band_nodata is not None and not np.isnan(band_nodata):
+                            np.equal(buf, band_nodata, out=tmp)
+                            np.logical_or(inv, tmp, out=inv)
+                    np.isnan(buf, out=tmp)
+                    np.logical_or(inv, tmp, out=inv)
+
+                value = self._run(buffers, registers, rows, inv, tmp, zero_division)
+                out = result[r0 : r0 + rows]
+                if isinstance(value, float):
+                    out.fill(value)
+                else:
+                    np.copyto(out, value)
+                if clip is not None:
+                    np.clip(out, clip[0], clip[1], out=out)
+                np.copyto(out, nodata, where=inv)
+            return result
+
+    def _run(self, buffers, registers, rows, invalid, scratch, zero_division):
+        def resolve(operand):
+            kind, value = operand
+            if kind == "const":
+                return value
+            if kind == "band":
+                return buffers[value][:rows]
+            return registers[value][:rows]
+
+        for ufunc, target, left, right in self.program:
+            out = registers[target[1]][:rows]
+            a = resolve(left)
+            if right is None:
+                ufunc(a, out=out)
+                continue
+            b = resolve(right)
+            if ufunc is np.divide and not isinstance(b, float):
+                np.equal(b, 0, out=scratch)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    np.divide(a, b, out=out)
+                if zero_division is None:
+                    np.logical_or(invalid, scratch, out=invalid)
+                else:
+                    np.copyto(out, zero_division, where=scratch)
+                continue
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ufunc(a, b, out=out)
+        return resolve(self.result)
@@ -0,0 +1,327 @@
+"""
+Batch processing of scene archives, for reprocessing whole directories
+overnight:
+
+    summary = run_batch(["data/archive"], "data/batch", workers=16)
+
+Scenes are discovered by the file names the downloaders produce
+(`<product>_RED.jp2` + `<product>_NIR.jp2` for NDVI, plus the optional
+`<product>_SCL.jp2` scene classification, or their .tif COGs;
+`<product>_VV.tiff` for flood detection), either loose in a directory tree or inside product
+zips, which are read in place without extracting. Each scene runs in its own
+worker process and its result is written as a COG. A JSON manifest with per-
+scene statistics is kept next to the outputs; on the next run, scenes whose
+output is newer than their inputs are skipped and their manifest entries
+carried over.
+"""
+
+import importlib.util
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+
+from safe_ro.core.instrumentation import count
+
+DEFAULT_BATCH_DIR = os.environ.get("SAFE_RO_BATCH_DIR", os.path.join("data", "batch"))
+MANIFEST_NAME = "manifest.json"
+PRODUCTS = ("ndvi", "flood")
+
+# Suffixes written by HybridDownloader (scripts/safe_ro_cloud.py).
+# Bands are COGs (.tif) once transcoded at ingest (see safe_ro.core.ingest).
+SUFFIXES = {
+    "_RED.jp2": "red", "_NIR.jp2": "nir", "_SCL.jp2": "scl",
+    "_RED.tif": "red", "_NIR.tif": "nir", "_SCL.tif": "scl",
+    "_VV.tiff": "vv",
+}
+OUTPUT_SUFFIX = {"ndvi": "_NDVI.tif", "flood": "_FLOOD.tif"}
+
+
+def band_role(name):
+    """(scene id, role) of a band file named like the downloader's output, or (None, None)."""
+    for suffix, role in SUFFIXES.items():
+        if name.endswith(suffix):
+            return name[: -len(suffix)], role
+    return None, None
+
+
+def _safe_member_role(member):
+    """Role of a member of a raw Copernicus product zip, by the downloader's rules."""
+    name = os.path.basename(member)
+    if name.endswith(".jp2") and "R60m" not in member:
+        if "_B04_" in name:
+            return "red"
+        if "_B08_" in name:
+            return "nir"
+        if "_SCL_" in name:
+            return "scl"
+    if "measurement" in member and "-vv-" in name.lower() and name.endswith(".tiff"):
+        return "vv"
+    return None
+
+
+def zip_band_sources(zip_path):
+    """{role: rasterio URI} for the bands inside a product zip."""
+    sources = {}
+    with zipfile.ZipFile(zip_path) as z:
+        members = sorted(z.namelist())
+    for member in members:
+        role = band_role(os.path.basename(member))[1] or _safe_member_role(member)
+        # L2A products carry B04 at 10, 20 and 60 m; the 10 m band wins.
+        if role and (role not in sources or "R10m" in member):
+            sources[role] = f"zip://{os.path.abspath(zip_path)}!{member}"
+    return sources
+
+
+def _scenes_from_sources(scene_id, sources, mtime, products):
+    scenes = []
+    if "ndvi" in products and "red" in sources and "nir" in sources:
+        # The scene classification, when present, is used for cloud masking
+        # by safe_ro.core.composite.
+        ndvi_sources = {role: sources[role] for role in ("red", "nir", "scl") if role in sources}
+        scenes.append({"id": scene_id, "product": "ndvi", "mtime": mtime, "sources": ndvi_sources})
+    if "flood" in products and "vv" in sources:
+        scenes.append({"id": scene_id, "product": "flood", "mtime": mtime, "sources": {"vv": sources["vv"]}})
+    return scenes
+
+
+def discover_scenes(roots, products=PRODUCTS):
+    """
+    Finds the scenes under `roots` (directories, zips or single band files).
+    Returns a list of {"id", "product", "sources", "mtime"} dicts, where
+    `mtime` is the newest modification time of the scene's inputs.
+    """
+    loose = {}  # scene id -> {role: (path, mtime)}
+    zips = []
+    for root in roots:
+        if os.path.isdir(root):
+            paths = (
+                os.path.join(dirpath, name)
+                for dirpath, _, names in os.walk(root)
+                for name in names
+            )
+        else:
+            paths = [root]
+        for path in sorted(paths):
+            if path.lower().endswith(".zip"):
+                zips.append(path)
+                continue
+            scene_id, role = band_role(os.path.basename(path))
+            if role:
+                bands = loose.setdefault(scene_id, {})
+                # A transcoded COG wins over the JPEG2000 it was made from.
+                if role in bands and bands[role][0].endswith(".tif") and not path.endswith(".tif"):
+                    continue
+                bands[role] = (path, os.path.getmtime(path))
+
+    scenes = []
+    for scene_id, bands in sorted(loose.items()):
+        sources = {role: path for role, (path, _) in bands.items()}
+        mtime = max(m for _, m in bands.values())
+        scenes.extend(_scenes_from_sources(scene_id, sources, mtime, products))
+
+    seen = {(s["id"], s["product"]) for s in scenes}
+    for zip_path in zips:
+        try:
+            sources = zip_band_sources(zip_path)
+        except zipfile.BadZipFile:
+            print(f"[BATCH] Skipping unreadable zip {zip_path}")
+            continue
+        scene_id = os.path.splitext(os.path.basename(zip_path))[0]
+        for scene in _scenes_from_sources(scene_id, sources, os.path.getmtime(zip_path), products):
+            # Extracted bands take precedence over the zip they came from.
+            if (scene["id"], scene["product"]) not in seen:
+                seen.add((scene["id"], scene["product"]))
+                scenes.append(scene)
+    return scenes
+
+
+def output_path(scene, out_dir):
+    return os.path.join(out_dir, scene["id"] + OUTPUT_SUFFIX[scene["product"]])
+
+
+def is_up_to_date(scene, out_dir):
+    path = output_path(scene, out_dir)
+    return os.path.exists(path) and os.path.getmtime(path) >= scene["mtime"]
+
+
+def _ndvi_stats(ndvi):
+    valid = ndvi[np.isfinite(ndvi)]
+    if valid.size == 0:
+        return {"valid_fraction": 0.0}
+    return {
+        "min": float(valid.min()),
+        "max": float(valid.max()),
+        "mean": float(valid.mean()),
+        "std": float(valid.std()),
+        "valid_fraction": valid.size / ndvi.size,
+    }
+
+
+def _flood_stats(mask):
+    flooded = int(np.count_nonzero(mask))
+    return {"flooded_pixels": flooded, "flooded_area_percent": flooded * 100.0 / mask.size}
+
+
+def process_scene(scene, out_dir, options=None):
+    """
+    Runs one scene and writes its COG. Runs in a worker process, so it only
+    takes and returns plain data. Returns the scene's manifest entry.
+    """
+    from safe_ro.core.cog import output_transform, write_cog
+    from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+
+    options = options or {}
+    entry = {"id": scene["id"], "product": scene["product"], "sources": scene["sources"]}
+    start = time.perf_counter()
+    try:
+        if scene["product"] == "ndvi":
+            processor = NDVIProcessor(scene["sources"]["red"], scene["sources"]["nir"])
+            data, bounds = processor.compute_ndvi()
+            band, stats = processor.red_band, _ndvi_stats
+        else:
+            detector = Sentinel1FloodDetector(scene["sources"]["vv"])
+            data, bounds = detector.detect(
+                threshold=options.get("threshold"),
+                percentile=options.get("percentile", 20.0),
+                speckle_filter=options.get("speckle_filter"),
+            )
+            band, stats = detector.band, _flood_stats
+        if data is None:
+            raise RuntimeError(f"{scene['product']} processing returned no data (see log)")
+
+        path = write_cog(
+            output_path(scene, out_dir), data, output_transform(band, data.shape), band.crs
+        )
+        entry.update(
+            status="ok",
+            output=path,
+            width=int(data.shape[1]),
+            height=int(data.shape[0]),
+            crs=band.crs.to_string() if band.crs else None,
+            bounds=[float(v) for v in bounds],
+            stats=stats(data),
+        )
+    except Exception as e:
+        entry.update(status="failed", error=str(e))
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    entry["processed_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return entry
+
+
+def _key(entry):
+    return f"{entry['id']}:{entry['product']}"
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {_key(entry): entry for entry in json.load(f)["scenes"]}
+
+
+def _require_pyarrow():
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError("Writing a Parquet manifest requires pyarrow. Install it or use the JSON manifest.")
+
+
+def write_manifest(out_dir, entries, parquet=False):
+    """Writes manifest.json (and manifest.parquet if asked) atomically."""
+    entries = sorted(entries, key=lambda e: (e["id"], e["product"]))
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".part", "w") as f:
+        json.dump(
+            {"generated": datetime.now(timezone.utc).isoformat(timespec="seconds"), "scenes": entries},
+            f, indent=2,
+        )
+    os.replace(path + ".part", path)
+
+    if parquet:
+        _require_pyarrow()
+        import pandas as pd
+
+        # Nested stats become flat stats.* columns.
+        pd.json_normalize(entries).to_parquet(os.path.join(out_dir, "manifest.parquet"), index=False)
+    return path
+
+
+def run_batch(
+    roots, out_dir=DEFAULT_BATCH_DIR, products=PRODUCTS, workers=None, force=False,
+    options=None, parquet=False, progress=print, scenes=None,
+):
+    """
+    Processes every scene found under `roots` that is missing or stale in
+    `out_dir`, `workers` scenes at a time (default: one per CPU). Returns a
+    summary with counts and throughput; per-scene results are in the manifest.
+    `scenes` (e.g. from Catalog.batch_scenes) replaces the discovery under `roots`.
+    """
+    if parquet:
+        # Fail before hours of processing rather than at the very end.
+        _require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    if scenes is None:
+        scenes = discover_scenes(roots, products)
+    previous = load_manifest(out_dir)
+
+    entries = {}
+    pending = []
+    for scene in scenes:
+        key = _key(scene)
+        if not force and previous.get(key, {}).get("status") == "ok" and is_up_to_date(scene, out_dir):
+            entries[key] = previous[key]
+        else:
+            pending.append(scene)
+    skipped = len(entries)
+    progress(f"[BATCH] {len(scenes)} scenes found, {skipped} up to date, {len(pending)} to process.")
+
+    start = time.perf_counter()
+    failed = 0
+    megapixels = 0.0
+    if pending:
+        # Spawned workers start without the parent's GDAL state and open datasets.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            futures = {pool.submit(process_scene, scene, out_dir, options): scene for scene in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                scene = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:  # the worker itself died
+                    entry = {"id": scene["id"], "product": scene["product"], "sources": scene["sources"],
+                             "status": "failed", "error": str(e)}
+                entries[_key(scene)] = entry
+                count("safe_ro_batch_scenes_total", product=scene["product"], status=entry["status"])
+                if entry["status"] == "ok":
+                    megapixels += entry["width"] * entry["height"] / 1e6
+                    progress(f"[BATCH] [{done}/{len(pending)}] {scene['id']} {scene['product']}: "
+                             f"{entry['seconds']:.1f} s")
+                else:
+                    failed += 1
+                    progress(f"[BATCH] [{done}/{len(pending)}] {scene['id']} {scene['product']} "
+                             f"FAILED: {entry['error']}")
+                # Keep the manifest current so an interrupted run resumes where it stopped.
+                write_manifest(out_dir, list(entries.values()))
+    elapsed = time.perf_counter() - start
+
+    write_manifest(out_dir, list(entries.values()), parquet=parquet)
+    processed = len(pending) - failed
+    summary = {
+        "scenes": len(scenes),
+        "processed": processed,
+        "skipped": skipped,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "megapixels": round(megapixels, 2),
+        "scenes_per_hour": round(processed * 3600 / elapsed, 1) if elapsed > 0 else 0.0,
+        "mpx_per_s": round(megapixels / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    progress(
+        f"[BATCH] Done: {processed} processed, {skipped} skipped, {failed} failed in {elapsed:.1f} s "
+        f"({summary['scenes_per_hour']} scenes/h, {summary['mpx_per_s']} Mpx/s)."
+    )
+    return summary
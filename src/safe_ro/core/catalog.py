@@ -0,0 +1,515 @@
+"""
+Catalog of every known scene and band, wherever it lives: local directories
+and product zips, the Google Drive folder the cloud sync uploads to, and
+Copernicus (CDSE) search results.
+
+    catalog = Catalog()
+    catalog.index_local(["data/archive"])
+    catalog.index_drive(gdrive_client.get_file_list())
+    scene = catalog.latest(bbox=REGIONS["Iasi"], bands=("red", "nir"), sensor="S2", max_cloud=20)
+    scene["bands"]["red"]["location"]  # a path, zip:// URI, gdrive:<id> or cdse:<id>
+
+Scenes are keyed by product name, which also gives their sensor and
+acquisition time. For each band the catalog keeps where it is, its CRS,
+resolution, size and a checksum. Footprints are kept in WGS84 in an SQLite
+R-tree, so bounding box + time + cloud queries take milliseconds however
+many scenes are known. Drive files only give their region, so their
+footprint is the region's bounding box until a local copy is indexed.
+
+Indexing is incremental: local files whose size and modification time are
+unchanged are not opened again, and bands that disappeared from an indexed
+directory or from the Drive listing are dropped.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+from datetime import datetime
+
+from safe_ro.core.instrumentation import record_error, span
+
+DEFAULT_CATALOG_PATH = os.environ.get("SAFE_RO_CATALOG", os.path.join("data", "catalog.sqlite"))
+# Where a band is taken from when several copies are known, in order of preference.
+SOURCES = ("local", "drive", "cdse")
+# SCL classes counted as cloud, as in the product's cloud percentage:
+# cloud medium probability, cloud high probability, thin cirrus.
+CLOUD_SCL = (8, 9, 10)
+# Bands inside a CDSE product, by sensor.
+CDSE_BANDS = {"S2": ("red", "nir", "scl"), "S1": ("vv",)}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    sensor TEXT,
+    acquired TEXT,
+    cloud_cover REAL,
+    footprint_exact INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS scenes_acquired ON scenes (acquired);
+CREATE VIRTUAL TABLE IF NOT EXISTS footprints USING rtree (id, west, east, south, north);
+CREATE TABLE IF NOT EXISTS bands (
+    id INTEGER PRIMARY KEY,
+    scene_id INTEGER NOT NULL REFERENCES scenes (id) ON DELETE CASCADE,
+    band TEXT NOT NULL,
+    source TEXT NOT NULL,
+    location TEXT NOT NULL,
+    crs TEXT,
+    resolution REAL,
+    width INTEGER,
+    height INTEGER,
+    checksum TEXT,
+    size INTEGER,
+    mtime REAL,
+    UNIQUE (scene_id, band, source)
+);
+CREATE INDEX IF NOT EXISTS bands_location ON bands (location);
+"""
+
+_TIMESTAMP = re.compile(r"(\d{8}T\d{6})")
+_CLOUD_ASSESSMENT = re.compile(rb"<Cloud_Coverage_Assessment>\s*([0-9.]+)\s*<")
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_scene_name(name):
+    """(sensor, acquisition time as ISO 8601 UTC) of a Copernicus product name; None where unknown."""
+    sensor = name[:2] if name[:2] in ("S1", "S2") else None
+    match = _TIMESTAMP.search(name)
+    if match is None:
+        return sensor, None
+    return sensor, datetime.strptime(match.group(1), "%Y%m%dT%H%M%S").strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _end_of_day(value):
+    """Lets a plain date as the end of a range include that whole day."""
+    return f"{value}T23:59:59Z" if value and len(value) == 10 else value
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def _raster_info(location):
+    """Band metadata and WGS84 (west, south, east, north) footprint of a raster."""
+    import rasterio
+    from rasterio.warp import transform_bounds
+
+    with rasterio.open(location) as src:
+        info = {"crs": src.crs.to_string() if src.crs else None, "width": src.width, "height": src.height,
+                "resolution": None}
+        footprint = None
+        if src.crs:
+            info["resolution"] = abs(src.transform.a)
+            footprint = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        else:
+            gcps, gcp_crs = src.gcps  # Sentinel-1 GRD measurements are georeferenced by GCPs
+            if gcps and gcp_crs:
+                xs, ys = [g.x for g in gcps], [g.y for g in gcps]
+                info["crs"] = gcp_crs.to_string()
+                footprint = transform_bounds(gcp_crs, "EPSG:4326", min(xs), min(ys), max(xs), max(ys))
+    return info, footprint
+
+
+def _scl_cloud_cover(location):
+    """Cloud percentage of a scene from a decimated read of its SCL band."""
+    import numpy as np
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(location) as src:
+        step = max(1, max(src.shape) // 512)
+        scl = src.read(
+            1, out_shape=(max(1, src.height // step), max(1, src.width // step)),
+            resampling=Resampling.nearest,
+        )
+    valid = scl[scl != 0]
+    return float(np.isin(valid, CLOUD_SCL).mean() * 100.0) if valid.size else None
+
+
+def _zip_cloud_cover(zip_path):
+    """The cloud percentage from a product zip's MTD_MSIL2A/MTD_MSIL1C metadata."""
+    with zipfile.ZipFile(zip_path) as z:
+        for member in z.namelist():
+            if os.path.basename(member) in ("MTD_MSIL2A.xml", "MTD_MSIL1C.xml"):
+                match = _CLOUD_ASSESSMENT.search(z.read(member))
+                return float(match.group(1)) if match else None
+    return None
+
+
+def _bbox(coordinates):
+    xs, ys = coordinates[0::2], coordinates[1::2]
+    return (min(xs), min(ys), max(xs), max(ys)) if xs and ys else None
+
+
+def cdse_footprint(product):
+    """Bounding box of a CDSE OData product's GeoJSON or WKT footprint."""
+    geometry = product.get("GeoFootprint")
+    if geometry and geometry.get("coordinates"):
+        return _bbox([float(n) for n in _NUMBER.findall(str(geometry["coordinates"]))])
+    wkt = product.get("Footprint") or ""
+    wkt = wkt.split(";", 1)[-1]  # drop the SRID=4326; prefix
+    return _bbox([float(n) for n in _NUMBER.findall(wkt)])
+
+
+def _walk(roots):
+    for root in roots:
+        if os.path.isdir(root):
+            for dirpath, _, names in os.walk(root):
+                for name in sorted(names):
+                    yield os.path.join(dirpath, name)
+        elif os.path.exists(root):
+            yield root
+
+
+def _under(location, roots):
+    path = location[len("zip://"):].split("!", 1)[0] if location.startswith("zip://") else location
+    path = os.path.abspath(path)
+    return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+
+
+class Catalog:
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # One connection shared by the app's sessions, serialized by a lock.
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")  # the app reads while batch jobs index
+            self._db.execute("PRAGMA foreign_keys=ON")
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    # Writing
+    # -------------------------------------------------------------------------
+    def _upsert_scene(self, name, sensor=None, acquired=None, cloud_cover=None, footprint=None, exact=True):
+        db = self._db
+        db.execute(
+            """
+            INSERT INTO scenes (name, sensor, acquired, cloud_cover) VALUES (?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                sensor = coalesce(excluded.sensor, sensor),
+                acquired = coalesce(excluded.acquired, acquired),
+                cloud_cover = coalesce(excluded.cloud_cover, cloud_cover)
+            """,
+            (name, sensor, acquired, cloud_cover),
+        )
+        scene_id, was_exact = db.execute(
+            "SELECT id, footprint_exact FROM scenes WHERE name = ?", (name,)
+        ).fetchone()
+        if footprint is None or (was_exact and not exact):
+            return scene_id
+        west, south, east, north = footprint
+        current = db.execute(
+            "SELECT west, south, east, north FROM footprints WHERE id = ?", (scene_id,)
+        ).fetchone()
+        if current is not None and was_exact == exact:
+            # Bands of one scene may differ slightly (e.g. 10 m vs 20 m grids).
+            west, south = min(west, current[0]), min(south, current[1])
+            east, north = max(east, current[2]), max(north, current[3])
+        db.execute(
+            "INSERT OR REPLACE INTO footprints (id, west, east, south, north) VALUES (?, ?, ?, ?, ?)",
+            (scene_id, west, east, south, north),
+        )
+        db.execute("UPDATE scenes SET footprint_exact = ? WHERE id = ?", (int(exact), scene_id))
+        return scene_id
+
+    def _upsert_band(self, scene_id, band, source, location, **meta):
+        fields = ("crs", "resolution", "width", "height", "checksum", "size", "mtime")
+        self._db.execute(
+            f"""
+            INSERT INTO bands (scene_id, band, source, location, {", ".join(fields)})
+            VALUES (?, ?, ?, ?, {", ".join("?" for _ in fields)})
+            ON CONFLICT (scene_id, band, source) DO UPDATE SET
+                location = excluded.location,
+                {", ".join(f"{f} = excluded.{f}" for f in fields)}
+            """,
+            (scene_id, band, source, location, *(meta.get(f) for f in fields)),
+        )
+
+    def _remove_bands(self, band_ids):
+        db = self._db
+        for band_id in band_ids:
+            db.execute("DELETE FROM bands WHERE id = ?", (band_id,))
+        orphans = [row[0] for row in db.execute(
+            "SELECT id FROM scenes WHERE NOT EXISTS (SELECT 1 FROM bands WHERE scene_id = scenes.id)"
+        )]
+        for scene_id in orphans:
+            db.execute("DELETE FROM footprints WHERE id = ?", (scene_id,))
+            db.execute("DELETE FROM scenes WHERE id = ?", (scene_id,))
+
+    def _unchanged(self, location, stat):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime FROM bands WHERE source = 'local' AND location = ?", (location,)
+            ).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def _index_local_band(self, scene, role, location, stat, zip_path=None, member=None):
+        """Reads one band's metadata (outside the lock) and records it."""
+        info, footprint = _raster_info(location)
+        if zip_path is not None:
+            with zipfile.ZipFile(zip_path) as z:
+                checksum = f"crc32:{z.getinfo(member).CRC:08x}"
+        else:
+            checksum = _sha256(location)
+        cloud_cover = None
+        if role == "scl":
+            cloud_cover = _scl_cloud_cover(location)
+        elif zip_path is not None:
+            cloud_cover = _zip_cloud_cover(zip_path)
+        sensor, acquired = parse_scene_name(scene)
+        with self._lock, self._db:
+            scene_id = self._upsert_scene(scene, sensor, acquired, cloud_cover, footprint)
+            self._upsert_band(
+                scene_id, role, "local", location, checksum=checksum,
+                size=stat.st_size, mtime=stat.st_mtime, **info,
+            )
+
+    # Indexing
+    # -------------------------------------------------------------------------
+    def index_local(self, roots):
+        """
+        Indexes the bands under `roots` (directories, zips or band files),
+        named like the downloader's output (see safe_ro.core.batch). Returns
+        counts of indexed, unchanged, removed and failed bands.
+        """
+        from safe_ro.core.batch import band_role, zip_band_sources
+
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        seen = set()
+        with span("catalog.index"):
+            paths = list(_walk(roots))
+            # One file per scene band: as in batch.discover_scenes, a transcoded
+            # COG wins over the JPEG2000 it was made from.
+            loose = {}
+            for path in paths:
+                scene, role = band_role(os.path.basename(path))
+                if role is None or path.lower().endswith(".zip"):
+                    continue
+                kept = loose.get((scene, role))
+                if kept is None or not (kept.endswith(".tif") and not path.endswith(".tif")):
+                    loose[(scene, role)] = path
+
+            for path in paths:
+                stat = os.stat(path)
+                if path.lower().endswith(".zip"):
+                    try:
+                        members = zip_band_sources(path)
+                    except zipfile.BadZipFile:
+                        continue
+                    scene = os.path.splitext(os.path.basename(path))[0]
+                    bands = [(role, uri, uri.split("!", 1)[1]) for role, uri in members.items()]
+                    zip_path = path
+                else:
+                    scene, role = band_role(os.path.basename(path))
+                    if role is None or loose[(scene, role)] != path:
+                        continue
+                    bands = [(role, os.path.abspath(path), None)]
+                    zip_path = None
+                for role, location, member in bands:
+                    seen.add(location)
+                    if self._unchanged(location, stat):
+                        stats["unchanged"] += 1
+                        continue
+                    try:
+                        self._index_local_band(scene, role, location, stat, zip_path, member)
+                        stats["indexed"] += 1
+                    except Exception as e:
+                        record_error("catalog.index", f"Could not index {location}: {e}")
+                        stats["failed"] += 1
+
+            # Bands that vanished from the indexed directories.
+            abs_roots = [os.path.abspath(root) for root in roots]
+            with self._lock, self._db:
+                gone = [
+                    band_id for band_id, location in self._db.execute(
+                        "SELECT id, location FROM bands WHERE source = 'local'"
+                    )
+                    if location not in seen and _under(location, abs_roots)
+                ]
+                self._remove_bands(gone)
+            stats["removed"] = len(gone)
+        return stats
+
+    def index_drive(self, files, regions=None):
+        """
+        Indexes a Google Drive folder listing (GDriveClient.get_file_list()),
+        whose files are named "<region>_<product>_<BAND>.<ext>" by the cloud
+        sync. The listing is taken as complete: files no longer in it are dropped.
+        """
+        from safe_ro.core.batch import band_role
+        from safe_ro.core.regions import REGIONS
+
+        regions = REGIONS if regions is None else regions
+        seen = set()
+        with span("catalog.index"), self._lock, self._db:
+            for f in files:
+                title = f["title"]
+                region = next((r for r in regions if title.startswith(f"{r}_")), None)
+                scene, role = band_role(title[len(region) + 1:] if region else title)
+                if role is None:
+                    continue
+                location = f"gdrive:{f['id']}"
+                seen.add(location)
+                sensor, acquired = parse_scene_name(scene)
+                scene_id = self._upsert_scene(
+                    scene, sensor, acquired,
+                    footprint=tuple(regions[region]) if region else None, exact=False,
+                )
+                self._upsert_band(
+                    scene_id, role, "drive", location,
+                    checksum=f"md5:{f['md5Checksum']}" if f.get("md5Checksum") else None,
+                    size=int(f["fileSize"]) if f.get("fileSize") else None,
+                )
+            gone = [
+                band_id for band_id, location in self._db.execute(
+                    "SELECT id, location FROM bands WHERE source = 'drive'"
+                )
+                if location not in seen
+            ]
+            self._remove_bands(gone)
+        return len(seen)
+
+    def index_cdse(self, products):
+        """
+        Indexes CDSE OData product entries (searched with $expand=Attributes
+        for the cloud cover). Search results are partial views of the
+        archive, so nothing is dropped.
+        """
+        count = 0
+        with span("catalog.index"), self._lock, self._db:
+            for product in products:
+                name = product["Name"]
+                sensor, acquired = parse_scene_name(name)
+                if acquired is None and product.get("ContentDate", {}).get("Start"):
+                    acquired = product["ContentDate"]["Start"][:19] + "Z"
+                cloud_cover = next(
+                    (a["Value"] for a in product.get("Attributes", []) if a.get("Name") == "cloudCover"),
+                    None,
+                )
+                checksum = next(
+                    (f"{c['Algorithm'].lower()}:{c['Value']}" for c in product.get("Checksum", [])
+                     if c.get("Algorithm") and c.get("Value")),
+                    None,
+                )
+                scene_id = self._upsert_scene(
+                    name, sensor, acquired, cloud_cover, footprint=cdse_footprint(product)
+                )
+                for band in CDSE_BANDS.get(sensor, ()):
+                    self._upsert_band(
+                        scene_id, band, "cdse", f"cdse:{product['Id']}",
+                        checksum=checksum, size=product.get("ContentLength"),
+                    )
+                count += 1
+        return count
+
+    # Queries
+    # -------------------------------------------------------------------------
+    def find(self, bbox=None, bands=("red", "nir"), sensor=None, start=None, end=None,
+             max_cloud=None, sources=SOURCES, covering=True, limit=20):
+        """
+        Scenes that have all of `bands` (from any of `sources`), newest first.
+        `bbox` is [west, south, east, north] in WGS84; with `covering` the
+        scene's footprint must contain it, otherwise just intersect it.
+        `start`/`end` are ISO dates or times. Scenes of unknown cloud cover
+        never pass `max_cloud`.
+
+        Each scene is a dict with name, sensor, acquired, cloud_cover,
+        footprint and bands ({band: {"location", "source", "crs", ...}},
+        taking each band from the first of `sources` that has it).
+        """
+        bands, sources = tuple(bands), tuple(sources)
+        joins, clauses, params = "", [], []
+        if bbox is not None:
+            west, south, east, north = bbox
+            joins = "JOIN footprints f ON f.id = s.id"
+            clauses.append("f.west <= ? AND f.east >= ? AND f.south <= ? AND f.north >= ?")
+            params += [west, east, south, north] if covering else [east, west, north, south]
+        if sensor:
+            clauses.append("s.sensor = ?")
+            params.append(sensor)
+        if start:
+            clauses.append("s.acquired >= ?")
+            params.append(start)
+        if end:
+            clauses.append("s.acquired <= ?")
+            params.append(_end_of_day(end))
+        if max_cloud is not None:
+            clauses.append("s.cloud_cover <= ?")
+            params.append(max_cloud)
+        band_marks, source_marks = ", ".join("?" * len(bands)), ", ".join("?" * len(sources))
+        if bands:
+            clauses.append(
+                f"(SELECT count(DISTINCT b.band) FROM bands b WHERE b.scene_id = s.id"
+                f" AND b.band IN ({band_marks}) AND b.source IN ({source_marks})) = ?"
+            )
+            params += [*bands, *sources, len(bands)]
+        sql = (
+            f"SELECT s.id, s.name, s.sensor, s.acquired, s.cloud_cover FROM scenes s {joins}"
+            f" WHERE {' AND '.join(clauses) or '1'}"
+            " ORDER BY s.acquired IS NULL, s.acquired DESC, s.name LIMIT ?"
+        )
+        preference = {source: i for i, source in enumerate(sources)}
+        with span("catalog.query"), self._lock:
+            rows = self._db.execute(sql, (*params, limit)).fetchall()
+            scenes = []
+            for scene_id, name, scene_sensor, acquired, cloud_cover in rows:
+                footprint = self._db.execute(
+                    "SELECT west, south, east, north FROM footprints WHERE id = ?", (scene_id,)
+                ).fetchone()
+                found = {}
+                for row in self._db.execute(
+                    "SELECT band, source, location, crs, resolution, width, height, checksum, mtime"
+                    f" FROM bands WHERE scene_id = ? AND source IN ({source_marks})",
+                    (scene_id, *sources),
+                ):
+                    band = dict(zip(
+                        ("band", "source", "location", "crs", "resolution", "width", "height",
+                         "checksum", "mtime"), row,
+                    ))
+                    known = found.get(band["band"])
+                    if known is None or preference[band["source"]] < preference[known["source"]]:
+                        found[band["band"]] = band
+                scenes.append({
+                    "name": name, "sensor": scene_sensor, "acquired": acquired,
+                    "cloud_cover": cloud_cover, "footprint": list(footprint) if footprint else None,
+                    "bands": {band.pop("band"): band for band in found.values()},
+                })
+        return scenes
+
+    def latest(self, **query):
+        """The newest scene matching find(**query), or None."""
+        scenes = self.find(limit=1, **query)
+        return scenes[0] if scenes else None
+
+    def batch_scenes(self, products=("ndvi", "flood"), **query):
+        """
+        Local scenes matching `query` (see find) in the form run_batch takes
+        (see safe_ro.core.batch.discover_scenes).
+        """
+        wanted = {"ndvi": ("red", "nir"), "flood": ("vv",)}
+        scenes = []
+        for product in products:
+            for scene in self.find(bands=wanted[product], sources=("local",), limit=-1, **query):
+                sources = {band: info["location"] for band, info in scene["bands"].items()}
+                if product == "flood":
+                    sources = {"vv": sources["vv"]}
+                else:
+                    sources.pop("vv", None)
+                scenes.append({
+                    "id": scene["name"], "product": product, "sources": sources,
+                    "mtime": max(info["mtime"] or 0 for info in scene["bands"].values()),
+                })
+        return scenes
@@ -0,0 +1,107 @@
+"""
+Cloud-optimised GeoTIFF output: tiled, compressed, with internal overviews,
+so later reads of a window or of a preview (see safe_ro.core.progressive)
+only touch the blocks they need.
+"""
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import Affine
+
+from safe_ro.core.instrumentation import span
+
+BLOCKSIZE = 512
+
+
+def cog_profile(dtype, compress="deflate", resampling=None):
+    """GDAL COG driver creation options for a band of `dtype`."""
+    floating = np.issubdtype(np.dtype(dtype), np.floating)
+    return {
+        "driver": "COG",
+        "compress": compress.upper(),
+        "blocksize": BLOCKSIZE,
+        # Horizontal differencing makes smooth rasters compress far better.
+        "predictor": "3" if floating else "2",
+        "overviews": "AUTO",
+        "resampling": (resampling or ("AVERAGE" if floating else "NEAREST")).upper(),
+        "bigtiff": "IF_SAFER",
+    }
+
+
+class CogWriter:
+    """
+    Builds a single-band COG at `path` window by window, for results too large
+    to hold in memory at once. The GDAL COG driver only copies existing
+    datasets, so windows go to a plain tiled GeoTIFF staged next to the target
+    and are copied over when the block exits without an error. The final file
+    appears atomically: readers see either the previous output or the
+    complete new one.
+
+        with CogWriter(path, width, height, "float32", transform, crs) as out:
+            for window, block in results:
+                out.write(block, window)
+    """
+
+    def __init__(self, path, width, height, dtype, transform, crs, nodata=None,
+                 compress="deflate", resampling=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        if nodata is None and np.issubdtype(self.dtype, np.floating):
+            nodata = np.nan
+        self.compress = compress
+        self.resampling = resampling
+        self._stage_path = f"{path}.stage.tif"
+        self._part_path = f"{path}.part"
+        self._profile = {
+            "driver": "GTiff", "width": width, "height": height, "count": 1,
+            "dtype": self.dtype, "crs": crs, "transform": transform, "nodata": nodata,
+            "tiled": True, "blockxsize": BLOCKSIZE, "blockysize": BLOCKSIZE,
+        }
+        self._dst = None
+
+    def __enter__(self):
+        self._dst = rasterio.open(self._stage_path, "w", **self._profile)
+        return self
+
+    def write(self, block, window=None):
+        """Writes `block` at `window` (the whole raster if None)."""
+        self._dst.write(np.asarray(block, dtype=self.dtype), 1, window=window)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._dst.close()
+            if exc_type is None:
+                with span("cog.write"):
+                    rio_copy(
+                        self._stage_path, self._part_path,
+                        **cog_profile(self.dtype, self.compress, self.resampling),
+                    )
+                os.replace(self._part_path, self.path)
+        finally:
+            for leftover in (self._stage_path, self._part_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return False
+
+
+def write_cog(path, data, transform, crs, nodata=None, compress="deflate", resampling=None):
+    """Writes a single-band array to `path` as a COG (see CogWriter)."""
+    data = np.asarray(data)
+    with CogWriter(path, data.shape[1], data.shape[0], data.dtype, transform, crs,
+                   nodata=nodata, compress=compress, resampling=resampling) as out:
+        out.write(data)
+    return path
+
+
+def output_transform(band, shape):
+    """
+    The geotransform of a result of `shape` computed from `band`, which may
+    have been read at a different resolution (previews, mismatched bands).
+    """
+    height, width = band.shape
+    if (height, width) == tuple(shape):
+        return band.transform
+    return band.transform * Affine.scale(width / shape[1], height / shape[0])
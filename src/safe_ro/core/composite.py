@@ -0,0 +1,235 @@
+"""
+Cloud-free median composites from several Sentinel-2 L2A scenes of a region:
+
+    scenes = discover_composite_scenes(["data/archive/Iasi"])
+    summary = median_composite(scenes, "data/composites/Iasi_NDVI.tif")
+
+Every scene is read through a virtual warp onto one common grid (by default
+the first scene's 10 m grid), so scenes from different acquisitions, tiles
+or band resolutions line up pixel for pixel. The output is produced window
+by window: for each window, RED and NIR are read from every scene, pixels the
+scene classification (SCL) marks as cloud, cloud shadow, cirrus or nodata are
+masked, and the per-pixel nanmedian over the remaining observations gives the
+composite bands from which NDVI is computed. Windows are processed in a
+thread pool and written straight into a COG (see safe_ro.core.cog), so
+memory stays bounded by window size x number of scenes x workers instead of
+scene size x number of scenes.
+
+This is the local counterpart of the median composite GEEClient.get_ndvi
+builds server-side.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from safe_ro.core.band_math import BandMath
+from safe_ro.core.instrumentation import record_error, span
+
+DEFAULT_COMPOSITE_DIR = os.environ.get(
+    "SAFE_RO_COMPOSITE_DIR", os.path.join("data", "composites")
+)
+WINDOW_SIZE = 1024
+
+# L2A scene classification values that never count as a clear observation:
+# 0 nodata, 1 saturated/defective, 2 dark area/topographic shadow,
+# 3 cloud shadow, 8 cloud medium probability, 9 cloud high probability,
+# 10 thin cirrus.
+CLOUD_SCL = (0, 1, 2, 3, 8, 9, 10)
+
+
+def discover_composite_scenes(roots):
+    """
+    The scenes under `roots` with both RED and NIR bands, as
+    {"id", "sources"} dicts whose sources include "scl" when the scene
+    classification band is there (see safe_ro.core.batch.discover_scenes).
+    """
+    from safe_ro.core.batch import discover_scenes
+
+    return [
+        {"id": scene["id"], "sources": scene["sources"]}
+        for scene in discover_scenes(roots, products=("ndvi",))
+    ]
+
+
+def _reference_grid(source):
+    import rasterio
+
+    with rasterio.open(source) as src:
+        return {"crs": src.crs, "transform": src.transform, "width": src.width, "height": src.height}
+
+
+class _SceneReader:
+    """One scene's bands, opened on the composite grid. Not thread-safe."""
+
+    def __init__(self, sources, grid):
+        import rasterio
+        from rasterio.enums import Resampling
+        from rasterio.vrt import WarpedVRT
+
+        self._handles = []
+        self.bands = {}
+        for role in ("red", "nir", "scl"):
+            if role not in sources:
+                continue
+            src = rasterio.open(sources[role])
+            self._handles.append(src)
+            if (src.crs, src.transform, src.width, src.height) != (
+                grid["crs"], grid["transform"], grid["width"], grid["height"],
+            ):
+                # Nearest neighbour keeps reflectances and SCL classes as they are.
+                src = WarpedVRT(src, resampling=Resampling.nearest, nodata=0, **grid)
+                self._handles.append(src)
+            self.bands[role] = src
+
+    def read(self, role, window):
+        return self.bands[role].read(1, window=window)
+
+    def close(self):
+        for handle in reversed(self._handles):
+            handle.close()
+
+
+class _Readers:
+    """Per-thread scene readers: rasterio datasets must not be shared between threads."""
+
+    def __init__(self, scenes, grid):
+        self.scenes = scenes
+        self.grid = grid
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        readers = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = [_SceneReader(scene["sources"], self.grid) for scene in self.scenes]
+            self._local.readers = readers
+            with self._lock:
+                self._all.extend(readers)
+        return readers
+
+    def close(self):
+        for reader in self._all:
+            reader.close()
+
+
+def _windows(height, width, size):
+    from rasterio.windows import Window
+
+    for row in range(0, height, size):
+        for col in range(0, width, size):
+            yield Window(col, row, min(size, width - col), min(size, height - row))
+
+
+class MedianComposite:
+    _ndvi = BandMath("NDVI")
+
+    def __init__(self, scenes, grid=None, window_size=WINDOW_SIZE, workers=None):
+        """
+        `scenes` is a list of {"sources": {"red", "nir"[, "scl"]}} dicts (paths
+        or rasterio URIs). `grid` ({"crs", "transform", "width", "height"})
+        defaults to the first scene's RED band.
+        """
+        if not scenes:
+            raise ValueError("A composite needs at least one scene.")
+        self.scenes = scenes
+        self.grid = grid or _reference_grid(scenes[0]["sources"]["red"])
+        self.window_size = window_size
+        self.workers = workers or os.cpu_count()
+
+    def composite_window(self, readers, window):
+        """(ndvi, clear observation count) for one window of the grid."""
+        shape = (len(readers), int(window.height), int(window.width))
+        red = np.full(shape, np.nan, dtype=np.float32)
+        nir = np.full(shape, np.nan, dtype=np.float32)
+        for i, reader in enumerate(readers):
+            with span("composite.read"):
+                red_i = reader.read("red", window)
+                nir_i = reader.read("nir", window)
+                clear = (red_i > 0) & (nir_i > 0)
+                if "scl" in reader.bands:
+                    clear &= ~np.isin(reader.read("scl", window), CLOUD_SCL)
+            red[i][clear] = red_i[clear]
+            nir[i][clear] = nir_i[clear]
+
+        observations = np.isfinite(red).sum(axis=0, dtype=np.uint16)
+        with span("composite.median"):
+            # Pixels cloudy in every scene get a placeholder, so np.nanmedian
+            # sees no all-NaN slices, and are set back to NaN afterwards.
+            unobserved = observations == 0
+            red[0][unobserved] = nir[0][unobserved] = 0.0
+            red_median = np.nanmedian(red, axis=0)
+            nir_median = np.nanmedian(nir, axis=0)
+            red_median[unobserved] = nir_median[unobserved] = np.nan
+        ndvi = self._ndvi.evaluate(
+            {"RED": red_median, "NIR": nir_median}, zero_division=0.0, clip=(-1.0, 1.0)
+        )
+        return ndvi, observations
+
+    def write(self, out_path):
+        """
+        Writes the NDVI composite to `out_path` as a COG and returns a summary
+        with the grid size, the share of pixels that had at least one clear
+        observation and the mean number of clear observations per pixel.
+        """
+        from safe_ro.core.cog import CogWriter
+
+        grid = self.grid
+        readers = _Readers(self.scenes, grid)
+        pixels = covered = observations = 0
+        started = time.perf_counter()
+
+        def run(window):
+            return window, self.composite_window(readers.get(), window)
+
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        try:
+            with span("composite.write"), CogWriter(
+                out_path, grid["width"], grid["height"], np.float32, grid["transform"], grid["crs"],
+            ) as out, ThreadPoolExecutor(max_workers=self.workers) as pool:
+                windows = _windows(grid["height"], grid["width"], self.window_size)
+                pending = set()
+                while True:
+                    # Only a couple of windows per worker are in flight at once.
+                    for window in windows:
+                        pending.add(pool.submit(run, window))
+                        if len(pending) >= 2 * self.workers:
+                            break
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        window, (ndvi, counts) = future.result()
+                        out.write(ndvi, window)
+                        pixels += counts.size
+                        covered += int(np.count_nonzero(counts))
+                        observations += int(counts.sum())
+        finally:
+            readers.close()
+
+        return {
+            "output": out_path,
+            "scenes": len(self.scenes),
+            "width": grid["width"],
+            "height": grid["height"],
+            "crs": str(grid["crs"]),
+            "clear_fraction": covered / pixels if pixels else 0.0,
+            "mean_observations": observations / pixels if pixels else 0.0,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+
+def median_composite(scenes, out_path, window_size=WINDOW_SIZE, workers=None, grid=None):
+    """
+    Writes the cloud-masked median NDVI composite of `scenes` to `out_path`
+    (see MedianComposite). Returns the summary, or None on failure.
+    """
+    try:
+        return MedianComposite(scenes, grid=grid, window_size=window_size, workers=workers).write(out_path)
+    except Exception as e:
+        record_error("composite.write", f"Failed to composite {len(scenes)} scene(s): {e}")
+        return None
@@ -0,0 +1,176 @@
+"""
+Compact representations of NDVI results and flood masks.
+
+NDVI encodings (decoded value = stored * scale + offset):
+    "int16": scale 1e-4, offset 0, nodata -32768   (max error 5e-5)
+    "uint8": scale 0.01, offset -1, nodata 255     (max error 5e-3)
+
+Flood mask encodings (0 = dry, 1 = flooded):
+    "uint8":    one byte per pixel, nodata 255
+    "packbits": one bit per pixel via np.packbits; if the mask has nodata
+                pixels a second bit plane records which pixels are valid
+    "rle":      run-length encoding of the uint8 form (values + run lengths),
+                for transport of large, mostly uniform masks
+"""
+
+import base64
+
+import numpy as np
+
+NDVI_ENCODINGS = {
+    "int16": {"dtype": np.int16, "scale": 1e-4, "offset": 0.0, "nodata": -32768},
+    "uint8": {"dtype": np.uint8, "scale": 0.01, "offset": -1.0, "nodata": 255},
+}
+MASK_ENCODINGS = ("uint8", "packbits", "rle")
+MASK_NODATA = 255
+
+
+class EncodedRaster:
+    """
+    A compact raster payload plus everything needed to decode it. `kind` is
+    "ndvi" or "mask"; `parts` holds the encoded numpy arrays.
+    """
+
+    def __init__(self, kind, encoding, shape, parts, scale=1.0, offset=0.0, nodata=None):
+        self.kind = kind
+        self.encoding = encoding
+        self.shape = tuple(shape)
+        self.parts = parts
+        self.scale = scale
+        self.offset = offset
+        self.nodata = nodata
+
+    @property
+    def nbytes(self):
+        return sum(part.nbytes for part in self.parts.values())
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def decode(self):
+        """
+        Returns NDVI as float32 with NaN for nodata; masks as uint8 0/1, or as
+        float32 with NaN when the mask has nodata pixels.
+        """
+        if self.kind == "ndvi":
+            stored = self.parts["data"]
+            out = stored.astype(np.float32) * np.float32(self.scale) + np.float32(self.offset)
+            out[stored == self.nodata] = np.nan
+            return out
+
+        if self.encoding == "packbits":
+            count = self.size
+            mask = np.unpackbits(self.parts["bits"], count=count).reshape(self.shape)
+            if "valid" not in self.parts:
+                return mask
+            valid = np.unpackbits(self.parts["valid"], count=count).reshape(self.shape)
+            out = mask.astype(np.float32)
+            out[valid == 0] = np.nan
+            return out
+
+        if self.encoding == "rle":
+            stored = np.repeat(self.parts["values"], self.parts["lengths"]).reshape(self.shape)
+        else:
+            stored = self.parts["data"]
+        if not (stored == MASK_NODATA).any():
+            return stored.astype(np.uint8, copy=False)
+        out = stored.astype(np.float32)
+        out[stored == MASK_NODATA] = np.nan
+        return out
+
+    def to_dict(self):
+        """JSON-serializable form, with array parts base64-encoded."""
+        return {
+            "kind": self.kind,
+            "encoding": self.encoding,
+            "shape": list(self.shape),
+            "scale": self.scale,
+            "offset": self.offset,
+            "nodata": self.nodata,
+            "parts": {
+                name: {"dtype": part.dtype.str, "data": base64.b64encode(part.tobytes()).decode("ascii")}
+                for name, part in self.parts.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        parts = {
+            name: np.frombuffer(base64.b64decode(part["data"]), dtype=np.dtype(part["dtype"]))
+            for name, part in payload["parts"].items()
+        }
+        if "data" in parts:
+            parts["data"] = parts["data"].reshape(payload["shape"])
+        return cls(
+            payload["kind"],
+            payload["encoding"],
+            payload["shape"],
+            parts,
+            scale=payload["scale"],
+            offset=payload["offset"],
+            nodata=payload["nodata"],
+        )
+
+
+def encode_ndvi(ndvi, encoding="int16"):
+    """Quantizes a float NDVI array (NaN = nodata) into a scaled integer form."""
+    if encoding not in NDVI_ENCODINGS:
+        raise ValueError(f"Unknown NDVI encoding '{encoding}'. Choose from {sorted(NDVI_ENCODINGS)}.")
+    spec = NDVI_ENCODINGS[encoding]
+    nodata = np.isnan(ndvi)
+    scaled = (np.clip(ndvi, -1.0, 1.0) - spec["offset"]) / spec["scale"]
+    data = np.rint(scaled, out=scaled)
+    data[nodata] = spec["nodata"]
+    return EncodedRaster(
+        "ndvi",
+        encoding,
+        ndvi.shape,
+        {"data": data.astype(spec["dtype"])},
+        scale=spec["scale"],
+        offset=spec["offset"],
+        nodata=spec["nodata"],
+    )
+
+
+def encode_mask(mask, encoding="packbits"):
+    """Encodes a 0/1 mask; NaN (float masks from GEE) is treated as nodata."""
+    if encoding not in MASK_ENCODINGS:
+        raise ValueError(f"Unknown mask encoding '{encoding}'. Choose from {list(MASK_ENCODINGS)}.")
+    mask = np.asarray(mask)
+    nodata = np.isnan(mask) if mask.dtype.kind == "f" else None
+    flooded = np.nan_to_num(mask) > 0 if nodata is not None else mask > 0
+
+    if encoding == "packbits":
+        parts = {"bits": np.packbits(flooded, axis=None)}
+        if nodata is not None and nodata.any():
+            parts["valid"] = np.packbits(~nodata, axis=None)
+        return EncodedRaster("mask", encoding, mask.shape, parts, nodata=MASK_NODATA)
+
+    data = flooded.astype(np.uint8)
+    if nodata is not None:
+        data[nodata] = MASK_NODATA
+    if encoding == "uint8":
+        return EncodedRaster("mask", encoding, mask.shape, {"data": data}, nodata=MASK_NODATA)
+
+    flat = data.ravel()
+    # A run starts at the first pixel and wherever the value changes (none for an empty mask).
+    run_start = np.zeros(flat.size, dtype=bool)
+    run_start[:1] = True
+    np.not_equal(flat[1:], flat[:-1], out=run_start[1:])
+    starts = np.flatnonzero(run_start)
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    parts = {"values": flat[starts], "lengths": lengths}
+    return EncodedRaster("mask", encoding, mask.shape, parts, nodata=MASK_NODATA)
+
+
+def encode_result(data, kind, encoding):
+    """Encodes a processor/GEE result, passing through None and encoding=None."""
+    if data is None or encoding is None:
+        return data
+    return encode_ndvi(data, encoding) if kind == "ndvi" else encode_mask(data, encoding)
+
+
+def as_array(data):
+    """Decodes EncodedRaster inputs; plain arrays (and None) are returned unchanged."""
+    return data.decode() if isinstance(data, EncodedRaster) else data
@@ -0,0 +1,29 @@
+"""
+Advisory locks on files in a data directory, held while a process (or
+thread) rewrites an index that others may be updating too:
+
+    with file_lock(os.path.join(root, "cube.lock")):
+        meta = load(); meta["slices"].append(...); save(meta)
+
+Locks are fcntl.flock locks, so they are released when the holder exits,
+even if it crashes. Where fcntl is missing (Windows) they do nothing.
+"""
+
+from contextlib import contextmanager
+
+from safe_ro.core.instrumentation import span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on `path` (created if missing) for the block."""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            with span("file_lock.wait"):
+                fcntl.flock(f, fcntl.LOCK_EX)
+        yield
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from safe_ro.core.file_lock import file_lock
+from safe_ro.core.instrumentation import logger
+from safe_ro.core.safe_ro_core import RasterBand
+
+DEFAULT_BASELINE_DIR = os.environ.get(
+    "SAFE_RO_BASELINE_DIR", os.path.join("data", "s1_baselines")
+)
+# Region names become directory names: no separators, dots or leading spaces.
+REGION_NAME = re.compile(r"^\w[\w -]*$")
+STATS = {"count": np.uint16, "mean": np.float16, "std": np.float16}
+
+
+class BackscatterBaseline:
+    """
+    Per-pixel running mean and variance of dry-season Sentinel-1 VV backscatter
+    for one region, maintained with Welford updates.
+
+    The statistics live in memory-mapped .npy files: the observation count as
+    uint16, and mean and standard deviation as float16, i.e. 6 bytes per
+    pixel. Each new scene is folded in with a single streaming pass over row
+    blocks, so a scene never has to be held in memory in full.
+
+    If `to_db` is set, linear backscatter (e.g. CDSE GRD amplitudes) is
+    converted to decibels first, where water-induced drops are closer to
+    additive and the per-pixel distribution is closer to Gaussian. It also
+    keeps the statistics well inside float16 range.
+
+    Readers map the statistics read-only. update() writes the next version
+    of them to new files and switches to it by replacing baseline.json, so
+    readers never see a half-updated baseline. Concurrent updates (from
+    several threads or processes) take turns on a lock file in the region's
+    directory, so none of them loses another's scene.
+    """
+
+    MIN_OBSERVATIONS = 3
+
+    def __init__(self, region, root=DEFAULT_BASELINE_DIR, to_db=False):
+        if not REGION_NAME.match(region):
+            raise ValueError(f"Invalid baseline region name '{region}'.")
+        self.region = region
+        self.root = os.path.join(root, region)
+        self._meta_path = os.path.join(self.root, "baseline.json")
+        self._to_db = to_db
+        self._arrays = None
+        self._load_meta()
+
+    def _load_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        else:
+            meta = {"shape": None, "bounds": None, "to_db": self._to_db, "scenes": []}
+        if self._arrays is not None and meta.get("version") != self.meta.get("version"):
+            self._arrays = None
+        self.meta = meta
+
+    @property
+    def scenes(self):
+        return list(self.meta["scenes"])
+
+    def _path(self, name, version):
+        # Baselines written before versioning have unversioned files.
+        suffix = f".{version}" if version else ""
+        return os.path.join(self.root, f"{name}{suffix}.npy")
+
+    def _open(self):
+        """Memory-maps the current statistics read-only."""
+        if self._arrays is None:
+            if self.meta["shape"] is None:
+                raise ValueError(f"Baseline for '{self.region}' has no scenes yet.")
+            version = self.meta.get("version")
+            self._arrays = {
+                name: np.load(self._path(name, version), mmap_mode="r") for name in STATS
+            }
+        return self._arrays
+
+    def _stage(self, shape):
+        """Writable copies of the statistics under the next version (zeros on the first update)."""
+        version = (self.meta.get("version") or 0) + 1
+        os.makedirs(self.root, exist_ok=True)
+        staged = {}
+        for name, dtype in STATS.items():
+            arr = np.lib.format.open_memmap(self._path(name, version), mode="w+", dtype=dtype, shape=shape)
+            arr[:] = 0 if self.meta["shape"] is None else self._open()[name]
+            staged[name] = arr
+        return version, staged
+
+    def _prepare(self, block):
+        values = block.astype(np.float32, copy=True)
+        values[~np.isfinite(values)] = np.nan
+        if self.meta["to_db"]:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = 10.0 * np.log10(np.where(values > 0, values, np.nan))
+        return values
+
+    def update(self, source, scene_id=None, block_rows=1024):
+        """
+        Folds one dry-season scene (path or buffer) into the baseline. Pixels
+        that are zero/nodata in the scene leave their statistics untouched.
+        """
+        band = RasterBand(source)
+        scene_id = scene_id or band.name
+        os.makedirs(self.root, exist_ok=True)
+        # Updates from several processes are serialised, each staging from the
+        # version the previous one committed.
+        with file_lock(os.path.join(self.root, "baseline.lock")):
+            self._load_meta()
+            if scene_id in self.meta["scenes"]:
+                logger.info("[baseline] %s already in '%s' baseline; skipping", scene_id, self.region)
+                return False
+            self._fold_scene(band, scene_id, block_rows)
+        return True
+
+    def _fold_scene(self, band, scene_id, block_rows):
+        arrays = version = None
+        try:
+            for rows, block in band.iter_rows(block_rows):
+                if arrays is None:
+                    if self.meta["shape"] is not None and list(band.shape) != self.meta["shape"]:
+                        raise ValueError(
+                            f"Scene shape {band.shape} does not match baseline shape "
+                            f"{tuple(self.meta['shape'])} for region '{self.region}'."
+                        )
+                    version, arrays = self._stage(band.shape)
+                self._fold(arrays, rows, block)
+            for arr in arrays.values():
+                arr.flush()
+        except BaseException:
+            if version is not None:
+                self._remove(version)
+            raise
+        del arrays
+
+        previous = self.meta.get("version")
+        if self.meta["bounds"] is None:
+            b = band.bounds
+            self.meta["bounds"] = [b.left, b.bottom, b.right, b.top]
+        self.meta["shape"] = list(band.shape)
+        self.meta["version"] = version
+        self.meta["scenes"].append(scene_id)
+        self._save_meta()
+        self._arrays = None
+        # Readers that mapped the previous version keep it until they close it.
+        self._remove(previous)
+
+    def _remove(self, version):
+        for name in STATS:
+            try:
+                os.remove(self._path(name, version))
+            except OSError:
+                pass
+
+    def _fold(self, arrays, rows, block):
+        """Welford update of the staged statistics with one row block of a scene."""
+        x = self._prepare(block)
+        if not self.meta["to_db"]:
+            x[x == 0] = np.nan  # zero is the GRD fill value
+        valid = ~np.isnan(x)
+
+        n = arrays["count"][rows].astype(np.float32)
+        mean = arrays["mean"][rows].astype(np.float32)
+        m2 = np.square(arrays["std"][rows].astype(np.float32)) * n
+
+        # Welford: n' = n + 1, mean' = mean + d / n', M2' = M2 + d * (x - mean')
+        n_new = n + valid
+        delta = np.where(valid, x - mean, 0.0)
+        mean += np.divide(delta, n_new, out=np.zeros_like(delta), where=n_new > 0)
+        m2 += delta * np.where(valid, x - mean, 0.0)
+
+        var = np.divide(m2, n_new, out=np.zeros_like(m2), where=n_new > 0)
+        f16_max = np.finfo(np.float16).max
+        arrays["count"][rows] = np.minimum(n_new, np.iinfo(np.uint16).max)
+        arrays["mean"][rows] = np.clip(mean, -f16_max, f16_max)
+        arrays["std"][rows] = np.minimum(np.sqrt(np.maximum(var, 0.0)), f16_max)
+
+    def flag_drops(self, block, rows, k=2.0, min_drop=None):
+        """
+        Returns a uint8 mask for one row block of a new scene: 1 where the value
+        is more than `k` standard deviations (and, optionally, `min_drop` units)
+        below the baseline mean. Pixels with too few observations are never flagged.
+        """
+        arrays = self._open()
+        if block.shape[1] != self.meta["shape"][1]:
+            raise ValueError(
+                f"Scene width {block.shape[1]} does not match baseline width "
+                f"{self.meta['shape'][1]} for region '{self.region}'."
+            )
+        x = self._prepare(block)
+        n = arrays["count"][rows]
+        mean = arrays["mean"][rows].astype(np.float32)
+        std = arrays["std"][rows].astype(np.float32)
+
+        drop = mean - x
+        with np.errstate(invalid="ignore"):
+            flagged = (n >= self.MIN_OBSERVATIONS) & (drop > k * std)
+            if min_drop is not None:
+                flagged &= drop > min_drop
+        return flagged.astype(np.uint8)
+
+    def _save_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
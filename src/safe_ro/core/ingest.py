@@ -0,0 +1,138 @@
+"""
+Ingest-time transcoding of downloaded bands to Cloud-Optimized GeoTIFFs.
+
+Sentinel-2 bands arrive as JPEG2000, whose decoding dominates every read of
+them. Transcoding each band once at ingest into a tiled, compressed COG with
+overviews (see safe_ro.core.cog) moves that cost out of every later analysis:
+
+    cogs = transcode_bands(["T35_RED.jp2", "T35_NIR.jp2"])  # -> [..._RED.tif, ..._NIR.tif]
+
+Bands are decoded in parallel, one per worker thread (GDAL releases the GIL
+while decoding), and streamed through in row blocks, so memory stays at a
+few blocks per band. Every output is checked pixel for pixel against its
+source; a band that fails to transcode or verify keeps its original file.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from safe_ro.core.cog import BLOCKSIZE
+from safe_ro.core.instrumentation import count, record_error, span
+
+# Row blocks are a multiple of the COG block size, so each write fills whole tiles.
+BLOCK_ROWS = 2 * BLOCKSIZE
+
+
+def cog_path(path):
+    """Where the COG transcoded from `path` goes: next to it, as .tif."""
+    return os.path.splitext(path)[0] + ".tif"
+
+
+def _row_windows(height, width, block_rows=BLOCK_ROWS):
+    from rasterio.windows import Window
+
+    for r0 in range(0, height, block_rows):
+        yield Window(0, r0, width, min(block_rows, height - r0))
+
+
+def _digest(block):
+    return hashlib.blake2b(np.ascontiguousarray(block).tobytes(), digest_size=16).digest()
+
+
+def verify_identical(source, transcoded, block_rows=BLOCK_ROWS):
+    """
+    True if `transcoded` has the same georeferencing, data type, nodata and
+    pixel values as `source`, compared block by block.
+    """
+    import rasterio
+
+    with rasterio.open(source) as a, rasterio.open(transcoded) as b:
+        if (a.count, a.width, a.height, a.dtypes, a.crs, a.transform) != (
+            b.count, b.width, b.height, b.dtypes, b.crs, b.transform,
+        ):
+            return False
+        floating = np.issubdtype(np.dtype(a.dtypes[0]), np.floating)
+        # Float COGs without a source nodata get NaN (see CogWriter), which
+        # changes nothing about the pixels themselves.
+        if a.nodata is not None and not np.array_equal([a.nodata], [b.nodata], equal_nan=floating):
+            return False
+        for window in _row_windows(a.height, a.width, block_rows):
+            if not np.array_equal(a.read(window=window), b.read(window=window), equal_nan=floating):
+                return False
+    return True
+
+
+def transcode_band(path, out_path=None, compress="deflate", verify=True):
+    """
+    Transcodes the single-band raster at `path` to a COG at `out_path`
+    (default: cog_path(path)) and returns its path. Raises ValueError if the
+    output does not match the source pixel for pixel.
+    """
+    import rasterio
+
+    from safe_ro.core.cog import CogWriter
+
+    out_path = out_path or cog_path(path)
+    if os.path.abspath(out_path) == os.path.abspath(path):
+        raise ValueError(f"{path} is already a .tif; give an explicit out_path.")
+    digests = []
+    with span("ingest.transcode"), rasterio.open(path) as src:
+        if src.count != 1:
+            raise ValueError(f"{path} has {src.count} bands; expected one.")
+        georef = (src.width, src.height, src.dtypes[0], src.crs, src.transform)
+        with CogWriter(
+            out_path, src.width, src.height, src.dtypes[0], src.transform, src.crs,
+            nodata=src.nodata, compress=compress,
+        ) as out:
+            for window in _row_windows(src.height, src.width):
+                block = src.read(1, window=window)
+                digests.append(_digest(block))
+                out.write(block, window)
+
+    if verify:
+        # Checked against digests of the decoded blocks rather than the
+        # source itself, which would mean decoding the JPEG2000 twice.
+        with span("ingest.verify"), rasterio.open(out_path) as cog:
+            identical = (cog.width, cog.height, cog.dtypes[0], cog.crs, cog.transform) == georef and all(
+                _digest(cog.read(1, window=window)) == digest
+                for window, digest in zip(_row_windows(cog.height, cog.width), digests)
+            )
+        if not identical:
+            os.remove(out_path)
+            raise ValueError(f"Transcoded {out_path} does not match {path} pixel for pixel.")
+    return out_path
+
+
+def transcode_bands(paths, out_dir=None, workers=None, remove_source=False, compress="deflate",
+                    verify=True):
+    """
+    Transcodes `paths` in parallel, next to the originals or into `out_dir`,
+    and returns the resulting paths in the same order. Bands that fail keep
+    their original path (and file), so callers can always carry on with the
+    returned list. With `remove_source`, the originals of verified COGs are
+    deleted.
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    def run(path):
+        try:
+            out_path = cog_path(path if out_dir is None else os.path.join(out_dir, os.path.basename(path)))
+            out_path = transcode_band(path, out_path, compress=compress, verify=verify)
+        except Exception as e:
+            record_error("ingest.transcode", f"Keeping {path}; transcoding failed: {e}")
+            count("safe_ro_ingest_bands_total", status="failed")
+            return path
+        count("safe_ro_ingest_bands_total", status="ok")
+        if remove_source:
+            os.remove(path)
+        return out_path
+
+    with ThreadPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+        return list(pool.map(run, paths))
@@ -0,0 +1,270 @@
+"""
+Lightweight timing spans and counters for the processing stages.
+
+    with span("ndvi.index"):
+        ...
+    count("safe_ro_gee_requests_total", source="cache")
+    record_error("gee.ndvi", "No Sentinel-2 images found")
+
+Every span feeds a per-stage duration histogram and, if a trace is active in
+the current context (see begin_trace), the trace's list of
+(stage, seconds, ok) entries. The registry renders itself in the Prometheus
+text exposition format, so no client library is needed.
+
+Profiling (profile_call) is off unless SAFE_RO_PROFILE=1. When it is on,
+calls slower than SAFE_RO_PROFILE_SLOW_MS (default 1000) leave a cProfile
+dump and the top tracemalloc allocation sites in SAFE_RO_PROFILE_DIR
+(default data/profiles).
+"""
+
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger("safe_ro")
+
+# Upper bounds, in seconds, of the stage duration histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+STAGE_METRIC = "safe_ro_stage_seconds"
+ERROR_METRIC = "safe_ro_stage_errors_total"
+
+PROFILE_ENABLED = os.environ.get("SAFE_RO_PROFILE", "") not in ("", "0")
+PROFILE_SLOW_MS = float(os.environ.get("SAFE_RO_PROFILE_SLOW_MS", "1000"))
+PROFILE_DIR = os.environ.get("SAFE_RO_PROFILE_DIR", os.path.join("data", "profiles"))
+
+_trace = ContextVar("safe_ro_trace", default=None)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Registry:
+    """Thread-safe store of stage histograms and labelled counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}  # stage -> {"buckets", "sum", "count", "max", "last"}
+            self._counters = {}  # (name, sorted label items) -> value
+            self.recent = deque(maxlen=200)
+
+    def observe(self, stage, seconds, ok=True):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "max": 0.0, "last": 0.0}
+                self._stages[stage] = stats
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][i] += 1
+                    break
+            stats["sum"] += seconds
+            stats["count"] += 1
+            stats["max"] = max(stats["max"], seconds)
+            stats["last"] = seconds
+            self.recent.append((stage, seconds, ok))
+        if not ok:
+            self.inc(ERROR_METRIC, stage=stage)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def stage_summary(self):
+        """{stage: {"count", "total_s", "mean_s", "max_s", "last_s", "errors"}}"""
+        with self._lock:
+            stages = {stage: dict(stats) for stage, stats in self._stages.items()}
+        return {
+            stage: {
+                "count": s["count"],
+                "total_s": s["sum"],
+                "mean_s": s["sum"] / s["count"],
+                "max_s": s["max"],
+                "last_s": s["last"],
+                "errors": self.counter(ERROR_METRIC, stage=stage),
+            }
+            for stage, s in sorted(stages.items())
+        }
+
+    def render_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            stages = {stage: dict(stats, buckets=list(stats["buckets"])) for stage, stats in self._stages.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            f"# HELP {STAGE_METRIC} Duration of instrumented processing stages.",
+            f"# TYPE {STAGE_METRIC} histogram",
+        ]
+        for stage, s in sorted(stages.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s["buckets"]):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{STAGE_METRIC}_bucket{_labels_text((('stage', stage), ('le', le)))} {cumulative}")
+            lines.append(f"{STAGE_METRIC}_sum{_labels_text((('stage', stage),))} {s['sum']:.6f}")
+            lines.append(f"{STAGE_METRIC}_count{_labels_text((('stage', stage),))} {s['count']}")
+
+        names = sorted({name for name, _ in counters})
+        for name in names:
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{name}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as `stage`; exceptions are counted and re-raised."""
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        REGISTRY.observe(stage, seconds, ok)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, seconds, ok))
+        logger.debug("%s took %.1f ms%s", stage, seconds * 1000, "" if ok else " (failed)")
+
+
+def timed(stage):
+    """Decorator form of span()."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def record_error(stage, message):
+    """Logs a handled error and counts it against `stage`."""
+    REGISTRY.inc(ERROR_METRIC, stage=stage)
+    logger.error("[%s] %s", stage, message)
+
+
+def begin_trace():
+    """
+    Starts collecting the spans run in the current context (a request, a
+    Streamlit script run) and returns the list they are appended to.
+    """
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def render_prometheus():
+    return REGISTRY.render_prometheus()
+
+
+def stage_summary():
+    return REGISTRY.stage_summary()
+
+
+# -----------------------------------------------------------------------------
+# Profiling
+# -----------------------------------------------------------------------------
+# tracemalloc is process-wide, so only one call is profiled at a time.
+_profile_lock = threading.Lock()
+
+
+def _dump_profile(name, seconds, profiler, snapshot, peak):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
+    label = name.strip("/").replace("/", "_") or "root"
+    stem = os.path.join(PROFILE_DIR, f"{stamp}_{label}_{seconds * 1000:.0f}ms")
+    profiler.dump_stats(f"{stem}.prof")
+    with open(f"{stem}.tracemalloc.txt", "w") as f:
+        f.write(f"{name}: {seconds:.3f} s, traced peak {peak / 1e6:.1f} MB\n\n")
+        for stat in snapshot.statistics("lineno")[:25]:
+            f.write(f"{stat}\n")
+    logger.warning("Slow call %s (%.0f ms); profile written to %s.*", name, seconds * 1000, stem)
+    return stem
+
+
+def profile_call(name, fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs); with profiling enabled, under cProfile and
+    tracemalloc, keeping the dumps only if the call was slow.
+    """
+    if not PROFILE_ENABLED or not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs)
+    import cProfile
+    import tracemalloc
+
+    try:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            if seconds * 1000 >= PROFILE_SLOW_MS:
+                _, peak = tracemalloc.get_traced_memory()
+                _dump_profile(name, seconds, profiler, tracemalloc.take_snapshot(), peak)
+                count("safe_ro_profiles_written_total")
+            if started_tracing:
+                tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+
+
+def profiled(name):
+    """
+    Decorator for request handlers: profiles each call when SAFE_RO_PROFILE is
+    set. Applied to the handler itself rather than as HTTP middleware because
+    synchronous FastAPI handlers run on worker threads, and cProfile only sees
+    the thread it was started in.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return profile_call(name, fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
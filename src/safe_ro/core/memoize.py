@@ -0,0 +1,152 @@
+"""
+Disk memoization of the core processors' results, shared by every process
+(batch runs, API workers, Streamlit) that uses the same directory.
+
+    key = MEMO.key("ndvi", {"red": red_path, "nir": nir_path}, version=1, downsample_factor=2)
+    ndvi = MEMO.load(key)            # None on a miss
+    MEMO.save(key, ndvi, transform, crs)
+
+Results are keyed by a hash of the inputs' identities, the processing
+parameters and the algorithm version. Files are identified by absolute path,
+modification time and size (see core.singleflight), in-memory buffers (e.g.
+Streamlit uploads) by a hash of their bytes. Sources that cannot be
+identified, such as streams or remote URLs, make a call uncacheable (key()
+returns None).
+
+Each result is a compressed COG written with core.cog. It is staged under a
+unique name and renamed into place, so concurrent writers and readers never
+see a partial file. A hit refreshes the file's modification time. When the
+directory grows past SAFE_RO_MEMO_MB, the least recently used results are
+deleted.
+
+Set SAFE_RO_MEMO=0 to disable memoization.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+import rasterio
+from rasterio.errors import RasterioError
+
+from safe_ro.core.cog import write_cog
+from safe_ro.core.instrumentation import count, logger, span
+from safe_ro.core.memory_budget import MB
+from safe_ro.core.singleflight import _normalize
+
+ENABLED = os.environ.get("SAFE_RO_MEMO", "1") not in ("", "0")
+DEFAULT_MEMO_DIR = os.environ.get("SAFE_RO_MEMO_DIR", os.path.join("data", "memo"))
+MAX_MB = float(os.environ.get("SAFE_RO_MEMO_MB", "2048"))
+# Staged files older than this are left over from a crashed writer.
+STALE_SECONDS = 3600.0
+METRIC = "safe_ro_memo_total"
+
+
+def source_identity(source):
+    """A JSON-able identity of a raster source, or None if it has none."""
+    if isinstance(source, (str, os.PathLike)):
+        identity = _normalize(source)
+        return identity if isinstance(identity, dict) else None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buffer = memoryview(source)
+    elif hasattr(source, "getbuffer"):
+        buffer = memoryview(source.getbuffer())  # also rasterio MemoryFiles
+    else:
+        return None
+    try:
+        with span("memo.hash"):
+            digest = hashlib.blake2b(buffer.cast("B"), digest_size=20).hexdigest()
+        return {"blake2b": digest, "size": buffer.nbytes}
+    finally:
+        buffer.release()
+
+
+class DiskMemo:
+    def __init__(self, root=DEFAULT_MEMO_DIR, max_bytes=None):
+        self.root = root
+        self.max_bytes = MAX_MB * MB if max_bytes is None else max_bytes
+
+    def key(self, operation, sources, **params):
+        """The key of `operation` on `sources` ({role: source}), or None if uncacheable."""
+        identities = {}
+        for role, source in sources.items():
+            identities[role] = source_identity(source)
+            if identities[role] is None:
+                return None
+        payload = json.dumps([operation, identities, params], sort_keys=True, default=repr)
+        return f"{operation}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.tif")
+
+    def load(self, key):
+        """The memoized array of `key`, or None."""
+        operation = key.split("-", 1)[0]
+        path = self._path(key)
+        try:
+            with span("memo.load"), rasterio.open(path) as src:
+                data = src.read(1)
+            os.utime(path)  # most recently used
+        except (OSError, RasterioError):
+            # Missing, or evicted by another process while we opened it.
+            count(METRIC, operation=operation, result="miss")
+            return None
+        count(METRIC, operation=operation, result="hit")
+        return data
+
+    def save(self, key, data, transform, crs):
+        """Stores `data` under `key`; failures are logged and otherwise ignored."""
+        os.makedirs(self.root, exist_ok=True)
+        staged = os.path.join(self.root, f"{key}.{uuid.uuid4().hex}.tmp.tif")
+        try:
+            with span("memo.save"):
+                write_cog(staged, np.asarray(data), transform, crs)
+                os.replace(staged, self._path(key))
+        except Exception as e:
+            logger.warning("[memo] could not store %s: %s", key, e)
+            if os.path.exists(staged):
+                os.remove(staged)
+            return
+        count(METRIC, operation=key.split("-", 1)[0], result="stored")
+        self._evict()
+
+    def _evict(self):
+        """Deletes least recently used results while the directory is over the size cap."""
+        now = time.time()
+        entries = []
+        for path in glob.glob(os.path.join(self.root, "*.tif")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if ".tmp." in os.path.basename(path):
+                if now - stat.st_mtime > STALE_SECONDS:
+                    _remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Readers that already opened the file keep it until they close it.
+            _remove(path)
+            total -= size
+            evicted += 1
+            count(METRIC, operation=os.path.basename(path).split("-", 1)[0], result="evicted")
+        if evicted:
+            logger.info("[memo] evicted %d result(s); %.0f MB kept", evicted, total / MB)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # already removed by another process
+
+
+MEMO = DiskMemo() if ENABLED else None
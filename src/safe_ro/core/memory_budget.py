@@ -0,0 +1,105 @@
+"""
+Memory budget guard for the core processors.
+
+Before reading a scene, a processor estimates its peak memory from the
+dataset's metadata (shape and data type) for each way it can run, and
+plan() picks the first that fits SAFE_RO_MEMORY_BUDGET_MB:
+
+    full        everything in memory (fastest)
+    windowed    streamed block by block; only the result is held in full
+    downsample  a reduced-resolution result, with a warning
+    reject      MemoryBudgetExceeded, before anything is read
+
+    chosen = plan("flood.detect", {"full": 3.1e9, "windowed": 4.2e8},
+                  scaled=lambda factor: 3.1e9 / factor**2)
+
+Every decision is logged with its estimate and counted in
+safe_ro_memory_strategy_total{operation,strategy}, so budgets can be tuned
+per deployment. A budget of 0 disables the guard.
+"""
+
+import os
+from typing import NamedTuple
+
+from safe_ro.core.instrumentation import count, logger
+
+MB = 1024 * 1024
+BUDGET_MB = float(os.environ.get("SAFE_RO_MEMORY_BUDGET_MB", "2048"))
+# Coarsest automatic downsampling before a request is rejected instead.
+MAX_DOWNSAMPLE = int(os.environ.get("SAFE_RO_MEMORY_MAX_DOWNSAMPLE", "8"))
+METRIC = "safe_ro_memory_strategy_total"
+
+# Bytes per pixel of the encoded copies made by safe_ro.core.encodings.
+ENCODED_BYTES = {None: 0, "int16": 2, "uint8": 1, "packbits": 1 / 8, "rle": 1}
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """A request would need more memory than the budget, even downsampled."""
+
+    def __init__(self, operation, estimate, budget):
+        super().__init__(
+            f"{operation} would need about {estimate / MB:.0f} MB even at 1/{MAX_DOWNSAMPLE} "
+            f"resolution, over the {budget / MB:.0f} MB memory budget."
+        )
+        self.operation = operation
+        self.estimate = estimate
+        self.budget = budget
+
+
+class MemoryPlan(NamedTuple):
+    operation: str
+    strategy: str  # "full", "windowed" or "downsample"
+    estimate: float  # bytes
+    budget: float  # bytes, 0 = unlimited
+    downsample_factor: int = 1
+
+
+def budget_bytes():
+    return BUDGET_MB * MB
+
+
+def plan(operation, estimates, scaled=None, budget=None):
+    """
+    Picks how to run `operation`. `estimates` maps strategies to their peak
+    bytes, in order of preference; `scaled(factor)` estimates a run at
+    1/factor resolution, for automatic downsampling. Raises
+    MemoryBudgetExceeded if nothing fits.
+    """
+    budget = budget_bytes() if budget is None else budget
+    strategy, estimate = next(iter(estimates.items()))
+    chosen = None
+    if budget <= 0:
+        chosen = MemoryPlan(operation, strategy, estimate, budget)
+    else:
+        for strategy, estimate in estimates.items():
+            if estimate <= budget:
+                chosen = MemoryPlan(operation, strategy, estimate, budget)
+                break
+        else:
+            for factor in range(2, MAX_DOWNSAMPLE + 1) if scaled else ():
+                if scaled(factor) <= budget:
+                    chosen = MemoryPlan(operation, "downsample", scaled(factor), budget, factor)
+                    break
+
+    if chosen is None:
+        count(METRIC, operation=operation, strategy="reject")
+        logger.warning(
+            "[memory] %s: rejected; needs ~%.0f MB (%s) over the %.0f MB budget",
+            operation, min(estimates.values()) / MB, ", ".join(estimates), budget / MB,
+        )
+        raise MemoryBudgetExceeded(operation, scaled(MAX_DOWNSAMPLE) if scaled else estimate, budget)
+
+    count(METRIC, operation=operation, strategy=chosen.strategy)
+    if chosen.strategy == "downsample":
+        logger.warning(
+            "[memory] %s: downsampling 1/%d to fit the %.0f MB budget (~%.0f MB; full needs ~%.0f MB)",
+            operation, chosen.downsample_factor, budget / MB, chosen.estimate / MB,
+            min(estimates.values()) / MB,
+        )
+    else:
+        logger.info(
+            "[memory] %s: %s, ~%.0f MB of %s budget",
+            operation, chosen.strategy, chosen.estimate / MB,
+            f"{budget / MB:.0f} MB" if budget > 0 else "an unlimited",
+        )
+    return chosen
@@ -0,0 +1,226 @@
+import datetime
+import json
+import os
+import uuid
+
+import numpy as np
+
+from safe_ro.core.encodings import as_array
+from safe_ro.core.file_lock import file_lock
+
+DEFAULT_CUBE_DIR = os.environ.get("SAFE_RO_CUBE_DIR", os.path.join("data", "ndvi_cubes"))
+
+
+def _bounds_list(bounds):
+    """Normalizes rasterio BoundingBox and GEE [w, s, e, n] lists to a plain list."""
+    if hasattr(bounds, "left"):
+        return [bounds.left, bounds.bottom, bounds.right, bounds.top]
+    return [float(b) for b in bounds]
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+class NDVICube:
+    """
+    On-disk (time x y x x) NDVI stack for one region.
+
+    Every appended scene is stored as its own int16 .npy slice (NDVI * SCALE,
+    NODATA for missing pixels), which halves the footprint of float32 while
+    keeping the file memory-mappable. Queries walk the cube in blocks of
+    CHUNK_ROWS rows and accumulate over the slices, so memory stays bounded
+    by one block regardless of how many scenes the cube holds.
+    """
+
+    SCALE = 10000
+    NODATA = -32768
+    CHUNK_ROWS = 512
+
+    def __init__(self, region, root=DEFAULT_CUBE_DIR):
+        self.region = region
+        self.root = os.path.join(root, region)
+        self._meta_path = os.path.join(self.root, "cube.json")
+        self._load_meta()
+
+    # -------------------------------------------------------------------------
+    # Writing
+    # -------------------------------------------------------------------------
+    def append(self, ndvi, bounds, acquired):
+        """
+        Adds one NDVI result (from NDVIProcessor or GEEClient) acquired on the
+        given date. Re-appending a date replaces that slice. Several processes
+        (e.g. dashboard sessions) may append to the same region at once.
+        """
+        acquired = _to_date(acquired)
+        ndvi = as_array(ndvi)
+        shape = list(ndvi.shape)
+        self._check_shape(shape)
+
+        os.makedirs(self.root, exist_ok=True)
+        name = f"{acquired.isoformat()}.npy"
+        tmp_path = os.path.join(self.root, f".{name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int16, shape=ndvi.shape)
+        for r0 in range(0, ndvi.shape[0], self.CHUNK_ROWS):
+            block = ndvi[r0 : r0 + self.CHUNK_ROWS]
+            encoded = np.rint(np.clip(block, -1.0, 1.0) * self.SCALE)
+            encoded[np.isnan(encoded)] = self.NODATA
+            out[r0 : r0 + self.CHUNK_ROWS] = encoded
+        out.flush()
+        del out
+
+        try:
+            with file_lock(os.path.join(self.root, "cube.lock")):
+                # Merge with whatever other writers committed since we loaded the index.
+                self._load_meta()
+                self._check_shape(shape)
+                if self.meta["shape"] is None:
+                    self.meta["shape"] = shape
+                    self.meta["bounds"] = _bounds_list(bounds)
+                os.replace(tmp_path, os.path.join(self.root, name))
+                slices = [s for s in self.meta["slices"] if s["date"] != acquired.isoformat()]
+                slices.append({"date": acquired.isoformat(), "file": name})
+                self.meta["slices"] = sorted(slices, key=lambda s: s["date"])
+                self._save_meta()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _check_shape(self, shape):
+        if self.meta["shape"] is not None and self.meta["shape"] != shape:
+            raise ValueError(
+                f"NDVI shape {tuple(shape)} does not match cube shape "
+                f"{tuple(self.meta['shape'])} for region '{self.region}'."
+            )
+
+    def _load_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"shape": None, "bounds": None, "slices": []}
+
+    def _save_meta(self):
+        tmp_path = f"{self._meta_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    # -------------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------------
+    @property
+    def dates(self):
+        return [_to_date(s["date"]) for s in self.meta["slices"]]
+
+    @property
+    def bounds(self):
+        return self.meta["bounds"]
+
+    def __len__(self):
+        return len(self.meta["slices"])
+
+    def _open_slices(self, dates=None):
+        wanted = None if dates is None else {_to_date(d) for d in dates}
+        return [
+            (_to_date(s["date"]), np.load(os.path.join(self.root, s["file"]), mmap_mode="r"))
+            for s in self.meta["slices"]
+            if wanted is None or _to_date(s["date"]) in wanted
+        ]
+
+    def _open_slice(self, date):
+        slices = self._open_slices([date])
+        if not slices:
+            raise KeyError(f"No NDVI slice for {date} in region '{self.region}'.")
+        return slices[0][1]
+
+    def _decode(self, block):
+        out = block.astype(np.float32)
+        out[block == self.NODATA] = np.nan
+        out /= self.SCALE
+        return out
+
+    def _row_blocks(self):
+        for r0 in range(0, self.meta["shape"][0], self.CHUNK_ROWS):
+            yield slice(r0, min(r0 + self.CHUNK_ROWS, self.meta["shape"][0]))
+
+    def read(self, date):
+        """Returns one slice as float32 NDVI with NaN for missing pixels."""
+        return self._decode(np.asarray(self._open_slice(date)))
+
+    def mean(self, dates=None):
+        """Per-pixel mean NDVI over the selected slices (all by default)."""
+        slices = self._open_slices(dates)
+        result = np.full(self.meta["shape"], np.nan, dtype=np.float32)
+        for rows in self._row_blocks():
+            total = np.zeros((rows.stop - rows.start, self.meta["shape"][1]), np.float64)
+            count = np.zeros_like(total)
+            for _, data in slices:
+                values = self._decode(data[rows])
+                valid = ~np.isnan(values)
+                total[valid] += values[valid]
+                count += valid
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[rows] = total / count
+        return result
+
+    def trend(self, dates=None):
+        """Per-pixel least-squares NDVI slope, in NDVI units per year."""
+        slices = self._open_slices(dates)
+        if not slices:
+            return np.full(self.meta["shape"], np.nan, dtype=np.float32)
+        origin = slices[0][0]
+        result = np.full(self.meta["shape"], np.nan, dtype=np.float32)
+        for rows in self._row_blocks():
+            shape = (rows.stop - rows.start, self.meta["shape"][1])
+            n, st, sy, stt, sty = (np.zeros(shape, np.float64) for _ in range(5))
+            for date, data in slices:
+                t = (date - origin).days / 365.25
+                values = self._decode(data[rows])
+                valid = ~np.isnan(values)
+                y = np.where(valid, values, 0.0)
+                n += valid
+                st += valid * t
+                stt += valid * t * t
+                sy += y
+                sty += y * t
+            denom = n * stt - st * st
+            with np.errstate(invalid="ignore", divide="ignore"):
+                slope = (n * sty - st * sy) / denom
+            slope[(n < 2) | (denom == 0)] = np.nan
+            result[rows] = slope
+        return result
+
+    def anomaly(self, date, baseline_dates=None):
+        """
+        Z-score of the NDVI on `date` against the per-pixel mean and standard
+        deviation of the baseline slices (all other slices by default).
+        """
+        date = _to_date(date)
+        if baseline_dates is None:
+            baseline_dates = [d for d in self.dates if d != date]
+        baseline = self._open_slices(baseline_dates)
+        target = self._open_slice(date)
+
+        result = np.full(self.meta["shape"], np.nan, dtype=np.float32)
+        for rows in self._row_blocks():
+            shape = (rows.stop - rows.start, self.meta["shape"][1])
+            n, s, ss = (np.zeros(shape, np.float64) for _ in range(3))
+            for _, data in baseline:
+                values = self._decode(data[rows])
+                valid = ~np.isnan(values)
+                y = np.where(valid, values, 0.0)
+                n += valid
+                s += y
+                ss += y * y
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = s / n
+                std = np.sqrt(np.maximum(ss / n - mean * mean, 0.0))
+                z = (self._decode(target[rows]) - mean) / std
+            z[(n < 2) | (std == 0)] = np.nan
+            result[rows] = z
+        return result
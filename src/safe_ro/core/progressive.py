@@ -0,0 +1,165 @@
+"""
+Progressive results: a coarse preview right away, full resolution later.
+
+    job = ProgressiveJob(lambda f: proc.compute_ndvi(downsample_factor=f), proc.red_band.probe())
+    show(job.preview)            # 1/4 or 1/8 resolution
+    show(job.result())           # blocks until the full-resolution run is done
+
+The preview is computed synchronously from decimated reads; the full run
+starts on a shared background pool as soon as the preview is out. Jobs can be
+registered under an id so API clients can poll for the refined result.
+
+Registered jobs are kept until SAFE_RO_JOB_TTL seconds pass without a poll.
+When their arrays add up to more than SAFE_RO_JOB_MB, the least recently
+polled jobs are dropped first. Callers release() a job's arrays once they
+have built what they keep from them, e.g. the API's final response.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from safe_ro.core.instrumentation import span
+
+# Scenes up to this many pixels on their longer side are fast enough to skip the preview.
+PREVIEW_MIN_SIDE = 2048
+# Above this, previews are read at 1/8 instead of 1/4 resolution.
+PREVIEW_FINE_MAX_SIDE = 8192
+# Registered jobs are dropped after this many seconds without a poll...
+JOB_TTL = float(os.environ.get("SAFE_RO_JOB_TTL", "600"))
+# ...or, least recently polled first, while they hold more than this.
+MAX_JOB_MB = float(os.environ.get("SAFE_RO_JOB_MB", "512"))
+
+
+def preview_factor(shape):
+    """Decimation factor for a preview of a raster of `shape` (1 = no preview)."""
+    side = max(shape)
+    if side <= PREVIEW_MIN_SIDE:
+        return 1
+    return 4 if side <= PREVIEW_FINE_MAX_SIDE else 8
+
+
+class ProgressiveJob:
+    """
+    Runs `run(downsample_factor)`, a processor call returning (data, bounds),
+    at `factor` (chosen from `shape` if not given), then at full resolution
+    in the background. Keyword arguments are kept in `meta` for the caller.
+    """
+
+    # Shared by all jobs so concurrent requests never pile up unbounded threads.
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refine")
+
+    def __init__(self, run, shape=None, factor=None, **meta):
+        self.id = uuid.uuid4().hex
+        self.meta = meta
+        self.released = False
+        # Held by callers that read the arrays and may release them (see release()).
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+        self._kept_nbytes = 0
+        self.factor = factor or (preview_factor(shape) if shape else 1)
+        if self.factor == 1:
+            # Small scene: the full result is the preview.
+            with span("progressive.full"):
+                self.preview, self.bounds = run(1)
+            self._future = None
+            return
+        with span("progressive.preview"):
+            self.preview, self.bounds = run(self.factor)
+        self._future = self._executor.submit(self._refine, run)
+
+    @staticmethod
+    def _refine(run):
+        with span("progressive.full"):
+            return run(1)
+
+    @property
+    def done(self):
+        return self._future is None or self._future.done()
+
+    @property
+    def failed(self):
+        return self.done and self.error is not None
+
+    @property
+    def error(self):
+        """The exception raised by the full-resolution run, if it failed."""
+        if self._future is None or not self._future.done():
+            return None
+        return self._future.exception()
+
+    def result(self, timeout=None):
+        """Full-resolution (data, bounds); blocks until the background run finishes."""
+        if self.released:
+            raise RuntimeError(f"The results of job {self.id} were released.")
+        if self._future is None:
+            return self.preview, self.bounds
+        return self._future.result(timeout)
+
+    def latest(self):
+        """(data, bounds, is_full): the full result once available, else the preview."""
+        if self.done and not self.failed:
+            data, bounds = self.result()
+            return data, bounds, True
+        return self.preview, self.bounds, False
+
+    def release(self, kept_nbytes=0):
+        """
+        Drops the preview and full-resolution arrays once the job is done.
+        `kept_nbytes` is the size of what the caller keeps instead (e.g. an
+        encoded payload in `meta`), still counted against SAFE_RO_JOB_MB.
+        """
+        if not self.done:
+            raise RuntimeError(f"Job {self.id} is still running.")
+        self.preview = None
+        self._future = None
+        self.released = True
+        self._kept_nbytes = kept_nbytes
+
+    @property
+    def nbytes(self):
+        """Bytes of the arrays the job holds."""
+        arrays = [self.preview]
+        if self._future is not None and self._future.done() and self._future.exception() is None:
+            arrays.append(self._future.result()[0])
+        return self._kept_nbytes + sum(getattr(a, "nbytes", 0) for a in arrays)
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _prune(now):
+    """Drops expired jobs, then the least recently polled while over MAX_JOB_MB."""
+    for job_id, job in list(_jobs.items()):
+        if now - job.last_access > JOB_TTL:
+            del _jobs[job_id]
+    total = sum(job.nbytes for job in _jobs.values())
+    # The most recently registered or polled job is kept, whatever its size.
+    while len(_jobs) > 1 and total > MAX_JOB_MB * 1024 * 1024:
+        _, job = _jobs.popitem(last=False)
+        total -= job.nbytes
+
+
+def register(job):
+    """Keeps `job` available to get_job(job.id), dropping expired or excess jobs."""
+    with _jobs_lock:
+        job.last_access = time.monotonic()
+        _jobs[job.id] = job
+        _prune(job.last_access)
+    return job.id
+
+
+def get_job(job_id):
+    """The registered job `job_id`, or None if unknown or dropped; counts as a poll."""
+    with _jobs_lock:
+        now = time.monotonic()
+        _prune(now)
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.last_access = now
+            _jobs.move_to_end(job_id)
+        return job
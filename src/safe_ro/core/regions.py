@@ -0,0 +1,11 @@
+# Monitored regions as [west, south, east, north] in EPSG:4326.
+REGIONS = {
+    "Fagaras": [24.5, 45.5, 25.5, 46.0],
+    "Iasi": [27.5, 47.0, 27.8, 47.3],
+    "Timisoara": [21.1, 45.6, 21.4, 45.9],
+    "Craiova": [23.7, 44.2, 24.0, 44.5],
+    "Constanta": [28.5, 44.1, 28.8, 44.4],
+    "Baia Mare": [23.4, 47.5, 23.7, 47.8],
+    "Bucuresti": [25.9, 44.3, 26.2, 44.6],
+    "Cluj": [23.5, 46.7, 23.8, 47.0],
+}
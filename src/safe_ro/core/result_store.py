@@ -0,0 +1,217 @@
+"""
+Shared, content-addressed store of analysis results, kept on local disk as
+.npy files and read back memory-mapped.
+
+    store = ResultStore()
+    handle = store.put(encoded_ndvi, bounds, "ndvi")   # what session state keeps
+    data, bounds = store.get(handle)                   # read-only, shared
+
+A result is stored once under the hash of its content, however many
+sessions hold it: a second put() of the same array only adds a reference.
+Every get() of a key returns the same read-only memory map, whose pages live
+in the OS page cache rather than in each session, so memory stays flat as
+sessions are added. Results may be plain arrays or EncodedRaster payloads
+(each part is mapped separately).
+
+Handles count as references until they are garbage collected (e.g. with the
+session that held them) or released. When the store grows past
+SAFE_RO_RESULT_STORE_MB, the least recently used unreferenced results are
+deleted; referenced ones never are.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from safe_ro.core.encodings import EncodedRaster
+from safe_ro.core.instrumentation import count, logger, span
+from safe_ro.core.memory_budget import MB
+
+DEFAULT_RESULT_DIR = os.environ.get("SAFE_RO_RESULT_STORE", os.path.join("data", "results"))
+MAX_MB = float(os.environ.get("SAFE_RO_RESULT_STORE_MB", "2048"))
+
+
+def _bounds_list(bounds):
+    """[west, south, east, north] of a list or rasterio BoundingBox; None stays None."""
+    if bounds is None:
+        return None
+    if hasattr(bounds, "left"):
+        return [bounds.left, bounds.bottom, bounds.right, bounds.top]
+    return [float(b) for b in bounds]
+
+
+def _parts(data):
+    """({name: array}, metadata) of an array or EncodedRaster."""
+    if isinstance(data, EncodedRaster):
+        meta = {"encoded": {"kind": data.kind, "encoding": data.encoding, "shape": list(data.shape),
+                            "scale": data.scale, "offset": data.offset, "nodata": data.nodata}}
+        return data.parts, meta
+    return {"data": np.asarray(data)}, {"encoded": None}
+
+
+def content_key(data, bounds=None):
+    """Hash of a result's arrays (dtype, shape and bytes) and bounds."""
+    parts, meta = _parts(data)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([meta, _bounds_list(bounds)], sort_keys=True, default=str).encode())
+    for name in sorted(parts):
+        part = np.ascontiguousarray(parts[name])
+        digest.update(f"{name}:{part.dtype.str}:{part.shape}".encode())
+        digest.update(memoryview(part).cast("B"))
+    return digest.hexdigest()
+
+
+class ResultHandle:
+    """
+    What a session keeps instead of a result: its key, kind, shape, bounds
+    and size. Holds a reference in its store until garbage collected.
+    """
+
+    def __init__(self, store, key, kind, shape, bounds, nbytes):
+        self.key = key
+        self.kind = kind
+        self.shape = tuple(shape)
+        self.bounds = bounds
+        self.nbytes = nbytes
+        self._release = weakref.finalize(self, store.release, key)
+
+    def release(self):
+        """Drops the reference now rather than at garbage collection."""
+        self._release()
+
+    def __repr__(self):
+        return f"ResultHandle({self.key[:12]}, {self.kind}, {self.shape})"
+
+
+class ResultStore:
+    def __init__(self, root=DEFAULT_RESULT_DIR, max_bytes=None):
+        self.root = root
+        self.max_bytes = MAX_MB * MB if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._mapped = {}
+        # key -> bytes on disk, least recently used first.
+        self._entries = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+        # Results left by earlier runs, oldest first; partial writes are removed.
+        found = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if ".tmp-" in name:
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isfile(os.path.join(path, "meta.json")):
+                found.append((os.path.getmtime(path), name, self._disk_bytes(path)))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+
+    @staticmethod
+    def _disk_bytes(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+
+    @property
+    def nbytes(self):
+        """Bytes of results on disk."""
+        with self._lock:
+            return sum(self._entries.values())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def refcount(self, key):
+        with self._lock:
+            return self._refs.get(key, 0)
+
+    def put(self, data, bounds=None, kind=None):
+        """
+        Stores `data` (an array or EncodedRaster) unless an identical result is
+        already there, and returns a handle referencing it.
+        """
+        bounds = _bounds_list(bounds)
+        parts, meta = _parts(data)
+        key = content_key(data, bounds)
+        path = os.path.join(self.root, key)
+        with span("results.put"):
+            with self._lock:
+                stored = key in self._entries
+                self._refs[key] = self._refs.get(key, 0) + 1
+                if stored:
+                    self._entries.move_to_end(key)
+            if stored:
+                count("safe_ro_result_store_total", result="shared")
+            else:
+                # Written aside and renamed into place, so readers never see a partial result.
+                staging = os.path.join(self.root, f"{key}.tmp-{uuid.uuid4().hex}")
+                os.makedirs(staging)
+                for name, part in parts.items():
+                    np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(part))
+                with open(os.path.join(staging, "meta.json"), "w") as f:
+                    json.dump({**meta, "kind": kind, "bounds": bounds, "parts": sorted(parts)}, f)
+                try:
+                    os.rename(staging, path)
+                except OSError:
+                    shutil.rmtree(staging, ignore_errors=True)  # another writer got there first
+                with self._lock:
+                    self._entries[key] = self._disk_bytes(path)
+                    self._entries.move_to_end(key)
+                count("safe_ro_result_store_total", result="stored")
+        self._evict()
+        shape = data.shape if isinstance(data, EncodedRaster) else np.shape(data)
+        return ResultHandle(self, key, kind, shape, bounds, sum(p.nbytes for p in parts.values()))
+
+    def get(self, handle):
+        """(data, bounds) of a handle's result, memory-mapped read-only."""
+        key = handle.key if isinstance(handle, ResultHandle) else handle
+        with self._lock:
+            if key in self._mapped:
+                self._entries.move_to_end(key)
+                return self._mapped[key]
+        path = os.path.join(self.root, key)
+        with span("results.get"), open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+            parts = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in meta["parts"]}
+        encoded = meta["encoded"]
+        data = EncodedRaster(parts=parts, **encoded) if encoded else parts["data"]
+        with self._lock:
+            # Concurrent first reads keep whichever mapping was stored first.
+            mapped = self._mapped.setdefault(key, (data, meta["bounds"]))
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return mapped
+
+    def release(self, key):
+        with self._lock:
+            refs = self._refs.get(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+            else:
+                self._refs.pop(key, None)
+        self._evict()
+
+    def _evict(self):
+        """Deletes least recently used unreferenced results while over the size cap."""
+        with self._lock:
+            total = sum(self._entries.values())
+            victims = []
+            for key, size in list(self._entries.items()):
+                if total <= self.max_bytes:
+                    break
+                if self._refs.get(key):
+                    continue
+                victims.append(key)
+                total -= size
+                del self._entries[key]
+                self._mapped.pop(key, None)
+        for key in victims:
+            # Open maps of an evicted result stay valid until dropped (POSIX unlink semantics).
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            count("safe_ro_result_store_total", result="evicted")
+        if victims:
+            logger.info("[results] evicted %d result(s); %.0f MB kept", len(victims), total / MB)
@@ -1,74 +1,468 @@
+import io
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
 import numpy as np
 import rasterio
 from rasterio.enums import Resampling
-import cv2
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+
+from safe_ro.core.band_math import BandMath
+from safe_ro.core.cog import output_transform
+from safe_ro.core.encodings import encode_result
+from safe_ro.core.instrumentation import record_error, span
+from safe_ro.core.memoize import MEMO
+from safe_ro.core.memory_budget import ENCODED_BYTES, plan
+
+
+def _as_buffer(source):
+    """Returns a memoryview over in-memory sources without copying, or None."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).cast("B")
+    if hasattr(source, "getbuffer"):  # io.BytesIO and Streamlit's UploadedFile
+        return memoryview(source.getbuffer()).cast("B")
+    return None
+
+
+class _BufferFile(io.RawIOBase):
+    """A read-only file over a memoryview, so GDAL can read a buffer in place."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), self._buffer.nbytes - self._pos))
+        b[:n] = self._buffer[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        start = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._buffer.nbytes}[whence]
+        self._pos = start + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
 
 
 class RasterBand:
-    def __init__(self, path: str):
-        self.path = path
+    # Stream-only sources are spooled to disk in pieces of this size.
+    CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, source):
+        """
+        `source` is a file path, a rasterio MemoryFile, a bytes-like buffer or
+        a file-like object (e.g. a Streamlit upload).
+        """
+        self.source = source
+        self.path = source if isinstance(source, (str, os.PathLike)) else None
+        self.name = self.path or getattr(source, "name", "<buffer>")
         self.data = None
+        self.bounds = None
+        self.transform = None
+        self.crs = None
+        self.shape = None
+        self.dtype = None
+
+    @contextmanager
+    def open(self):
+        """Opens the band as a rasterio dataset, whatever kind of source it is."""
+        if self.path is not None or isinstance(self.source, MemoryFile):
+            # A MemoryFile (e.g. a streamed API upload) is opened in place, without a copy.
+            with span("raster.open"):
+                src = rasterio.open(self.path) if self.path is not None else self.source.open()
+            with src:
+                yield src
+            return
+
+        buffer = _as_buffer(self.source)
+        if buffer is not None:
+            # GDAL reads the buffer through a Python file object instead of
+            # copying it into /vsimem as MemoryFile(buffer) would.
+            name = "band" + (os.path.splitext(self.name)[1] or ".tif")
 
-    def load(self, downsample_factor=1):
+            def opener(path, mode="rb"):
+                if os.path.basename(path) != name:
+                    raise FileNotFoundError(path)  # sidecar files (.aux.xml, .ovr, ...)
+                return _BufferFile(buffer)
+
+            try:
+                with span("raster.open"):
+                    src = rasterio.open(name, opener=opener)
+                with src:
+                    yield src
+            finally:
+                buffer.release()
+            return
+
+        # Stream-only sources go to disk chunk by chunk.
+        suffix = os.path.splitext(self.name)[1] or ".tif"
+        with span("raster.spool"), tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            spool_path = tmp.name
+            if hasattr(self.source, "seek"):
+                self.source.seek(0)
+            shutil.copyfileobj(self.source, tmp, self.CHUNK_SIZE)
+        try:
+            with span("raster.open"):
+                src = rasterio.open(spool_path)
+            with src:
+                yield src
+        finally:
+            os.remove(spool_path)
+
+    def remember(self, src):
+        """Records the georeferencing of an opened dataset on the band."""
+        self.bounds = src.bounds
+        self.transform = src.transform
+        self.crs = src.crs
+        self.shape = (src.height, src.width)
+        self.dtype = np.dtype(src.dtypes[0])
+
+    def probe(self):
+        """Reads only the band's georeferencing and returns its (height, width)."""
+        with self.open() as src:
+            self.remember(src)
+        return self.shape
+
+    def load(self, downsample_factor=1, out_shape=None):
+        """
+        Reads the band as float32, optionally decimated by `downsample_factor`
+        or resampled to `out_shape`. Reduced reads are served from the file's
+        overviews when it has them (COGs, or JPEG2000 resolution levels), so
+        they cost a fraction of a full read.
+        """
         try:
-            with rasterio.open(self.path) as src:
-                new_h = src.height // downsample_factor
-                new_w = src.width // downsample_factor
+            with self.open() as src, span("raster.read"):
+                if out_shape is None:
+                    new_h = src.height // downsample_factor
+                    new_w = src.width // downsample_factor
+                    out_shape = (new_h, new_w) if new_h > 0 and new_w > 0 else None
                 self.data = src.read(
                     1,
-                    out_shape=(new_h, new_w) if new_h > 0 and new_w > 0 else None,
+                    out_shape=out_shape,
                     resampling=Resampling.bilinear,
-                ).astype(np.float32)
+                ).astype(np.float32, copy=False)
+                self.remember(src)
         except Exception as e:
-            print(f"[ERROR] Failed to load {self.path}: {e}")
+            record_error("raster.read", f"Failed to load {self.name}: {e}")
             self.data = None
         return self.data
 
+    def iter_rows(self, block_rows=1024):
+        """
+        Yields (row_slice, float32 block) pairs covering the band top to bottom,
+        so callers can stream through scenes that do not fit in memory.
+        """
+        with self.open() as src:
+            self.remember(src)
+            for r0 in range(0, src.height, block_rows):
+                rows = min(block_rows, src.height - r0)
+                with span("raster.read"):
+                    block = src.read(1, window=Window(0, r0, src.width, rows))
+                yield slice(r0, r0 + rows), block.astype(np.float32)
+
 
 class NDVIProcessor:
-    def __init__(self, red_path: str, nir_path: str):
+    _ndvi = BandMath("NDVI")
+    # Part of the memo key (see safe_ro.core.memoize); bump when results change.
+    VERSION = 1
+
+    def __init__(self, red_path, nir_path, memo=MEMO):
+        """`memo` is the DiskMemo results are stored in, or None for none."""
         self.red_band = RasterBand(red_path)
         self.nir_band = RasterBand(nir_path)
+        self.memo = memo
+        self.memory_plan = None
 
-    def compute_ndvi(self):
-        red = self.red_band.load()
-        nir = self.nir_band.load()
+    def _plan_memory(self, full_shape, same_grid, itemsize, encoding, downsample_factor):
+        """Chooses how to run within the memory budget (see safe_ro.core.memory_budget)."""
+        pixels = full_shape[0] * full_shape[1]
+        encoded = ENCODED_BYTES.get(encoding, 0)
 
-        if red is None or nir is None:
+        def reduced(factor):
+            # Both bands as float32, the index, and one raw band being read.
+            return pixels / factor**2 * (12 + itemsize + encoded)
+
+        if downsample_factor > 1:
+            estimates = {"full": reduced(downsample_factor)}
+        elif same_grid:
+            # Streamed by BandMath: only the result and its window buffers.
+            ndvi = self._ndvi
+            block_bytes = BandMath.BLOCK_PIXELS * 4 * (len(ndvi.bands) + ndvi.register_count + 2)
+            estimates = {"windowed": pixels * (4 + encoded) + block_bytes}
+        else:
+            # Both bands, one resized copy, the index and a raw read.
+            estimates = {"full": pixels * (16 + itemsize + encoded)}
+        return plan("ndvi.compute", estimates, lambda k: reduced(downsample_factor * k))
+
+    def compute_ndvi(self, encoding=None, downsample_factor=1):
+        """
+        Returns (ndvi, bounds). With `encoding` ("int16" or "uint8", see
+        safe_ro.core.encodings) the NDVI comes back as a compact EncodedRaster.
+        `downsample_factor` > 1 computes a coarse preview at 1/factor of the
+        resolution (see safe_ro.core.progressive).
+
+        Scenes too large for the memory budget are downsampled further (see
+        `memory_plan`) or rejected with MemoryBudgetExceeded before any
+        pixels are read. Results of the same bands and resolution are served
+        from `memo` when it has them.
+        """
+        try:
+            with self.red_band.open() as red_src, self.nir_band.open() as nir_src:
+                self.red_band.remember(red_src)
+                red_shape, nir_shape = red_src.shape, nir_src.shape
+                itemsize = max(np.dtype(src.dtypes[0]).itemsize for src in (red_src, nir_src))
+        except Exception as e:
+            record_error("ndvi.compute", f"Failed to open NDVI bands: {e}")
             return None, None
+        full_shape = (max(red_shape[0], nir_shape[0]), max(red_shape[1], nir_shape[1]))
+        self.memory_plan = self._plan_memory(
+            full_shape, red_shape == nir_shape, itemsize, encoding, downsample_factor
+        )
+        downsample_factor *= self.memory_plan.downsample_factor
 
-        if red.shape != nir.shape:
-            target_shape = (
-                max(red.shape[0], nir.shape[0]),
-                max(red.shape[1], nir.shape[1]),
-            )
-            red = cv2.resize(red, (target_shape[1], target_shape[0]))
-            nir = cv2.resize(nir, (target_shape[1], target_shape[0]))
+        key = self.memo and self.memo.key(
+            "ndvi", {"red": self.red_band.source, "nir": self.nir_band.source},
+            version=self.VERSION, downsample_factor=downsample_factor,
+        )
+        if key:
+            ndvi = self.memo.load(key)
+            if ndvi is not None:
+                return encode_result(ndvi, "ndvi", encoding), self.red_band.bounds
 
-        denom = nir + red
-        denom[denom == 0] = 1e-6  # Avoid division by zero
-        ndvi = (nir - red) / denom
+        if downsample_factor > 1:
+            # Both bands are read straight at the preview size, whatever their
+            # native resolution, so no resize is needed.
+            preview_shape = tuple(max(n // downsample_factor, 1) for n in full_shape)
+            red = self.red_band.load(out_shape=preview_shape)
+            nir = self.nir_band.load(out_shape=preview_shape)
+            if red is None or nir is None:
+                return None, None
+            sources = {"RED": red, "NIR": nir}
+        elif red_shape == nir_shape:
+            # Streamed window by window straight from both files.
+            sources = {"RED": self.red_band, "NIR": self.nir_band}
+        else:
+            red = self.red_band.load()
+            nir = self.nir_band.load()
+            if red is None or nir is None:
+                return None, None
+            target_shape = full_shape
+            # OpenCV is only needed on this rare path; importing it costs a cold start.
+            import cv2
 
-        with rasterio.open(self.red_band.path) as src:
-            bounds = src.bounds
+            with span("ndvi.resize"):
+                if red.shape != target_shape:
+                    red = cv2.resize(red, (target_shape[1], target_shape[0]))
+                if nir.shape != target_shape:
+                    nir = cv2.resize(nir, (target_shape[1], target_shape[0]))
+            sources = {"RED": red, "NIR": nir}
 
-        return np.clip(ndvi, -1.0, 1.0), bounds
+        try:
+            with span("ndvi.index"):
+                ndvi = self._ndvi.evaluate(sources, zero_division=0.0, clip=(-1.0, 1.0))
+        except Exception as e:
+            record_error("ndvi.compute", f"Failed to compute NDVI: {e}")
+            return None, None
+        if key:
+            self.memo.save(key, ndvi, output_transform(self.red_band, ndvi.shape), self.red_band.crs)
+        return encode_result(ndvi, "ndvi", encoding), self.red_band.bounds
 
 
 class Sentinel1FloodDetector:
-    def __init__(self, path: str):
+    # Pixels per block when streaming a scene that does not fit in memory.
+    WINDOW_PIXELS = 4 * 1024 * 1024
+    # Pixels sampled to estimate the percentile threshold of a streamed scene.
+    SAMPLE_PIXELS = 4 * 1024 * 1024
+    # Part of the memo key (see safe_ro.core.memoize); bump when results change.
+    VERSION = 2
+
+    def __init__(self, path, memo=MEMO):
+        """`memo` is the DiskMemo masks are stored in, or None for none."""
         self.band = RasterBand(path)
+        self.memo = memo
+        self.memory_plan = None
+
+    def _plan_memory(self, threshold, speckle_filter, encoding, downsample_factor):
+        """Chooses how to run within the memory budget (see safe_ro.core.memory_budget)."""
+        height, width = self.band.shape
+        pixels = height * width
+        itemsize = self.band.dtype.itemsize
+        encoded = ENCODED_BYTES.get(encoding, 0)
+
+        def in_memory(factor):
+            # Raw read, float32 copy, filtered copy, percentile copy, mask.
+            per_pixel = itemsize + 4 + 1 + encoded
+            per_pixel += 4 if speckle_filter else 0
+            per_pixel += 4 if threshold is None else 0
+            return pixels / factor**2 * per_pixel
+
+        estimates = {"full": in_memory(downsample_factor)}
+        if downsample_factor == 1:
+            block_rows = self._block_rows(width)
+            estimates["windowed"] = (
+                pixels * (1 + encoded)
+                + block_rows * width * (itemsize + 12)
+                + (min(pixels, self.SAMPLE_PIXELS) * 8 if threshold is None else 0)
+            )
+        return plan("flood.detect", estimates, lambda k: in_memory(downsample_factor * k))
+
+    def _block_rows(self, width):
+        return max(16, self.WINDOW_PIXELS // max(width, 1))
+
+    def _filtered_blocks(self, speckle_filter, levels=None):
+        """
+        Yields (row_slice, float32 block) pairs of the (optionally speckle
+        filtered) band. Each block is filtered with a halo of neighbouring
+        rows, and a median with the scene's quantization `levels`, so the
+        result matches filtering the whole image.
+        """
+        from safe_ro.core import speckle
+
+        halo = speckle.halo(speckle_filter) if speckle_filter else 0
+        with self.band.open() as src:
+            self.band.remember(src)
+            height, width = src.shape
+            block_rows = self._block_rows(width)
+            for r0 in range(0, height, block_rows):
+                r1 = min(r0 + block_rows, height)
+                h0, h1 = max(r0 - halo, 0), min(r1 + halo, height)
+                with span("raster.read"):
+                    block = src.read(1, window=Window(0, h0, width, h1 - h0)).astype(np.float32)
+                if speckle_filter:
+                    with span("flood.speckle"):
+                        block = speckle.speckle_filter(block, method=speckle_filter, levels=levels)
+                yield slice(r0, r1), block[r0 - h0 : r1 - h0]
+
+    def _detect_windowed(self, threshold, percentile, speckle_filter):
+        """
+        Thresholds the scene block by block, holding only the uint8 mask in
+        full. Without an explicit threshold, a first pass estimates the
+        percentile from a regular sample of at most SAMPLE_PIXELS pixels
+        (every pixel, for scenes that small).
+        """
+        height, width = self.band.shape
+        levels = None
+        if speckle_filter == "median":
+            from safe_ro.core import speckle
+
+            # The median's quantization levels come from the same sample of
+            # the raw scene as when it is filtered whole.
+            stride = speckle.sample_stride((height, width))
+            with span("flood.sample"):
+                samples = [
+                    block[(-rows.start) % stride :: stride, ::stride]
+                    for rows, block in self.band.iter_rows(self._block_rows(width))
+                ]
+            levels = speckle.median_levels(np.concatenate(samples))
+
+        if threshold is None:
+            stride = max(1, int(np.ceil(np.sqrt(height * width / self.SAMPLE_PIXELS))))
+            samples = []
+            with span("flood.sample"):
+                for rows, block in self._filtered_blocks(speckle_filter, levels):
+                    samples.append(block[(-rows.start) % stride :: stride, ::stride].ravel())
+            threshold = np.percentile(np.concatenate(samples), percentile)
+
+        mask = np.empty((height, width), dtype=np.uint8)
+        for rows, block in self._filtered_blocks(speckle_filter, levels):
+            with span("flood.threshold"):
+                np.less(block, threshold, out=mask[rows].view(bool))
+        return mask
 
-    def detect(self, threshold=None, percentile=20.0):
-        data = self.band.load()
+    def detect(
+        self, threshold=None, percentile=20.0, speckle_filter=None, encoding=None, downsample_factor=1
+    ):
+        """
+        `speckle_filter` optionally names a local filter from safe_ro.core.speckle
+        ("median", "median_exact", "lee" or "refined_lee") applied before thresholding.
+        With `encoding` ("uint8", "packbits" or "rle") the mask comes back as a
+        compact EncodedRaster. `downsample_factor` > 1 gives a coarse preview.
+
+        Scenes too large to filter and threshold in memory are streamed block
+        by block, downsampled further (see `memory_plan`) or rejected with
+        MemoryBudgetExceeded, depending on the memory budget. Masks of the
+        same band and parameters are served from `memo` when it has them.
+        """
+        try:
+            self.band.probe()
+        except Exception as e:
+            record_error("raster.read", f"Failed to load {self.band.name}: {e}")
+            return None, None
+        self.memory_plan = self._plan_memory(threshold, speckle_filter, encoding, downsample_factor)
+        downsample_factor *= self.memory_plan.downsample_factor
+
+        # The strategy is part of the key: streamed scenes estimate the
+        # percentile from a sample, so their masks may differ slightly.
+        key = self.memo and self.memo.key(
+            "flood", {"s1": self.band.source}, version=self.VERSION,
+            threshold=None if threshold is None else float(threshold),
+            percentile=None if threshold is not None else float(percentile),
+            speckle_filter=speckle_filter, downsample_factor=downsample_factor,
+            strategy=self.memory_plan.strategy,
+        )
+        if key:
+            mask = self.memo.load(key)
+            if mask is not None:
+                return encode_result(mask, "mask", encoding), self.band.bounds
+
+        if self.memory_plan.strategy == "windowed":
+            try:
+                mask = self._detect_windowed(threshold, percentile, speckle_filter)
+            except Exception as e:
+                record_error("flood.detect", f"Windowed detection failed for {self.band.name}: {e}")
+                return None, None
+            return self._memoized(key, mask, encoding)
+
+        data = self.band.load(downsample_factor)
         if data is None:
             return None, None
 
-        # If no explicit threshold is given, calculate one using the percentile
-        if threshold is None:
-            threshold = np.percentile(data, percentile)
+        if speckle_filter:
+            from safe_ro.core import speckle
+
+            with span("flood.speckle"):
+                data = speckle.speckle_filter(data, method=speckle_filter)
+
+        with span("flood.threshold"):
+            # If no explicit threshold is given, calculate one using the percentile
+            if threshold is None:
+                threshold = np.percentile(data, percentile)
+
+            mask = (data < threshold).astype(np.uint8)
+        return self._memoized(key, mask, encoding)
 
-        with rasterio.open(self.band.path) as src:
-            bounds = src.bounds
+    def _memoized(self, key, mask, encoding):
+        """(encoded mask, bounds), after storing the mask in the memo under `key`."""
+        if key:
+            self.memo.save(key, mask, output_transform(self.band, mask.shape), self.band.crs)
+        return encode_result(mask, "mask", encoding), self.band.bounds
 
-        return (data < threshold).astype(np.uint8), bounds
+    def detect_change(self, baseline, k=2.0, min_drop=None, block_rows=1024):
+        """
+        Flags pixels whose backscatter dropped significantly below the
+        multi-temporal dry-season baseline (see flood_baseline.BackscatterBaseline),
+        rather than below a percentile of the scene itself. Permanently dark
+        surfaces are part of the baseline and are therefore not flagged.
+        """
+        try:
+            mask = None
+            for rows, block in self.band.iter_rows(block_rows):
+                if mask is None:
+                    mask = np.zeros(self.band.shape, dtype=np.uint8)
+                with span("flood.change"):
+                    mask[rows] = baseline.flag_drops(block, rows, k=k, min_drop=min_drop)
+        except Exception as e:
+            record_error("flood.change", f"Change detection failed for {self.band.name}: {e}")
+            return None, None
+        return mask, self.band.bounds
@@ -0,0 +1,284 @@
+"""
+Single-flight coalescing of identical concurrent analyses.
+
+    ndvi, bounds = coalesce("ndvi", {"red": red_path, "nir": nir_path}, proc.compute_ndvi)
+
+    @coalesced("gee.ndvi")
+    def get_ndvi(self, aoi, start_date, end_date, encoding=None): ...
+
+Calls are keyed by their normalized inputs: files by absolute path,
+modification time and size, Earth Engine objects by their serialized form,
+everything else by value. While a call is running, identical calls wait for
+it and get its result instead of starting their own:
+
+- threads of one process share the leader's result object directly, so
+  callers must treat it as read-only;
+- other processes (API workers) queue on a file lock in
+  SAFE_RO_SINGLEFLIGHT_DIR and read the result the leader leaves there for
+  them. Results are only written to disk when another process is actually
+  waiting, are removed as soon as it has read them, and are not a cache: a
+  call arriving after the leader finished computes afresh. Results are
+  pickled, so the directory is kept private to the user running the API.
+  Cross-process coalescing needs fcntl (POSIX); elsewhere it falls back to
+  threads only.
+
+A waiter gives up after SAFE_RO_SINGLEFLIGHT_TIMEOUT seconds (default 300)
+and computes the result itself, so a stuck leader cannot hold up every
+identical request behind it; these are counted with outcome "timeout".
+
+Set SAFE_RO_SINGLEFLIGHT=0 to disable coalescing.
+"""
+
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+
+from safe_ro.core.instrumentation import count, span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+ENABLED = os.environ.get("SAFE_RO_SINGLEFLIGHT", "1") not in ("", "0")
+DEFAULT_SINGLEFLIGHT_DIR = os.environ.get(
+    "SAFE_RO_SINGLEFLIGHT_DIR", os.path.join("data", "singleflight")
+)
+# How long identical calls wait for the leader before computing on their own.
+WAIT_TIMEOUT = float(os.environ.get("SAFE_RO_SINGLEFLIGHT_TIMEOUT", "300"))
+# Results their waiting process never read are removed after this many seconds.
+RESULT_TTL = 60.0
+METRIC = "safe_ro_singleflight_calls_total"
+
+_MISSING = object()
+
+
+def _normalize(value):
+    """A JSON-able form of `value` that is equal for equivalent inputs."""
+    if hasattr(value, "serialize"):  # ee.Geometry, ee.Image, ...
+        return {"ee": value.serialize()}
+    if isinstance(value, os.PathLike):
+        value = os.fspath(value)
+    if isinstance(value, str):
+        path = value
+        if path.startswith("zip://"):  # zip://archive.zip!member (see core.batch)
+            path = path[len("zip://"):].split("!", 1)[0]
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            return {"path": os.path.abspath(value), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        return value
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    # Unknown objects fall back to their repr; a default repr never matches,
+    # which just means no coalescing.
+    return repr(value)
+
+
+def make_key(name, params):
+    payload = json.dumps([name, _normalize(params)], sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _is_failure(result):
+    # Processors and clients report failures as (None, ...) tuples.
+    return result is None or (isinstance(result, tuple) and result and result[0] is None)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, root=DEFAULT_SINGLEFLIGHT_DIR, cross_process=True, timeout=WAIT_TIMEOUT):
+        self.root = root
+        self.timeout = timeout
+        self.cross_process = cross_process and fcntl is not None
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, name, params, fn):
+        """Returns fn(), sharing one run among identical concurrent calls."""
+        if not ENABLED:
+            return fn()
+        key = make_key(name, params)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            with span("singleflight.wait"):
+                finished = call.done.wait(self.timeout)
+            if not finished:
+                count(METRIC, call=name, outcome="timeout")
+                return fn()
+            count(METRIC, call=name, outcome="coalesced_thread")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(name, key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run(self, name, key, fn):
+        if not self.cross_process:
+            count(METRIC, call=name, outcome="leader")
+            return fn()
+
+        _private_dir(self.root)
+        stem = os.path.join(self.root, key)
+        while True:
+            with open(stem + ".lock", "a+") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another process is computing: say so, then wait our turn.
+                    waiter = f"{stem}.{uuid.uuid4().hex}"
+                    open(waiter + ".wait", "a").close()
+                    with span("singleflight.wait"):
+                        locked = _lock_within(lock, self.timeout)
+                    _remove(waiter + ".wait")
+                    if not locked:
+                        # A result the leader links for us after all expires with RESULT_TTL.
+                        count(METRIC, call=name, outcome="timeout")
+                        return fn()
+                    result = self._read_result(waiter + ".result")
+                    if result is not _MISSING:
+                        count(METRIC, call=name, outcome="coalesced_process")
+                        return result
+                if not _is_current(lock, stem + ".lock"):
+                    continue  # the leader removed this lock file while we waited
+
+                try:
+                    count(METRIC, call=name, outcome="leader")
+                    result = fn()
+                    waiters = glob.glob(glob.escape(stem) + ".*.wait")
+                    if waiters and not _is_failure(result):
+                        self._write_result([w[: -len(".wait")] + ".result" for w in waiters], result)
+                    return result
+                finally:
+                    # Still locked, so nobody else uses it yet; late arrivals find
+                    # it gone (see _is_current) and start over with a new one.
+                    _remove(stem + ".lock")
+
+    @staticmethod
+    def _read_result(path):
+        """The result a leader left for this waiter, if any; the file is removed."""
+        try:
+            with open(path, "rb") as f:
+                # Only trust results written by our own user.
+                if os.fstat(f.fileno()).st_uid != os.getuid():
+                    return _MISSING
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return _MISSING
+        finally:
+            _remove(path)
+
+    def _write_result(self, paths, result):
+        """Writes `result` once and links it to every waiter's result path."""
+        staged = os.path.join(self.root, f"{uuid.uuid4().hex}.part")
+        with span("singleflight.share"):
+            with os.fdopen(os.open(staged, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            for path in paths:
+                os.link(staged, path)
+            os.remove(staged)
+        # Results whose waiter never came to read them (e.g. it was killed).
+        now = time.time()
+        for stale in glob.glob(os.path.join(self.root, "*.result")):
+            try:
+                if now - os.path.getmtime(stale) > RESULT_TTL:
+                    os.remove(stale)
+            except OSError:
+                pass
+
+
+def _private_dir(path):
+    """Creates `path` readable by this user only; results are pickles."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.stat(path).st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _lock_within(lock, timeout):
+    """Takes an exclusive lock on `lock`, polling; False if it is still held after `timeout` seconds."""
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+
+def _is_current(lock, path):
+    """Whether the open `lock` file is still the one at `path`."""
+    try:
+        return os.path.samestat(os.fstat(lock.fileno()), os.stat(path))
+    except OSError:
+        return False
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+FLIGHTS = SingleFlight()
+
+
+def coalesce(name, params, fn):
+    """Runs fn() once for all concurrent calls with the same `name` and `params`."""
+    return FLIGHTS.do(name, params, fn)
+
+
+def coalesced(name):
+    """
+    Decorator form of coalesce(): the key is built from the call's arguments
+    (defaults included, `self` excluded).
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = {k: v for k, v in bound.arguments.items() if k != "self"}
+            return FLIGHTS.do(name, params, lambda: fn(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
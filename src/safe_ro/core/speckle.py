@@ -0,0 +1,204 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+# GRD IW products are multi-looked to roughly 4.4 looks.
+DEFAULT_ENL = 4.4
+
+
+# Above 5x5, cv2.medianBlur only takes 8-bit input, so larger medians run on
+# the data quantized to this many levels (see median_levels).
+LEVELS = 256
+# Pixels sampled to place the quantization levels.
+SAMPLE_PIXELS = 1024 * 1024
+
+
+def sample_stride(shape):
+    """Stride of the regular sample median_levels() is computed from."""
+    return max(1, int(np.ceil(np.sqrt(shape[0] * shape[1] / SAMPLE_PIXELS))))
+
+
+def median_levels(sample):
+    """
+    The LEVELS values a median above 5x5 is quantized to: quantiles of
+    `sample`, so each level holds an equal share of the pixels and precision
+    is finest where the data is densest (around a percentile threshold, for
+    instance). The median is an order statistic, so quantizing is exact up
+    to the spacing of neighbouring levels.
+    """
+    sample = np.asarray(sample, dtype=np.float32).ravel()
+    sample = sample[np.isfinite(sample)]
+    if not sample.size:
+        return np.zeros(LEVELS, np.float32)
+    return np.quantile(sample, (np.arange(LEVELS) + 0.5) / LEVELS).astype(np.float32)
+
+
+def _median(tile, size, levels=None):
+    if size <= 5:
+        # OpenCV only supports float32 input for 3x3 and 5x5 medians.
+        return cv2.medianBlur(tile, size)
+
+    # Larger windows (e.g. 7x7, GEE's focal_median(3)) run on 8-bit level
+    # indices; NaN pixels stay NaN.
+    if levels is None:
+        levels = median_levels(tile)
+    edges = (levels[1:] + levels[:-1]) / 2
+    nodata = np.isnan(tile)
+    indices = np.searchsorted(edges, np.where(nodata, levels[0], tile)).astype(np.uint8)
+    out = levels[cv2.medianBlur(indices, size)]
+    out[nodata] = np.nan
+    return out
+
+
+def _median_exact(tile, size, levels=None):
+    """
+    Exact median of any window size, without quantization: a partial sort
+    over a sliding window view, a few rows at a time to bound the temporary.
+    Far slower than "median" (pure numpy, holding the GIL).
+    """
+    if size <= 5:
+        return cv2.medianBlur(tile, size)
+    half = size // 2
+    padded = np.pad(tile, half, mode="edge")
+    out = np.empty_like(tile)
+    step = max(1, 4096 // tile.shape[1])
+    for r0 in range(0, tile.shape[0], step):
+        r1 = min(r0 + step, tile.shape[0])
+        windows = np.lib.stride_tricks.sliding_window_view(
+            padded[r0 : r1 + 2 * half], (size, size)
+        )
+        out[r0:r1] = np.median(windows.reshape(r1 - r0, tile.shape[1], -1), axis=-1)
+    return out
+
+
+def _lee_weighting(tile, mean, var, enl):
+    """Classic Lee MMSE weighting for multiplicative speckle with `enl` looks."""
+    noise = 1.0 / enl
+    signal_var = (var - mean * mean * noise) / (1.0 + noise)
+    weight = np.divide(signal_var, var, out=np.zeros_like(var), where=var > 0)
+    np.clip(weight, 0.0, 1.0, out=weight)
+    return mean + weight * (tile - mean)
+
+
+def _lee(tile, size, levels=None, enl=DEFAULT_ENL):
+    mean = cv2.boxFilter(tile, -1, (size, size), borderType=cv2.BORDER_REFLECT)
+    mean_sq = cv2.sqrBoxFilter(tile, -1, (size, size), borderType=cv2.BORDER_REFLECT)
+    var = np.maximum(mean_sq - mean * mean, 0.0)
+    return _lee_weighting(tile, mean, var, enl)
+
+
+def _directional_masks():
+    """The 8 edge-aligned 7x7 windows of the refined Lee filter, normalized."""
+    half_plane = np.zeros((7, 7), np.float32)
+    half_plane[:4, :] = 1  # upper half, centre row included
+    # upper-left corner, anti-diagonal included
+    triangle = (np.add.outer(np.arange(7), np.arange(7)) <= 6).astype(np.float32)
+    masks = {}
+    for k, side in enumerate(("up", "left", "down", "right")):
+        masks[side] = np.rot90(half_plane, k)
+    for k, corner in enumerate(("up_left", "down_left", "down_right", "up_right")):
+        masks[corner] = np.rot90(triangle, k)
+    return {name: np.ascontiguousarray(m / m.sum()) for name, m in masks.items()}
+
+
+_MASKS = _directional_masks()
+
+# For each gradient axis: the pair of opposite 3x3 sample means it compares
+# (as (row, col) offsets of the sample centre) and the half-window used on each side.
+_AXES = (
+    (((-2, 0), (2, 0)), ("up", "down")),
+    (((0, -2), (0, 2)), ("left", "right")),
+    (((-2, -2), (2, 2)), ("up_left", "down_right")),
+    (((-2, 2), (2, -2)), ("up_right", "down_left")),
+)
+
+
+def _refined_lee(tile, size=7, levels=None, enl=DEFAULT_ENL):
+    """
+    Refined Lee (Lee, 1981): the local statistics come from whichever of eight
+    edge-aligned half-windows lies on the same side of the strongest edge as
+    the centre pixel, so edges are preserved instead of smeared.
+    """
+    means3 = cv2.boxFilter(tile, -1, (3, 3), borderType=cv2.BORDER_REFLECT)
+    padded = cv2.copyMakeBorder(means3, 2, 2, 2, 2, cv2.BORDER_REFLECT)
+    h, w = tile.shape
+
+    def sample(dr, dc):
+        return padded[2 + dr : 2 + dr + h, 2 + dc : 2 + dc + w]
+
+    centre = means3
+    gradients = np.stack([np.abs(sample(*a) - sample(*b)) for (a, b), _ in _AXES])
+    axis = np.argmax(gradients, axis=0)
+    del gradients
+
+    mean = np.empty_like(tile)
+    var = np.empty_like(tile)
+    sq = tile * tile
+    for index, ((a, b), (side_a, side_b)) in enumerate(_AXES):
+        on_axis = axis == index
+        if not on_axis.any():
+            continue
+        # The half-window whose sample mean is closer to the centre is homogeneous with it.
+        use_a = np.abs(sample(*a) - centre) <= np.abs(sample(*b) - centre)
+        for side, selected in ((side_a, on_axis & use_a), (side_b, on_axis & ~use_a)):
+            if not selected.any():
+                continue
+            kernel = _MASKS[side]
+            m = cv2.filter2D(tile, -1, kernel, borderType=cv2.BORDER_REFLECT)
+            m2 = cv2.filter2D(sq, -1, kernel, borderType=cv2.BORDER_REFLECT)
+            np.copyto(mean, m, where=selected)
+            m2 -= m * m
+            np.copyto(var, m2, where=selected)
+    np.maximum(var, 0.0, out=var)
+    return _lee_weighting(tile, mean, var, enl)
+
+
+FILTERS = {"median": _median, "median_exact": _median_exact, "lee": _lee, "refined_lee": _refined_lee}
+
+
+def halo(method, size=7):
+    """Rows/columns of context `method` needs around a tile for exact results."""
+    return (7 if method == "refined_lee" else size) // 2
+
+
+def speckle_filter(data, method="median", size=7, tile_size=1024, workers=None, levels=None):
+    """
+    Applies a speckle filter to a 2-D array tile by tile on a thread pool.
+
+    Each tile is filtered together with a halo of neighbouring pixels wide
+    enough for the filter window (and, for refined Lee, the sample means), and
+    only its interior is kept, so the result is identical to filtering the
+    whole image at once. The OpenCV routines release the GIL, so tiles are
+    filtered in parallel.
+
+    The default 7x7 median matches GEEClient's focal_median(3) pre-processing.
+    It is quantized to LEVELS levels placed from a sample of `data`, unless
+    `levels` are given (e.g. placed from a whole scene filtered block by
+    block); "median_exact" is the unquantized, much slower fallback.
+    """
+    if method not in FILTERS:
+        raise ValueError(f"Unknown speckle filter '{method}'. Choose from {sorted(FILTERS)}.")
+    if method == "refined_lee":
+        size = 7  # the directional windows are defined on a 7x7 neighbourhood
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    if method == "median" and size > 5 and levels is None:
+        stride = sample_stride(data.shape)
+        levels = median_levels(data[::stride, ::stride])
+    border = halo(method, size)
+    h, w = data.shape
+    out = np.empty_like(data)
+
+    def _run(origin):
+        r0, c0 = origin
+        r1, c1 = min(r0 + tile_size, h), min(c0 + tile_size, w)
+        hr0, hc0 = max(r0 - border, 0), max(c0 - border, 0)
+        hr1, hc1 = min(r1 + border, h), min(c1 + border, w)
+        filtered = FILTERS[method](np.ascontiguousarray(data[hr0:hr1, hc0:hc1]), size, levels)
+        out[r0:r1, c0:c1] = filtered[r0 - hr0 : r1 - hr0, c0 - hc0 : c1 - hc0]
+
+    origins = [(r, c) for r in range(0, h, tile_size) for c in range(0, w, tile_size)]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(_run, origins))
+    return out
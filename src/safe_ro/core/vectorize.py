@@ -0,0 +1,225 @@
+import math
+
+import numpy as np
+import cv2
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_geom
+
+from safe_ro.core.encodings import as_array
+
+WGS84 = CRS.from_epsg(4326)
+# Metres per degree of latitude (and of longitude at the equator).
+METERS_PER_DEGREE = 111320.0
+
+
+def _bounds_list(bounds):
+    if hasattr(bounds, "left"):
+        return [bounds.left, bounds.bottom, bounds.right, bounds.top]
+    return list(bounds)
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = [0]  # label 0 is background
+
+    def add(self, count):
+        start = len(self.parent)
+        self.parent.extend(range(start, start + count))
+        return start
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _label_components(mask, strip_rows):
+    """
+    Labels 8-connected components strip by strip, merging labels that touch
+    across strip seams. Returns per-component pixel count, bounding box
+    (x0, y0, x1, y1), centroid (x, y) in pixels and one seed pixel (row, col).
+    """
+    uf = _UnionFind()
+    parts = []  # (global label, area, x0, y0, x1, y1, cx, cy, seed_row, seed_col)
+    prev_last_row = None
+    for r0 in range(0, mask.shape[0], strip_rows):
+        strip = np.ascontiguousarray(mask[r0 : r0 + strip_rows], dtype=np.uint8)
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            strip, connectivity=8, ltype=cv2.CV_32S
+        )
+        offset = uf.add(count - 1) - 1  # local label l -> global label offset + l
+
+        # First pixel of every local label, in a single O(n) pass.
+        flat = labels.ravel()
+        first = np.full(count, -1, dtype=np.int64)
+        first[flat[::-1]] = np.arange(flat.size - 1, -1, -1)
+
+        for label in range(1, count):
+            x, y, w, h, area = stats[label]
+            cx, cy = centroids[label]
+            seed_row, seed_col = divmod(int(first[label]), strip.shape[1])
+            parts.append(
+                (offset + label, int(area), x, y + r0, x + w, y + r0 + h,
+                 cx, cy + r0, seed_row + r0, seed_col)
+            )
+
+        if prev_last_row is not None:
+            top = np.where(labels[0] > 0, labels[0] + offset, 0)
+            for shift in (-1, 0, 1):  # 8-connectivity across the seam
+                above = np.roll(prev_last_row, shift)
+                if shift == -1:
+                    above[-1] = 0
+                elif shift == 1:
+                    above[0] = 0
+                touching = (above > 0) & (top > 0)
+                for a, b in set(zip(above[touching].tolist(), top[touching].tolist())):
+                    uf.union(a, b)
+        prev_last_row = np.where(labels[-1] > 0, labels[-1] + offset, 0)
+
+    components = {}
+    for label, area, x0, y0, x1, y1, cx, cy, sr, sc in parts:
+        root = uf.find(label)
+        comp = components.get(root)
+        if comp is None:
+            components[root] = {
+                "pixels": area, "bbox": [x0, y0, x1, y1],
+                "sum_x": cx * area, "sum_y": cy * area, "seed": (sr, sc),
+            }
+        else:
+            comp["pixels"] += area
+            b = comp["bbox"]
+            comp["bbox"] = [min(b[0], x0), min(b[1], y0), max(b[2], x1), max(b[3], y1)]
+            comp["sum_x"] += cx * area
+            comp["sum_y"] += cy * area
+    return list(components.values())
+
+
+def _pixel_area_m2(transform, crs, lat):
+    pixel_area = abs(transform.a * transform.e)
+    if crs is None or crs.is_geographic:
+        return pixel_area * METERS_PER_DEGREE**2 * math.cos(math.radians(lat))
+    return pixel_area * (crs.linear_units_factor[1] ** 2)
+
+
+def _trace_component(mask, comp, simplify):
+    """
+    Traces the outline (and holes) of one component within its bounding box,
+    along pixel edges. Returns rings of (x, y) pixel-corner coordinates.
+    """
+    x0, y0, x1, y1 = comp["bbox"]
+    crop = np.zeros((y1 - y0 + 2, x1 - x0 + 2), dtype=np.uint8)
+    crop[1:-1, 1:-1] = mask[y0:y1, x0:x1]
+    # Other components may share the bounding box; keep only the seed's one.
+    _, labels = cv2.connectedComponents(crop, connectivity=8)
+    seed_row, seed_col = comp["seed"]
+    crop = (labels == labels[seed_row - y0 + 1, seed_col - x0 + 1]).astype(np.uint8)
+
+    # Contours run through pixel centres. On a lattice at half-pixel steps,
+    # with every pixel grown to its closed square, the centres of the border
+    # cells are the pixel edges and corners themselves.
+    lattice = np.zeros((2 * crop.shape[0] + 1, 2 * crop.shape[1] + 1), dtype=np.uint8)
+    lattice[1::2, 1::2] = crop
+    lattice = cv2.dilate(lattice, np.ones((3, 3), np.uint8))
+
+    contours, hierarchy = cv2.findContours(lattice, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    polygons = {}  # outer contour index -> [outer ring, *hole rings]
+    for index in sorted(range(len(contours)), key=lambda i: hierarchy[0][i][3] != -1):
+        contour = contours[index]
+        if simplify > 0:
+            simplified = cv2.approxPolyDP(contour, 2 * simplify, True)
+            # Outlines too small to simplify are kept as traced.
+            contour = simplified if len(simplified) >= 3 else contour
+        if len(contour) < 3:
+            continue  # a hole of single pixels touching only at corners
+        # Half-pixel lattice steps in the padded crop -> pixel corners in the mask.
+        points = contour[:, 0, :].astype(np.float64) / 2 + [x0 - 1, y0 - 1]
+        parent = hierarchy[0][index][3]
+        if parent == -1:
+            polygons[index] = [points]
+        elif parent in polygons:
+            polygons[parent].append(points)
+    return list(polygons.values())
+
+
+def polygonize_mask(
+    mask, bounds, crs=None, min_area_m2=10000.0, simplify=1.0, strip_rows=1024, precision=6
+):
+    """
+    Converts a 0/1 flood mask into a GeoJSON FeatureCollection of flooded areas.
+
+    Components are labelled strip by strip (`strip_rows` at a time) with labels
+    merged across seams, so only one strip of labels is held at once. Each
+    component at least `min_area_m2` large is traced along its pixel edges
+    with OpenCV contours (holes included), so outlines enclose the area they
+    report, simplified with a tolerance of `simplify` pixels and reported
+    with its area and centroid. Coordinates are WGS84 lon/lat
+    rounded to `precision` decimals.
+    """
+    crs = CRS.from_user_input(crs) if crs is not None else WGS84
+    mask = as_array(mask)
+    height, width = mask.shape
+    transform = from_bounds(*_bounds_list(bounds), width, height)
+    binary = np.asarray(mask)
+    if binary.dtype != np.uint8:
+        binary = (np.nan_to_num(binary) > 0).astype(np.uint8)
+
+    def to_lonlat(geometry):
+        if crs == WGS84:
+            return geometry
+        return transform_geom(crs, WGS84, geometry)
+
+    def rounded(coords):
+        return [[round(x, precision), round(y, precision)] for x, y in coords]
+
+    features = []
+    for comp in _label_components(binary, strip_rows):
+        cx = comp["sum_x"] / comp["pixels"] + 0.5
+        cy = comp["sum_y"] / comp["pixels"] + 0.5
+        x, y = transform * (cx, cy)
+        # Only geographic pixel areas depend on the latitude, which is then `y`.
+        area_m2 = comp["pixels"] * _pixel_area_m2(transform, crs, y)
+        if area_m2 < min_area_m2:
+            continue
+        centroid = to_lonlat({"type": "Point", "coordinates": (x, y)})
+
+        polygons = []
+        for rings in _trace_component(binary, comp, simplify):
+            polygon = []
+            for points in rings:
+                ring = [transform * (x, y) for x, y in points]
+                ring.append(ring[0])
+                polygon.append(ring)
+            polygons.append(polygon)
+        if not polygons:
+            continue
+
+        geometry = to_lonlat({"type": "MultiPolygon", "coordinates": polygons})
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "MultiPolygon",
+                    "coordinates": [
+                        [rounded(ring) for ring in polygon]
+                        for polygon in geometry["coordinates"]
+                    ],
+                },
+                "properties": {
+                    "id": len(features) + 1,
+                    "pixels": comp["pixels"],
+                    "area_m2": round(area_m2, 1),
+                    "area_ha": round(area_m2 / 10000.0, 3),
+                    "centroid": rounded([centroid["coordinates"]])[0],
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.features import rasterize
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+
+from safe_ro.core.encodings import EncodedRaster
+from safe_ro.core.safe_ro_core import RasterBand
+
+DEFAULT_LABEL_CACHE_DIR = os.environ.get(
+    "SAFE_RO_ZONE_CACHE_DIR", os.path.join("data", "zone_labels")
+)
+# Label rasters kept in memory (those not memory-mapped from the disk cache).
+LABEL_CACHE_MB = float(os.environ.get("SAFE_RO_ZONE_CACHE_MB", "256"))
+NDVI_BINS = np.linspace(-1.0, 1.0, 21)
+
+# Label rasters recently used in this process, keyed by zone file + target grid.
+_LABEL_CACHE = OrderedDict()
+_LABEL_CACHE_SIZE = 8
+# API requests run on a thread pool; rasterizing happens outside the lock.
+_LABEL_CACHE_LOCK = threading.Lock()
+
+
+class ZoneLayer:
+    """
+    A set of administrative zones (counties, communes, ...) read from a
+    GeoJSON file or, if fiona is installed, a shapefile.
+    """
+
+    def __init__(self, path, id_field=None, name_field=None):
+        self.path = path
+        if path.lower().endswith((".geojson", ".json")):
+            with open(path) as f:
+                collection = json.load(f)
+            features = collection["features"]
+            crs = CRS.from_epsg(4326)
+        else:
+            try:
+                import fiona
+            except ImportError:
+                raise ImportError(
+                    "Reading shapefiles requires fiona. Install it or convert the zones to GeoJSON."
+                )
+            with fiona.open(path) as src:
+                features = [
+                    {"geometry": dict(f["geometry"]), "properties": dict(f["properties"])}
+                    for f in src
+                ]
+                crs = CRS.from_user_input(src.crs_wkt) if src.crs_wkt else CRS.from_epsg(4326)
+
+        self.crs = crs
+        self.geometries = [f["geometry"] for f in features]
+        self.ids = []
+        self.names = []
+        for index, feature in enumerate(features):
+            props = feature.get("properties") or {}
+            self.ids.append(props.get(id_field) if id_field else feature.get("id", index + 1))
+            self.names.append(props.get(name_field) if name_field else props.get("name"))
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def _cache_key(self, transform, shape, crs):
+        grid = json.dumps([list(transform)[:6], list(shape), CRS.from_user_input(crs).to_wkt()])
+        stamp = f"{os.path.abspath(self.path)}:{os.path.getmtime(self.path)}:{grid}"
+        return hashlib.sha1(stamp.encode()).hexdigest()
+
+    def label_raster(self, transform, shape, crs, cache_dir=None):
+        """
+        Rasterizes the zones onto the target grid: each pixel holds the 1-based
+        index of the zone covering it, 0 outside all zones. The raster is built
+        once per zone file and grid, saved to `cache_dir` (default
+        SAFE_RO_ZONE_CACHE_DIR; "" keeps it in memory only) and served
+        memory-mapped from there.
+        """
+        if cache_dir is None:
+            cache_dir = DEFAULT_LABEL_CACHE_DIR
+        key = self._cache_key(transform, shape, crs)
+        with _LABEL_CACHE_LOCK:
+            labels = _LABEL_CACHE.get(key)
+            if labels is not None:
+                _LABEL_CACHE.move_to_end(key)
+                return labels
+
+        cache_path = os.path.join(cache_dir, f"{key}.npy") if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            labels = np.load(cache_path, mmap_mode="r")
+        else:
+            target_crs = CRS.from_user_input(crs)
+            geometries = self.geometries
+            if target_crs != self.crs:
+                geometries = [transform_geom(self.crs, target_crs, g) for g in geometries]
+            dtype = np.uint16 if len(self) < np.iinfo(np.uint16).max else np.int32
+            labels = rasterize(
+                ((g, i + 1) for i, g in enumerate(geometries)),
+                out_shape=shape,
+                transform=transform,
+                fill=0,
+                dtype=dtype,
+            )
+            if cache_path:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Unique per thread too: concurrent requests may rasterize the same grid.
+                tmp_path = f"{cache_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npy"
+                np.save(tmp_path, labels)
+                os.replace(tmp_path, cache_path)
+                # Mapped, the labels live in the page cache instead of this process.
+                labels = np.load(cache_path, mmap_mode="r")
+
+        with _LABEL_CACHE_LOCK:
+            _LABEL_CACHE[key] = labels
+            _LABEL_CACHE.move_to_end(key)
+            _trim_label_cache()
+        return labels
+
+
+def _trim_label_cache():
+    """
+    Drops least recently used label rasters while over the count or memory
+    cap. Called with _LABEL_CACHE_LOCK held.
+    """
+
+    def in_memory():
+        return sum(a.nbytes for a in _LABEL_CACHE.values() if not isinstance(a, np.memmap))
+
+    # The newest entry is kept even if it alone is over the cap.
+    while len(_LABEL_CACHE) > 1 and (
+        len(_LABEL_CACHE) > _LABEL_CACHE_SIZE or in_memory() > LABEL_CACHE_MB * 1024 * 1024
+    ):
+        _LABEL_CACHE.popitem(last=False)
+
+
+class _Accumulator:
+    def __init__(self, zone_count, bins):
+        size = zone_count + 1  # slot 0 collects pixels outside every zone
+        self.bins = np.asarray(bins, dtype=np.float64)
+        self.count = np.zeros(size, np.int64)
+        self.sum = np.zeros(size, np.float64)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.hist = np.zeros(size * (len(self.bins) - 1), np.int64)
+        widths = np.diff(self.bins)
+        # Evenly spaced bins are indexed arithmetically instead of by binary search.
+        self.uniform_width = widths[0] if np.allclose(widths, widths[0]) else None
+
+    def add(self, labels, values):
+        valid = np.isfinite(values)
+        labels = labels[valid].astype(np.intp)
+        values = values[valid]
+        size = len(self.count)
+        self.count += np.bincount(labels, minlength=size)
+        self.sum += np.bincount(labels, weights=values, minlength=size)
+        np.minimum.at(self.min, labels, values)
+        np.maximum.at(self.max, labels, values)
+
+        nbins = len(self.bins) - 1
+        in_range = (values >= self.bins[0]) & (values <= self.bins[-1])
+        values = values[in_range]
+        if self.uniform_width is not None:
+            bin_index = ((values - self.bins[0]) / self.uniform_width).astype(np.intp)
+        else:
+            bin_index = np.searchsorted(self.bins, values, side="right") - 1
+        np.clip(bin_index, 0, nbins - 1, out=bin_index)
+        self.hist += np.bincount(labels[in_range] * nbins + bin_index, minlength=size * nbins)
+
+    def results(self, zones):
+        nbins = len(self.bins) - 1
+        hist = self.hist.reshape(-1, nbins)
+        results = []
+        for index in range(len(zones)):
+            label = index + 1
+            count = int(self.count[label])
+            results.append(
+                {
+                    "id": zones.ids[index],
+                    "name": zones.names[index],
+                    "count": count,
+                    "sum": float(self.sum[label]),
+                    "min": float(self.min[label]) if count else None,
+                    "max": float(self.max[label]) if count else None,
+                    "mean": float(self.sum[label] / count) if count else None,
+                    "histogram": hist[label].tolist(),
+                }
+            )
+        return results
+
+
+def zonal_stats(zones, values, bounds=None, crs=None, bins=NDVI_BINS, block_rows=1024):
+    """
+    Computes count/sum/min/max/mean/histogram per zone in one pass.
+
+    `values` is either a raster path (read window by window) or an array
+    such as an NDVIProcessor result, in which case `bounds` and `crs`
+    describe its grid. Every window is reduced with np.bincount-style
+    operations over the cached zone label raster, so the cost does not grow
+    with the number of zones. NaN pixels are ignored.
+    """
+    accumulator = _Accumulator(len(zones), bins)
+    if isinstance(values, EncodedRaster):
+        values = values.decode()
+
+    if isinstance(values, np.ndarray):
+        if hasattr(bounds, "left"):
+            bounds = [bounds.left, bounds.bottom, bounds.right, bounds.top]
+        transform = from_bounds(*bounds, values.shape[1], values.shape[0])
+        labels = zones.label_raster(transform, values.shape, crs or CRS.from_epsg(4326))
+        for r0 in range(0, values.shape[0], block_rows):
+            rows = slice(r0, r0 + block_rows)
+            accumulator.add(np.asarray(labels[rows]), values[rows].astype(np.float64))
+        return accumulator.results(zones)
+
+    band = RasterBand(values)
+    with band.open() as src:
+        labels = zones.label_raster(src.transform, src.shape, src.crs)
+        for r0 in range(0, src.height, block_rows):
+            rows = min(block_rows, src.height - r0)
+            block = src.read(1, window=Window(0, r0, src.width, rows), masked=True)
+            data = block.astype(np.float64).filled(np.nan)
+            accumulator.add(np.asarray(labels[r0 : r0 + rows]), data)
+    return accumulator.results(zones)
@@ -5,24 +5,22 @@ import numpy as np
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
 import streamlit as st
-import ee
-import folium
-from streamlit_folium import st_folium
-from matplotlib import cm
 import datetime
-import tempfile
 
-# Corrected imports after refactoring
-from safe_ro.clients.gee_client import GEEClient
-from safe_ro.clients.gdrive_client import GDriveClient
-from safe_ro.clients.firms_client import FIRMSClient
-from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+from safe_ro.core.instrumentation import begin_trace, span, stage_summary
+from safe_ro.core.regions import REGIONS
+
+# Earth Engine, Drive, the raster core and the map libraries are imported
+# where they are first used, so the page renders before they are loaded.
 
 # -----------------------------------------------------------------------------
 # 1. CONFIGURATION & CSS
 # -----------------------------------------------------------------------------
 st.set_page_config(page_title="SAFE-RO Platform", page_icon="🛰️", layout="wide")
 
+# Stages timed during this script run, for the sidebar timing panel.
+run_trace = begin_trace()
+
 st.markdown(
     """
 <style>
@@ -36,17 +34,6 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-REGIONS = {
-    "Fagaras": [24.5, 45.5, 25.5, 46.0],
-    "Iasi": [27.5, 47.0, 27.8, 47.3],
-    "Timisoara": [21.1, 45.6, 21.4, 45.9],
-    "Craiova": [23.7, 44.2, 24.0, 44.5],
-    "Constanta": [28.5, 44.1, 28.8, 44.4],
-    "Baia Mare": [23.4, 47.5, 23.7, 47.8],
-    "Bucuresti": [25.9, 44.3, 26.2, 44.6],
-    "Cluj": [23.5, 46.7, 23.8, 47.0],
-}
-
 
 # -----------------------------------------------------------------------------
 # 2. CACHED CLIENT INITIALIZATION
@@ -55,6 +42,8 @@ REGIONS = {
 
 @st.cache_resource
 def get_gee_client():
+    from safe_ro.clients.gee_client import GEEClient
+
     try:
         gee_project = st.secrets["gee_project"]
         return GEEClient(project=gee_project)
@@ -68,76 +57,180 @@ def get_gee_client():
 @st.cache_resource
 def get_gdrive_client():
     """Initializes the Google Drive client, which handles its own auth."""
+    from safe_ro.clients.gdrive_client import GDriveClient
+
     return GDriveClient()
 
 
-# Initialize clients
-gee_client = get_gee_client()
-gdrive_client = get_gdrive_client()
+@st.cache_resource
+def get_catalog():
+    """The scene catalog, shared by all sessions (see safe_ro.core.catalog)."""
+    from safe_ro.core.catalog import Catalog
+
+    return Catalog()
+
+
+@st.cache_resource
+def get_result_store():
+    """Dashboard results, stored once for all sessions (see safe_ro.core.result_store)."""
+    from safe_ro.core.result_store import ResultStore
+
+    return ResultStore()
+
+
+def keep_result(data, bounds, data_type):
+    """
+    Makes `data` the session's dashboard result. The session only keeps a
+    handle; the result itself is stored (once) in the shared result store.
+    """
+    st.session_state.dash_result = (
+        None if data is None else get_result_store().put(data, bounds, data_type)
+    )
+
+
+def catalog_choices(files, bands, region_bbox):
+    """
+    {label: scene} for the Drive scenes having `bands`, newest first: those
+    overlapping the selected region, or all of them if none do.
+    """
+    catalog = get_catalog()
+    catalog.index_drive(files)
+    query = {"bands": bands, "sources": ("drive",), "limit": 200}
+    scenes = catalog.find(bbox=region_bbox, covering=False, **query) or catalog.find(**query)
+    choices = {}
+    for scene in scenes:
+        when = scene["acquired"][:10] if scene["acquired"] else "unknown date"
+        cloud = f", {scene['cloud_cover']:.0f}% cloud" if scene["cloud_cover"] is not None else ""
+        choices[f"{when} – {scene['name']}{cloud}"] = scene
+    return choices
+
+
+def gee_region(bbox):
+    """Earth Engine rectangle for a region; call after get_gee_client()."""
+    import ee
+
+    return ee.Geometry.Rectangle(bbox)
 
 
 # -----------------------------------------------------------------------------
 # 3. MAP VISUALIZATION
 # -----------------------------------------------------------------------------
-def create_folium_map(data, bounds, data_type="ndvi", height=500):
+def create_folium_map(data, bounds, data_type="ndvi", height=500, key=None):
     """
-    Creates and displays a Folium map with a raster overlay.
+    Creates and displays a Folium map with a raster overlay. `data` may be an
+    array or a compact EncodedRaster. `key` distinguishes several maps of the
+    same type in one run (e.g. a preview and its full-resolution result).
     """
-    if isinstance(bounds, (list, tuple)) and len(bounds) == 4:
-        c_lat = (bounds[1] + bounds[3]) / 2
-        c_lon = (bounds[0] + bounds[2]) / 2
-        map_bounds = [[bounds[1], bounds[0]], [bounds[3], bounds[2]]]
-    elif hasattr(bounds, "left"):
-        c_lat = (bounds.bottom + bounds.top) / 2
-        c_lon = (bounds.left + bounds.right) / 2
-        map_bounds = [[bounds.bottom, bounds.left], [bounds.top, bounds.right]]
-    else:
+    from streamlit_folium import st_folium
+    from safe_ro.interfaces.map_render import build_folium_map
+
+    m = build_folium_map(data, bounds, data_type)
+    if m is None:
         st.error("Invalid bounds provided for map display.")
         return
+    with span("map.render"):
+        map_key = f"map_{data_type}_{key}" if key else f"map_{data_type}"
+        st_folium(m, width="100%", height=height, key=map_key)
 
-    m = folium.Map(location=[c_lat, c_lon], zoom_start=10, tiles="OpenStreetMap")
 
-    if data is not None and data.size > 0:
-        colormap = cm.RdYlGn if data_type == "ndvi" else cm.Blues
-
-        # Create a copy to avoid modifying the original data
-        data_copy = data.astype(float)
-
-        # Replace NaNs with a temporary value (e.g., 0) before colormapping
-        nan_mask = np.isnan(data_copy)
-        data_copy[nan_mask] = 0
-
-        # Normalize data to 0-1 range for the colormap
-        if data_type == "ndvi":
-            norm_data = (data_copy + 1) / 2
-        else:
-            norm_data = data_copy
+def show_preview(slot, data, bounds, data_type, factor):
+    """Fills `slot` with a coarse map while the full-resolution result is computed."""
+    if data is None:
+        return
+    with slot.container():
+        st.caption(f"Preview at 1/{factor} resolution, refining...")
+        create_folium_map(data, bounds, data_type, key="preview")
 
-        # Apply colormap.
-        colored_data_float = colormap(norm_data)
 
-        # Use the original nan_mask to set the alpha channel to 0 (transparent)
-        colored_data_float[nan_mask, 3] = 0
+def run_progressive(run, band, data_type):
+    """
+    Runs a local processor progressively: `run(downsample_factor)` returns
+    (data, bounds). Large scenes first show a coarse map, which is removed
+    once the full-resolution result (returned) is ready.
+    """
+    from safe_ro.core.memory_budget import MemoryBudgetExceeded
+    from safe_ro.core.progressive import ProgressiveJob
 
-        # As a final brute-force measure, replace any remaining NaNs.
-        np.nan_to_num(colored_data_float, copy=False, nan=0.0)
+    try:
+        shape = band.probe()
+    except Exception:
+        shape = None  # the processor reports the error itself
+    slot = st.empty()
+    try:
+        job = ProgressiveJob(run, shape)
+        if job.factor > 1:
+            show_preview(slot, job.preview, job.bounds, data_type, job.factor)
+        data, bounds = job.result()
+    except MemoryBudgetExceeded as e:
+        slot.empty()
+        st.error(f"This scene is too large to analyse here: {e}")
+        return None, None
+    slot.empty()
+    shape_read = getattr(data, "shape", None)
+    if shape and shape_read and shape_read[0] < shape[0]:
+        st.warning(
+            f"Scene too large for the memory budget; analysed at 1/{round(shape[0] / shape_read[0])} resolution."
+        )
+    return data, bounds
 
-        # Convert the float RGBA array [0,1] to a uint8 array [0,255]
-        colored_data_uint8 = (colored_data_float * 255).astype(np.uint8)
 
-        folium.raster_layers.ImageOverlay(
-            image=colored_data_uint8,
-            bounds=map_bounds,
-            opacity=0.7,
-            name=f"{data_type.upper()} Overlay",
-        ).add_to(m)
+def show_region_stats(gee_client, product, selected_region, start_date, end_date):
+    """
+    Shows Earth Engine statistics for every region at once, computed
+    server-side, for when numbers are enough and no map needs downloading.
+    """
+    import pandas as pd
 
-    folium.Rectangle(
-        bounds=map_bounds, color="red", fill=False, weight=2, tooltip="Analysis Area"
-    ).add_to(m)
+    with st.spinner("Computing statistics on Earth Engine..."):
+        stats, error_msg = gee_client.get_stats(product, REGIONS, str(start_date), str(end_date))
+    if stats is None:
+        st.error(error_msg or "Could not compute statistics.")
+        return
 
-    folium.LayerControl().add_to(m)
-    st_folium(m, width="100%", height=height, key=f"map_{data_type}")
+    table = pd.DataFrame(
+        {name: {k: v for k, v in s.items() if k != "histogram"} for name, s in stats.items()}
+    ).T
+    st.dataframe(table, use_container_width=True)
+
+    histogram = (stats.get(selected_region) or {}).get("histogram")
+    if histogram and histogram["counts"]:
+        st.caption(f"NDVI distribution in {selected_region}")
+        labels = [f"{edge:.1f}" for edge in histogram["edges"][:-1]]
+        st.bar_chart(pd.DataFrame({"pixels": histogram["counts"]}, index=labels))
+
+
+def show_timings(panel, trace):
+    """Fills the sidebar timing panel: stages of this run, then process-wide totals."""
+    totals = {}
+    for stage, seconds, _ in trace:
+        calls, total = totals.get(stage, (0, 0.0))
+        totals[stage] = (calls + 1, total + seconds)
+    with panel:
+        if totals:
+            st.caption("This run")
+            st.table(
+                [
+                    {"stage": stage, "calls": calls, "ms": round(total * 1000, 1)}
+                    for stage, (calls, total) in sorted(totals.items(), key=lambda kv: -kv[1][1])
+                ]
+            )
+        else:
+            st.caption("No timed stages ran in this run.")
+        summary = stage_summary()
+        if summary:
+            st.caption("Since startup")
+            st.table(
+                [
+                    {
+                        "stage": stage,
+                        "calls": s["count"],
+                        "mean ms": round(s["mean_s"] * 1000, 1),
+                        "max ms": round(s["max_s"] * 1000, 1),
+                        "errors": s["errors"],
+                    }
+                    for stage, s in summary.items()
+                ]
+            )
 
 
 # -----------------------------------------------------------------------------
@@ -163,7 +256,8 @@ last_week = today - datetime.timedelta(days=7)
 start_date = st.sidebar.date_input("Start Date", last_week)
 end_date = st.sidebar.date_input("End Date", today)
 
-gee_aoi = ee.Geometry.Rectangle(current_bbox)
+st.sidebar.markdown("---")
+timings_panel = st.sidebar.expander("⏱️ Timings")
 
 
 # --- MODE: HOME ---
@@ -195,15 +289,15 @@ elif mode == "Citizen App":
     show_sat = st.toggle("Overlay Satellite Data", value=False)
     map_data, map_type, bounds_to_use = None, "ndvi", current_bbox
     if show_sat:
+        gee_client = get_gee_client()
+        gee_aoi = gee_region(current_bbox)
         with st.spinner("Querying Google Earth Engine..."):
-            map_data, new_bounds, error_msg = gee_client.get_ndvi(
-                gee_aoi, str(start_date), str(end_date)
+            # NDVI and flood products are requested concurrently; NDVI wins if available.
+            map_data, new_bounds, product, error_msg = gee_client.get_first_available(
+                gee_aoi, str(start_date), str(end_date), products=("ndvi", "flood")
             )
-            if map_data is None:
-                st.warning(f"NDVI Error: {error_msg}. Trying Sentinel-1 for floods.")
-                map_data, new_bounds, error_msg = gee_client.get_flood_data(
-                    gee_aoi, str(start_date), str(end_date)
-                )
+            if product == "flood":
+                st.warning("NDVI unavailable (likely cloudy). Showing Sentinel-1 floods.")
                 map_type = "water"
 
             if map_data is not None:
@@ -219,47 +313,91 @@ elif mode == "Authority Dashboard":
     # Bypass authentication for development/testing
     st.session_state.auth = True
     st.title(f"Command Center: {selected_region}")
+    from safe_ro.core.ndvi_cube import NDVICube
+    from safe_ro.core.encodings import encode_ndvi
+
+    gee_client = get_gee_client()
+    gee_aoi = gee_region(current_bbox)
+
+    show_maps = st.toggle(
+        "Download maps",
+        value=True,
+        help="Off: only per-region statistics are computed, on Earth Engine, "
+        "for all regions at once; no imagery is downloaded.",
+    )
 
-    tab1, tab2 = st.tabs(["Vegetation (S2)", "Floods (S1)"])
+    tab1, tab2, tab3 = st.tabs(["Vegetation (S2)", "Floods (S1)", "Trends (S2)"])
 
     with tab1:
-        if st.button("Analyze Vegetation Health"):
+        analyze = st.button("Analyze Vegetation Health")
+        if analyze and not show_maps:
+            show_region_stats(gee_client, "ndvi", selected_region, start_date, end_date)
+        elif analyze:
+            preview_slot = st.empty()
             with st.spinner("Processing NDVI with GEE..."):
-                (
-                    st.session_state.dash_data,
-                    st.session_state.dash_bounds,
-                    error_msg,
-                ) = gee_client.get_ndvi(gee_aoi, str(start_date), str(end_date))
-                st.session_state.dash_type = "ndvi"
-                if st.session_state.dash_data is None:
+                # A coarse composite is shown while the full resolution downloads.
+                preview, full = gee_client.get_progressive(
+                    "ndvi", gee_aoi, str(start_date), str(end_date), encoding="int16"
+                )
+                show_preview(preview_slot, preview[0], preview[1], "ndvi", 8)
+                data, bounds, error_msg = full.result()
+                preview_slot.empty()
+                keep_result(data, bounds, "ndvi")
+                if data is None:
                     st.error(error_msg or "Could not retrieve Sentinel-2 data.")
+                else:
+                    # Archive every composite so trends build up over time.
+                    try:
+                        NDVICube(selected_region).append(data, bounds, end_date)
+                    except ValueError as e:
+                        st.warning(f"NDVI not archived: {e}")
 
     with tab2:
-        if st.button("Analyze Flood Risk"):
+        analyze = st.button("Analyze Flood Risk")
+        if analyze and not show_maps:
+            show_region_stats(gee_client, "flood", selected_region, start_date, end_date)
+        elif analyze:
+            preview_slot = st.empty()
             with st.spinner("Processing Flood Data with GEE..."):
-                (
-                    st.session_state.dash_data,
-                    st.session_state.dash_bounds,
-                    error_msg,
-                ) = gee_client.get_flood_data(gee_aoi, str(start_date), str(end_date))
-                st.session_state.dash_type = "water"
-                if st.session_state.dash_data is None:
+                preview, full = gee_client.get_progressive(
+                    "flood", gee_aoi, str(start_date), str(end_date), encoding="packbits"
+                )
+                show_preview(preview_slot, preview[0], preview[1], "water", 8)
+                data, bounds, error_msg = full.result()
+                preview_slot.empty()
+                keep_result(data, bounds, "water")
+                if data is None:
                     st.error(error_msg or "Could not retrieve Sentinel-1 data.")
 
+    with tab3:
+        cube = NDVICube(selected_region)
+        st.caption(f"{len(cube)} NDVI composites archived for {selected_region}.")
+        if len(cube) < 2:
+            st.info("Run the vegetation analysis on at least two dates to see trends.")
+        elif st.button("Show NDVI Anomaly"):
+            with st.spinner("Computing anomaly against the archive..."):
+                latest = cube.dates[-1]
+                # z-scores are mapped onto the NDVI colour scale: +/-3 sigma -> +/-1.
+                keep_result(
+                    encode_ndvi(np.clip(cube.anomaly(latest) / 3.0, -1, 1), "int16"),
+                    cube.bounds,
+                    "ndvi",
+                )
+                st.caption(f"Anomaly of {latest} against {len(cube) - 1} earlier composites.")
+
     st.divider()
 
-    if "dash_data" in st.session_state and st.session_state.dash_data is not None:
+    handle = st.session_state.get("dash_result")
+    if handle is not None:
         st.subheader("Geospatial Analysis")
-        bounds = st.session_state.get("dash_bounds") or current_bbox
-        create_folium_map(
-            st.session_state.dash_data,
-            bounds,
-            data_type=getattr(st.session_state, "dash_type", "ndvi"),
-        )
+        data, bounds = get_result_store().get(handle)
+        create_folium_map(data, bounds or current_bbox, data_type=handle.kind)
 
 # --- MODE: LOCAL ANALYSIS ---
 elif mode == "Local Analysis":
     st.title("Local Analysis – Manual & Google Drive")
+    from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+
     analysis_type = st.selectbox("Select Analysis Type", ["NDVI (Vegetation)", "Flood"])
     tab1, tab2, tab3 = st.tabs(
         ["☁️ Cloud Data (Google Drive)", "📂 Manual Upload", "🔥 Fire Monitor"]
@@ -268,6 +406,7 @@ elif mode == "Local Analysis":
     # --- TAB 1: CLOUD DATA (Now uses GDriveClient) ---
     with tab1:
         st.header("Latest Satellite Imagery (Google Drive)")
+        gdrive_client = get_gdrive_client()
         if gdrive_client.drive:
             files = gdrive_client.get_file_list()
             if not files:
@@ -277,51 +416,52 @@ elif mode == "Local Analysis":
             else:
                 # NDVI Analysis from Cloud
                 if analysis_type == "NDVI (Vegetation)":
-                    red_map = {f["title"]: f for f in files if "RED" in f["title"]}
-                    nir_map = {f["title"]: f for f in files if "NIR" in f["title"]}
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        red_choice = st.selectbox(
-                            "Select RED Band", list(red_map.keys())
-                        )
-                    with col2:
-                        nir_choice = st.selectbox(
-                            "Select NIR Band", list(nir_map.keys())
-                        )
+                    by_id = {f["id"]: f for f in files}
+                    scenes = catalog_choices(files, ("red", "nir"), current_bbox)
+                    scene_choice = st.selectbox("Select Scene", list(scenes))
 
                     if st.button("🚀 Analyze NDVI Cloud Data"):
-                        if red_choice and nir_choice:
+                        if scene_choice:
+                            bands = scenes[scene_choice]["bands"]
                             with st.spinner("Downloading from Google Drive..."):
                                 path_red = gdrive_client.download_file(
-                                    red_map[red_choice]
+                                    by_id[bands["red"]["location"][len("gdrive:"):]]
                                 )
                                 path_nir = gdrive_client.download_file(
-                                    nir_map[nir_choice]
+                                    by_id[bands["nir"]["location"][len("gdrive:"):]]
                                 )
                             if path_red and path_nir:
                                 try:
                                     proc = NDVIProcessor(path_red, path_nir)
-                                    ndvi, bounds = proc.compute_ndvi()
+                                    ndvi, bounds = run_progressive(
+                                        lambda f: proc.compute_ndvi(downsample_factor=f),
+                                        proc.red_band,
+                                        "ndvi",
+                                    )
                                     create_folium_map(ndvi, bounds, "ndvi")
                                 finally:
                                     os.remove(path_red)
                                     os.remove(path_nir)
                 # Flood Analysis from Cloud
                 elif analysis_type == "Flood":
-                    radar_map = {f["title"]: f for f in files if "VV" in f["title"]}
-                    radar_choice = st.selectbox(
-                        "Select Radar Image", list(radar_map.keys())
-                    )
+                    by_id = {f["id"]: f for f in files}
+                    scenes = catalog_choices(files, ("vv",), current_bbox)
+                    radar_choice = st.selectbox("Select Radar Scene", list(scenes))
                     if st.button("🚀 Analyze Flood Cloud Data"):
                         if radar_choice:
+                            location = scenes[radar_choice]["bands"]["vv"]["location"]
                             with st.spinner("Downloading from Google Drive..."):
                                 path_radar = gdrive_client.download_file(
-                                    radar_map[radar_choice]
+                                    by_id[location[len("gdrive:"):]]
                                 )
                             if path_radar:
                                 try:
                                     proc = Sentinel1FloodDetector(path_radar)
-                                    mask, bounds = proc.detect()
+                                    mask, bounds = run_progressive(
+                                        lambda f: proc.detect(downsample_factor=f),
+                                        proc.band,
+                                        "water",
+                                    )
                                     create_folium_map(mask, bounds, "water")
                                 finally:
                                     os.remove(path_radar)
@@ -336,27 +476,16 @@ elif mode == "Local Analysis":
 
             if st.button("🚀 Analyze Local NDVI Files"):
                 if uploaded_red and uploaded_nir:
-                    with tempfile.NamedTemporaryFile(
-                        delete=False, suffix=".tif"
-                    ) as tr, tempfile.NamedTemporaryFile(
-                        delete=False, suffix=".tif"
-                    ) as tn:
-                        tr.write(uploaded_red.read())
-                        tn.write(uploaded_nir.read())
-                        tr.flush()
-                        tn.flush()
-
-                        try:
-                            proc = NDVIProcessor(tr.name, tn.name)
-                            ndvi, bounds = proc.compute_ndvi()
-                            if ndvi is not None:
-                                st.subheader("NDVI Analysis Map")
-                                create_folium_map(ndvi, bounds, data_type="ndvi")
-                            else:
-                                st.error("Could not compute NDVI.")
-                        finally:
-                            os.remove(tr.name)
-                            os.remove(tn.name)
+                    # Uploads are read straight from Streamlit's buffers, no temp copies.
+                    proc = NDVIProcessor(uploaded_red, uploaded_nir)
+                    ndvi, bounds = run_progressive(
+                        lambda f: proc.compute_ndvi(downsample_factor=f), proc.red_band, "ndvi"
+                    )
+                    if ndvi is not None:
+                        st.subheader("NDVI Analysis Map")
+                        create_folium_map(ndvi, bounds, data_type="ndvi")
+                    else:
+                        st.error("Could not compute NDVI.")
                 else:
                     st.warning("Please upload both RED and NIR band files.")
 
@@ -367,22 +496,15 @@ elif mode == "Local Analysis":
 
             if st.button("🚀 Analyze Local Flood File"):
                 if uploaded_radar:
-                    with tempfile.NamedTemporaryFile(
-                        delete=False, suffix=".tif"
-                    ) as tradar:
-                        tradar.write(uploaded_radar.read())
-                        tradar.flush()
-
-                        try:
-                            proc = Sentinel1FloodDetector(tradar.name)
-                            flood_mask, bounds = proc.detect()
-                            if flood_mask is not None:
-                                st.subheader("Flood Analysis Map")
-                                create_folium_map(flood_mask, bounds, data_type="water")
-                            else:
-                                st.error("Could not compute flood mask.")
-                        finally:
-                            os.remove(tradar.name)
+                    proc = Sentinel1FloodDetector(uploaded_radar)
+                    flood_mask, bounds = run_progressive(
+                        lambda f: proc.detect(downsample_factor=f), proc.band, "water"
+                    )
+                    if flood_mask is not None:
+                        st.subheader("Flood Analysis Map")
+                        create_folium_map(flood_mask, bounds, data_type="water")
+                    else:
+                        st.error("Could not compute flood mask.")
                 else:
                     st.warning("Please upload a Sentinel-1 VV band file.")
 
@@ -396,6 +518,10 @@ elif mode == "Local Analysis":
             if st.button("🛰️ Fetch Active Fire Data"):
                 with st.spinner("Querying FIRMS..."):
                     try:
+                        import folium
+                        from streamlit_folium import st_folium
+                        from safe_ro.clients.firms_client import FIRMSClient
+
                         firms_client = FIRMSClient(api_key=firms_api_key)
                         fire_data = firms_client.get_active_fires(
                             current_bbox, end_date
@@ -419,3 +545,8 @@ elif mode == "Local Analysis":
                             st.info("No active fires detected in the selected area.")
                     except Exception as e:
                         st.error(f"Error fetching fire data: {e}")
+
+# -----------------------------------------------------------------------------
+# 5. TIMINGS
+# -----------------------------------------------------------------------------
+show_timings(timings_panel, run_trace)
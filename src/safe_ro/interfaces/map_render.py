@@ -0,0 +1,117 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
+import folium
+
+from safe_ro.core.encodings import as_array
+from safe_ro.core.instrumentation import span, timed
+
+
+def map_bounds(bounds):
+    """
+    Returns ([lat, lon] centre, [[south, west], [north, east]]) for a
+    [west, south, east, north] list or a rasterio BoundingBox, or None if the
+    bounds cannot be interpreted.
+    """
+    if isinstance(bounds, (list, tuple)) and len(bounds) == 4:
+        left, bottom, right, top = bounds
+    elif hasattr(bounds, "left"):
+        left, bottom, right, top = bounds.left, bounds.bottom, bounds.right, bounds.top
+    else:
+        return None
+    centre = [(bottom + top) / 2, (left + right) / 2]
+    return centre, [[bottom, left], [top, right]]
+
+
+# The last palette entry is reserved for transparent (NaN) pixels.
+_LEVELS = 255
+
+
+def _png_chunk(tag, payload):
+    return (
+        struct.pack("!I", len(payload))
+        + tag
+        + payload
+        + struct.pack("!I", zlib.crc32(tag + payload) & 0xFFFFFFFF)
+    )
+
+
+@timed("map.colorize")
+def overlay_png(data, data_type="ndvi"):
+    """
+    Encodes an NDVI (-1..1) or flood (0..1) raster as a palette PNG data URL;
+    NaN pixels become fully transparent.
+
+    The colormap is sampled into 255 palette entries, so the image is one byte
+    per pixel instead of RGBA and compresses roughly ten times faster than the
+    PNG folium would write itself.
+    """
+    # matplotlib is only needed once there is a raster to draw.
+    from matplotlib import cm
+
+    data = as_array(data)
+    colormap = cm.RdYlGn if data_type == "ndvi" else cm.Blues
+
+    # Normalize data to 0-1 range for the colormap
+    values = data.astype(np.float32)
+    norm_data = (values + 1) / 2 if data_type == "ndvi" else values
+
+    index = np.clip(norm_data * (_LEVELS - 1) + 0.5, 0, _LEVELS - 1)
+    nan_mask = np.isnan(index)
+    index[nan_mask] = 0
+    index = index.astype(np.uint8)
+    index[nan_mask] = _LEVELS
+
+    palette = (colormap(np.linspace(0, 1, _LEVELS)) * 255).astype(np.uint8)
+    plte = palette[:, :3].tobytes() + b"\x00\x00\x00"
+    trns = palette[:, 3].tobytes() + b"\x00"
+
+    # Each scanline is prefixed with filter type 0 (none).
+    height, width = index.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = index
+
+    png = b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack("!2I5B", width, height, 8, 3, 0, 0, 0)),
+        _png_chunk(b"PLTE", plte),
+        _png_chunk(b"tRNS", trns),
+        _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        _png_chunk(b"IEND", b""),
+    ])
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def build_folium_map(data, bounds, data_type="ndvi"):
+    """
+    Builds a Folium map with the raster as a coloured overlay and the analysis
+    area outlined. `data` may be an array or a compact EncodedRaster.
+    Returns None if the bounds are invalid.
+    """
+    located = map_bounds(bounds)
+    if located is None:
+        return None
+    centre, overlay_bounds = located
+
+    with span("map.build"):
+        m = folium.Map(location=centre, zoom_start=10, tiles="OpenStreetMap")
+
+        data = as_array(data)
+        if data is not None and data.size > 0:
+            image = overlay_png(data, data_type)
+            with span("map.overlay"):
+                folium.raster_layers.ImageOverlay(
+                    image=image,
+                    bounds=overlay_bounds,
+                    opacity=0.7,
+                    name=f"{data_type.upper()} Overlay",
+                ).add_to(m)
+
+        folium.Rectangle(
+            bounds=overlay_bounds, color="red", fill=False, weight=2, tooltip="Analysis Area"
+        ).add_to(m)
+
+        folium.LayerControl().add_to(m)
+    return m
@@ -2,31 +2,133 @@
 FastAPI wrapper around SAFE-RO core.
 Run with:
     uvicorn safe_ro.interfaces.safe_ro_api:app --reload
+
+POST /gee answers with per-region Earth Engine statistics (no pixels are
+downloaded) unless a raster is requested; set SAFE_RO_GEE_PROJECT.
+Band files can also be uploaded as multipart/form-data to /ndvi/upload and
+/flood/upload (see interfaces.uploads for the size and concurrency limits).
+Scenes too large for SAFE_RO_MEMORY_BUDGET_MB are streamed, downsampled or
+refused with 413 (see core.memory_budget). Prometheus metrics are served at
+/metrics. Set SAFE_RO_PROFILE=1 to keep cProfile/tracemalloc dumps of slow
+requests (see core.instrumentation).
 """
 
 import sys
 import os
+import time
+from collections import defaultdict
+from functools import lru_cache
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Literal, Optional
 
-# Corrected import path after refactoring
-from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+# The processing modules (numpy, rasterio, OpenCV) are imported inside the
+# endpoints that use them, so workers answer /health without loading them.
+from safe_ro.core.instrumentation import (
+    REGISTRY,
+    begin_trace,
+    count,
+    profile_call,
+    profiled,
+    render_prometheus,
+)
 
 app = FastAPI(title="SAFE-RO API", version="0.1.0")
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Times every request and reports its processing stages in a Server-Timing header."""
+    trace = begin_trace()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        stages = defaultdict(float)
+        for stage, seconds, _ in trace:
+            stages[stage] += seconds
+        if stages:
+            response.headers["Server-Timing"] = ", ".join(
+                f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()
+            )
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REGISTRY.observe(f"http {request.method} {path}", time.perf_counter() - start, status < 500)
+        count("safe_ro_http_requests_total", method=request.method, path=path, status=str(status))
+
+
+@app.exception_handler(MemoryError)
+async def memory_error_handler(request: Request, exc: MemoryError):
+    """
+    Scenes over the memory budget (see core.memory_budget) are refused with
+    413 before anything is read; a genuine MemoryError is answered with 503.
+    """
+    from fastapi.responses import JSONResponse
+
+    status = 413 if hasattr(exc, "budget") else 503
+    return JSONResponse({"error": str(exc) or "Out of memory"}, status_code=status)
+
+
 class NDVIRequest(BaseModel):
     red_path: str
     nir_path: str
+    # Also return the raster, encoded as "int16" or "uint8".
+    encoding: Optional[Literal["int16", "uint8"]] = None
+    # Answer with a coarse preview and a job_id to poll for full resolution.
+    preview: bool = False
 
 
 class FloodRequest(BaseModel):
     s1_path: str
     threshold: Optional[float] = None
+    # When set, compare against the region's dry-season baseline instead of
+    # thresholding the scene against its own percentile.
+    baseline_region: Optional[str] = None
+    # Local speckle filter applied before thresholding.
+    speckle_filter: Optional[Literal["median", "median_exact", "lee", "refined_lee"]] = None
+    # Also return the mask, encoded as "uint8", "packbits" or "rle".
+    encoding: Optional[Literal["uint8", "packbits", "rle"]] = None
+    # Answer with a coarse preview and a job_id to poll for full resolution
+    # (percentile/threshold detection on /flood only).
+    preview: bool = False
+
+
+class FloodPolygonsRequest(FloodRequest):
+    min_area_m2: float = 10000.0
+    # Douglas-Peucker tolerance, in pixels.
+    simplify: float = 1.0
+
+
+class ZonalRequest(BaseModel):
+    zones_path: str  # GeoJSON (or shapefile, if fiona is installed)
+    product: str = "ndvi"  # "ndvi" or "flood"
+    red_path: Optional[str] = None
+    nir_path: Optional[str] = None
+    s1_path: Optional[str] = None
+    threshold: Optional[float] = None
+    id_field: Optional[str] = None
+    name_field: Optional[str] = None
+
+
+class GEERequest(BaseModel):
+    product: str = "ndvi"  # "ndvi" or "flood"
+    start_date: str
+    end_date: str
+    # Region names from safe_ro.core.regions (default: all), or one bbox
+    # [west, south, east, north].
+    regions: Optional[List[str]] = None
+    bbox: Optional[List[float]] = None
+    # Statistics are computed on Earth Engine and no pixels are transferred,
+    # unless a raster is requested with an encoding (single region only).
+    encoding: Optional[str] = None
+    scale: Optional[float] = None
 
 
 @app.get("/health")
@@ -34,28 +136,358 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def _encoding_error(product, encoding):
+    """An error response if `encoding` is not one of `product`'s encodings, else None."""
+    from safe_ro.core.encodings import MASK_ENCODINGS, NDVI_ENCODINGS
+
+    choices = sorted(NDVI_ENCODINGS) if product == "ndvi" else list(MASK_ENCODINGS)
+    if encoding is not None and encoding not in choices:
+        return {"error": f"Unknown {product} encoding '{encoding}'. Choose from {choices}."}
+    return None
+
+
+def _speckle_error(method):
+    """An error response if `method` is not a known speckle filter, else None."""
+    from safe_ro.core.speckle import FILTERS
+
+    if method is not None and method not in FILTERS:
+        return {"error": f"Unknown speckle filter '{method}'. Choose from {list(FILTERS)}."}
+    return None
+
+
+def _ndvi_payload(ndvi, encoding):
+    from safe_ro.core.encodings import encode_result
+
+    import numpy as np
+
+    if ndvi is None:
+        return {"error": "Could not compute NDVI"}
+    # Nodata pixels are NaN (see core.band_math); NaN is not valid JSON.
+    if np.isnan(ndvi).all():
+        return {"error": "No valid NDVI pixels (every pixel is nodata)"}
+    stats = {
+        "min": float(np.nanmin(ndvi)),
+        "max": float(np.nanmax(ndvi)),
+        "mean": float(np.nanmean(ndvi)),
+    }
+    if encoding:
+        return {"stats": stats, "raster": encode_result(ndvi, "ndvi", encoding).to_dict()}
+    return {"stats": stats}
+
+
+def _flood_payload(mask, encoding):
+    from safe_ro.core.encodings import encode_result
+
+    if mask is None:
+        return {"error": "Could not compute flood mask"}
+    if not mask.size:
+        return {"error": "The flood mask is empty"}
+    flooded_percent = float(mask.mean() * 100.0)
+    if encoding:
+        return {
+            "flooded_area_percent": flooded_percent,
+            "raster": encode_result(mask, "mask", encoding).to_dict(),
+        }
+    return {"flooded_area_percent": flooded_percent}
+
+
+_PAYLOADS = {"ndvi": _ndvi_payload, "flood": _flood_payload}
+
+
+def _job_response(job):
+    """The job's latest result: the preview while refining, then the full resolution."""
+    with job.lock:
+        if "response" in job.meta:
+            return job.meta["response"]
+        if job.failed:
+            response = {"status": "failed", "error": str(job.error)}
+        else:
+            data, _, is_full = job.latest()
+            response = _PAYLOADS[job.meta["product"]](data, job.meta["encoding"])
+            response["status"] = "done" if is_full else "running"
+            response["downsample_factor"] = 1 if is_full else job.factor
+        response["job_id"] = job.id
+        if job.done:
+            # Later polls are answered from the final response; the arrays can go.
+            job.meta["response"] = response
+            raster = response.get("raster") or {}
+            job.release(sum(len(part["data"]) for part in raster.get("parts", {}).values()))
+        return response
+
+
+def _start_preview(product, run, shape, encoding):
+    from safe_ro.core.progressive import ProgressiveJob, register
+
+    job = ProgressiveJob(run, shape, product=product, encoding=encoding)
+    register(job)
+    return _job_response(job)
+
+
+# Identical concurrent analyses (e.g. many clients asking for the same scene
+# during a flood event) share one computation; see core.singleflight.
+def _ndvi_coalesced(proc, red_path, nir_path):
+    from safe_ro.core.singleflight import coalesce
+
+    result = coalesce("ndvi", {"red": red_path, "nir": nir_path}, proc.compute_ndvi)
+    if proc.red_band.crs is None and result[0] is not None:
+        proc.red_band.probe()  # computed by another request; callers may need the CRS
+    return result
+
+
+def _detect_coalesced(det, s1_path, threshold=None, speckle_filter=None):
+    from safe_ro.core.singleflight import coalesce
+
+    params = {"s1": s1_path, "threshold": threshold, "speckle_filter": speckle_filter}
+    result = coalesce(
+        "flood", params, lambda: det.detect(threshold=threshold, speckle_filter=speckle_filter)
+    )
+    if det.band.crs is None and result[0] is not None:
+        det.band.probe()
+    return result
+
+
 @app.post("/ndvi")
+@profiled("/ndvi")
 def ndvi_endpoint(req: NDVIRequest):
+    from safe_ro.core.safe_ro_core import NDVIProcessor
+
     proc = NDVIProcessor(req.red_path, req.nir_path)
-    ndvi, _ = proc.compute_ndvi()  # Unpack tuple
-    if ndvi is not None:
-        stats = {
-            "min": float(ndvi.min()),
-            "max": float(ndvi.max()),
-            "mean": float(ndvi.mean()),
-        }
-        return {"stats": stats}
-    return {"error": "Could not compute NDVI"}
+    if req.preview:
+        try:
+            shape = proc.red_band.probe()
+        except Exception as e:
+            return {"error": f"Could not open bands: {e}"}
+        return _start_preview(
+            "ndvi", lambda factor: proc.compute_ndvi(downsample_factor=factor), shape, req.encoding
+        )
+    ndvi, _ = _ndvi_coalesced(proc, req.red_path, req.nir_path)
+    return _ndvi_payload(ndvi, req.encoding)
 
 
 @app.post("/flood")
+@profiled("/flood")
 def flood_endpoint(req: FloodRequest):
+    from safe_ro.core.safe_ro_core import Sentinel1FloodDetector
+    from safe_ro.core.flood_baseline import BackscatterBaseline
+
+    det = Sentinel1FloodDetector(req.s1_path)
+    if req.baseline_region:
+        try:
+            baseline = BackscatterBaseline(req.baseline_region)
+        except ValueError as e:
+            return {"error": str(e)}
+        if not baseline.scenes:
+            return {"error": f"No baseline for region '{req.baseline_region}'"}
+        mask, _ = det.detect_change(baseline)
+    elif req.preview:
+        try:
+            shape = det.band.probe()
+        except Exception as e:
+            return {"error": f"Could not open band: {e}"}
+
+        def run(factor):
+            return det.detect(
+                threshold=req.threshold, speckle_filter=req.speckle_filter, downsample_factor=factor
+            )
+
+        return _start_preview("flood", run, shape, req.encoding)
+    else:
+        mask, _ = _detect_coalesced(det, req.s1_path, req.threshold, req.speckle_filter)
+    return _flood_payload(mask, req.encoding)
+
+
+@app.get("/jobs/{job_id}")
+def job_endpoint(job_id: str):
+    """Polls a preview job started with `preview: true`."""
+    from safe_ro.core.progressive import get_job
+
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"Unknown or expired job '{job_id}'"}
+    return _job_response(job)
+
+
+# -----------------------------------------------------------------------------
+# Multipart uploads, for clients without access to the server's file system
+# -----------------------------------------------------------------------------
+async def _run_upload(request, required, name, handler):
+    """
+    Streams the multipart body into upload buffers (see interfaces.uploads),
+    then runs `handler(sources, fields)` on a worker thread.
+    """
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import JSONResponse
+    from safe_ro.interfaces.uploads import UploadRejected, receive_upload
+
+    try:
+        async with receive_upload(request, required) as upload:
+            sources = {field: band.source for field, band in upload.files.items()}
+            return await run_in_threadpool(profile_call, name, handler, sources, upload.fields)
+    except UploadRejected as e:
+        headers = {"Retry-After": "1"} if e.status == 503 else None
+        return JSONResponse({"error": str(e)}, status_code=e.status, headers=headers)
+
+
+def _ndvi_upload(sources, fields):
+    from safe_ro.core.safe_ro_core import NDVIProcessor
+
+    encoding = fields.get("encoding") or None
+    error = _encoding_error("ndvi", encoding)
+    if error:
+        return error
+    ndvi, _ = NDVIProcessor(sources["red"], sources["nir"]).compute_ndvi()
+    return _ndvi_payload(ndvi, encoding)
+
+
+def _flood_upload(sources, fields):
+    from safe_ro.core.safe_ro_core import Sentinel1FloodDetector
+
+    try:
+        threshold = float(fields["threshold"]) if fields.get("threshold") else None
+    except ValueError:
+        return {"error": f"Invalid threshold '{fields['threshold']}'"}
+    encoding = fields.get("encoding") or None
+    speckle_filter = fields.get("speckle_filter") or None
+    error = _encoding_error("flood", encoding) or _speckle_error(speckle_filter)
+    if error:
+        return error
+    mask, _ = Sentinel1FloodDetector(sources["s1"]).detect(threshold=threshold, speckle_filter=speckle_filter)
+    return _flood_payload(mask, encoding)
+
+
+@app.post("/ndvi/upload")
+async def ndvi_upload_endpoint(request: Request):
+    """
+    multipart/form-data with `red` and `nir` band files and an optional
+    `encoding` field; answers like /ndvi.
+    """
+    return await _run_upload(request, ("red", "nir"), "/ndvi/upload", _ndvi_upload)
+
+
+@app.post("/flood/upload")
+async def flood_upload_endpoint(request: Request):
+    """
+    multipart/form-data with an `s1` file and optional `threshold`,
+    `speckle_filter` and `encoding` fields; answers like /flood.
+    """
+    return await _run_upload(request, ("s1",), "/flood/upload", _flood_upload)
+
+
+@app.post("/flood/polygons")
+@profiled("/flood/polygons")
+def flood_polygons_endpoint(req: FloodPolygonsRequest):
+    from safe_ro.core.safe_ro_core import Sentinel1FloodDetector
+    from safe_ro.core.flood_baseline import BackscatterBaseline
+    from safe_ro.core.vectorize import polygonize_mask
+
     det = Sentinel1FloodDetector(req.s1_path)
-    mask, _ = det.detect(threshold=req.threshold)  # Unpack tuple
-    if mask is not None:
-        flooded_percent = float(mask.mean() * 100.0)
-        return {"flooded_area_percent": flooded_percent}
-    return {"error": "Could not compute flood mask"}
+    if req.baseline_region:
+        try:
+            baseline = BackscatterBaseline(req.baseline_region)
+        except ValueError as e:
+            return {"error": str(e)}
+        if not baseline.scenes:
+            return {"error": f"No baseline for region '{req.baseline_region}'"}
+        mask, bounds = det.detect_change(baseline)
+    else:
+        mask, bounds = _detect_coalesced(det, req.s1_path, req.threshold, req.speckle_filter)
+    if mask is None:
+        return {"error": "Could not compute flood mask"}
+    return polygonize_mask(
+        mask,
+        bounds,
+        crs=det.band.crs,
+        min_area_m2=req.min_area_m2,
+        simplify=req.simplify,
+    )
+
+
+@app.post("/zonal")
+@profiled("/zonal")
+def zonal_endpoint(req: ZonalRequest):
+    from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+    from safe_ro.core.zonal import NDVI_BINS, ZoneLayer, zonal_stats
+
+    if req.product not in ("ndvi", "flood"):
+        return {"error": f"Unknown product '{req.product}'"}
+    try:
+        zones = ZoneLayer(req.zones_path, id_field=req.id_field, name_field=req.name_field)
+    except (OSError, ValueError, KeyError, ImportError) as e:
+        return {"error": f"Could not read zones from '{req.zones_path}': {e}"}
+    if req.product == "ndvi":
+        if not (req.red_path and req.nir_path):
+            return {"error": "red_path and nir_path are required for NDVI"}
+        proc = NDVIProcessor(req.red_path, req.nir_path)
+        values, bounds = _ndvi_coalesced(proc, req.red_path, req.nir_path)
+        crs, bins = proc.red_band.crs, NDVI_BINS
+    else:
+        if not req.s1_path:
+            return {"error": "s1_path is required for flood"}
+        det = Sentinel1FloodDetector(req.s1_path)
+        values, bounds = _detect_coalesced(det, req.s1_path, req.threshold)
+        crs, bins = det.band.crs, [0.0, 0.5, 1.0]
+
+    if values is None:
+        return {"error": f"Could not compute {req.product}"}
+    return {"zones": zonal_stats(zones, values, bounds=bounds, crs=crs, bins=bins)}
+
+
+@lru_cache(maxsize=1)
+def _gee_client():
+    from safe_ro.clients.gee_client import GEEClient
+
+    return GEEClient(project=os.environ.get("SAFE_RO_GEE_PROJECT"))
+
+
+@app.post("/gee")
+@profiled("/gee")
+def gee_endpoint(req: GEERequest):
+    from safe_ro.core.regions import REGIONS
+
+    if req.product not in ("ndvi", "flood"):
+        return {"error": f"Unknown product '{req.product}'"}
+    error = _encoding_error(req.product, req.encoding)
+    if error:
+        return error
+    if req.bbox:
+        regions = {"bbox": req.bbox}
+    else:
+        names = req.regions or list(REGIONS)
+        unknown = [name for name in names if name not in REGIONS]
+        if unknown:
+            return {"error": f"Unknown region(s): {', '.join(unknown)}"}
+        regions = {name: REGIONS[name] for name in names}
+    if req.encoding and len(regions) != 1:
+        return {"error": "A raster can only be requested for a single region or bbox"}
+
+    try:
+        client = _gee_client()
+    except Exception as e:
+        return {"error": f"Earth Engine is unavailable: {e}"}
+
+    if not req.encoding:
+        stats, error_msg = client.get_stats(
+            req.product, regions, req.start_date, req.end_date, scale=req.scale
+        )
+        if stats is None:
+            return {"error": error_msg}
+        return {"product": req.product, "regions": stats}
+
+    import ee
+
+    (name, bbox), = regions.items()
+    fetch = client.get_ndvi if req.product == "ndvi" else client.get_flood_data
+    data, bounds, error_msg = fetch(
+        ee.Geometry.Rectangle(list(bbox)), req.start_date, req.end_date, encoding=req.encoding
+    )
+    if data is None:
+        return {"error": error_msg}
+    return {"product": req.product, "region": name, "bounds": bounds, "raster": data.to_dict()}
 
 
 @app.get("/")
@@ -0,0 +1,211 @@
+"""
+Streaming multipart uploads for the API.
+
+Band files are parsed straight off the request stream: each file part is
+written chunk by chunk into a rasterio MemoryFile while it is small, and
+moved to a temporary file on disk once it grows past SAFE_RO_UPLOAD_MEMORY_MB.
+The request body is never held in memory as a whole, and the resulting
+sources open directly as RasterBands, so processing reads them window by
+window.
+
+Memory stays bounded by SAFE_RO_UPLOAD_CONCURRENCY x SAFE_RO_UPLOAD_MEMORY_MB:
+uploads beyond the concurrency limit are turned away with 503, and bodies
+larger than SAFE_RO_UPLOAD_MAX_MB with 413.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+
+from safe_ro.core.instrumentation import count, span
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get("SAFE_RO_UPLOAD_MAX_MB", "2048")) * 1024 * 1024)
+MEMORY_LIMIT_BYTES = int(float(os.environ.get("SAFE_RO_UPLOAD_MEMORY_MB", "64")) * 1024 * 1024)
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("SAFE_RO_UPLOAD_CONCURRENCY", "4"))
+# Where uploads that outgrow memory are spooled (default: the system temp dir).
+UPLOAD_DIR = os.environ.get("SAFE_RO_UPLOAD_DIR") or None
+# Plain form fields (encoding, threshold, ...) are tiny; anything larger is a client error.
+MAX_FIELD_BYTES = 64 * 1024
+
+_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+
+class UploadRejected(Exception):
+    """The upload cannot be accepted; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadedBand:
+    """One uploaded file: a MemoryFile while small, a temporary file once spilled."""
+
+    def __init__(self, filename, memory_limit):
+        from rasterio.io import MemoryFile
+
+        self.filename = filename or "upload"
+        self.memory_limit = memory_limit
+        self.size = 0
+        self.path = None
+        self._ext = os.path.splitext(self.filename)[1] or ".tif"
+        self._memfile = MemoryFile(ext=self._ext)
+        self._file = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self._file is None and self.size > self.memory_limit:
+            self._spill()
+        (self._file or self._memfile).write(chunk)
+
+    def _spill(self):
+        with span("upload.spill"):
+            self._file = tempfile.NamedTemporaryFile(delete=False, suffix=self._ext, dir=UPLOAD_DIR)
+            self.path = self._file.name
+            self._memfile.seek(0)
+            shutil.copyfileobj(self._memfile, self._file, 8 * 1024 * 1024)
+            self._memfile.close()
+            self._memfile = None
+        count("safe_ro_upload_spills_total")
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def source(self):
+        """A path or MemoryFile, ready to hand to RasterBand."""
+        return self.path or self._memfile
+
+    def close(self):
+        if self._memfile is not None:
+            self._memfile.close()
+        if self._file is not None:
+            self._file.close()
+            os.remove(self.path)
+
+
+class MultipartUpload:
+    """Feeds a multipart/form-data body into UploadedBands and form fields."""
+
+    def __init__(self, content_type, max_bytes):
+        from python_multipart.multipart import MultipartParser, parse_options_header
+
+        mime, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise UploadRejected(415, "Expected a multipart/form-data body.")
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.files = {}
+        self.fields = {}
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._part = None  # (field name, UploadedBand or bytearray)
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _on_headers_finished(self):
+        from python_multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        if b"filename" in options:
+            if name in self.files:
+                # The earlier band is closed with the others when the upload is.
+                raise UploadRejected(400, f"File field '{name}' was sent more than once.")
+            band = UploadedBand(options[b"filename"].decode("latin-1"), MEMORY_LIMIT_BYTES)
+            self.files[name] = band
+            self._part = (name, band)
+        else:
+            self._part = (name, bytearray())
+
+    def _on_part_data(self, data, start, end):
+        name, target = self._part
+        if isinstance(target, bytearray):
+            if len(target) + end - start > MAX_FIELD_BYTES:
+                raise UploadRejected(413, f"Form field '{name}' is too large.")
+            target.extend(data[start:end])
+        else:
+            target.write(data[start:end])
+
+    def _on_part_end(self):
+        name, target = self._part
+        if isinstance(target, bytearray):
+            self.fields[name] = target.decode("utf-8")
+        else:
+            target.finish()
+        self._part = None
+
+    def feed(self, chunk):
+        from python_multipart.exceptions import MultipartParseError
+
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadRejected(413, f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit.")
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise UploadRejected(400, f"Malformed multipart body: {e}")
+
+    def close(self):
+        for band in self.files.values():
+            band.close()
+
+
+@asynccontextmanager
+async def receive_upload(request, required=()):
+    """
+    Parses a multipart request as it streams in and yields the
+    MultipartUpload once the whole body is there. Raises UploadRejected if
+    the server is busy, the body is too large or a `required` file is missing.
+    Uploaded files are deleted when the block exits.
+    """
+    if _slots.locked():
+        count("safe_ro_upload_rejected_total", reason="busy")
+        raise UploadRejected(503, "Too many concurrent uploads; retry shortly.")
+    declared = request.headers.get("content-length")
+    if declared and int(declared) > MAX_UPLOAD_BYTES:
+        count("safe_ro_upload_rejected_total", reason="too_large")
+        raise UploadRejected(413, f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit.")
+
+    async with _slots:
+        upload = MultipartUpload(request.headers.get("content-type", ""), MAX_UPLOAD_BYTES)
+        try:
+            with span("upload.receive"):
+                async for chunk in request.stream():
+                    upload.feed(chunk)
+            missing = [name for name in required if name not in upload.files]
+            if missing:
+                raise UploadRejected(422, f"Missing file field(s): {', '.join(missing)}")
+            count("safe_ro_upload_bytes_total", upload.received)
+            yield upload
+        except UploadRejected as e:
+            if e.status == 413:
+                count("safe_ro_upload_rejected_total", reason="too_large")
+            raise
+        finally:
+            upload.close()
@@ -0,0 +1,43 @@
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.core import memoize, singleflight, zonal
+
+
+@pytest.fixture(autouse=True)
+def _isolated_caches(tmp_path_factory, monkeypatch):
+    """Memoized results, single-flight files and zone labels go to a temporary directory, not data/."""
+    root = tmp_path_factory.mktemp("caches")
+    dirs = {
+        "SAFE_RO_MEMO_DIR": str(root / "memo"),
+        "SAFE_RO_SINGLEFLIGHT_DIR": str(root / "singleflight"),
+        "SAFE_RO_ZONE_CACHE_DIR": str(root / "zone_labels"),
+    }
+    # For the worker processes and servers that tests start...
+    for name, path in dirs.items():
+        monkeypatch.setenv(name, path)
+    # ...and for this one, where the processors bind MEMO as a default argument.
+    if memoize.MEMO is not None:
+        monkeypatch.setattr(memoize.MEMO, "root", dirs["SAFE_RO_MEMO_DIR"])
+    monkeypatch.setattr(singleflight.FLIGHTS, "root", dirs["SAFE_RO_SINGLEFLIGHT_DIR"])
+    monkeypatch.setattr(zonal, "DEFAULT_LABEL_CACHE_DIR", dirs["SAFE_RO_ZONE_CACHE_DIR"])
+
+
+@pytest.fixture
+def write_raster():
+    """
+    write_raster(path, data, crs=..., transform=...) writes `data` as a
+    single-band GeoTIFF and returns its path as a string. GDAL opens files by
+    content, so these also stand in for JPEG2000 bands.
+    """
+
+    def write(path, data, crs="EPSG:4326", transform=from_origin(24.0, 46.0, 0.001, 0.001)):
+        with rasterio.open(
+            path, "w", driver="GTiff", width=data.shape[1], height=data.shape[0], count=1,
+            dtype=data.dtype, crs=crs, transform=transform,
+        ) as dst:
+            dst.write(data, 1)
+        return str(path)
+
+    return write
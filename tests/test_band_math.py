@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.core.band_math import INDICES, BandMath
+
+
+def _bands(shape=(23, 17), seed=3):
+    rng = np.random.default_rng(seed)
+    names = ("BLUE", "GREEN", "RED", "NIR", "SWIR1", "SWIR2")
+    return {name: rng.uniform(0.01, 0.6, shape).astype(np.float32) for name in names}
+
+
+@pytest.mark.parametrize("index", sorted(INDICES))
+def test_indices_match_numpy(index):
+    """Every built-in index matches the same formula evaluated with plain numpy."""
+    bands = _bands()
+    engine = BandMath(index)
+    expected = eval(INDICES[index], {}, {k: v.astype(np.float64) for k, v in bands.items()})
+
+    result = engine.evaluate(bands, block_rows=5)
+    assert set(engine.bands) <= set(bands)
+    assert np.allclose(result, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_band_planning_and_register_reuse():
+    engine = BandMath("EVI")
+    assert engine.bands == ["NIR", "RED", "BLUE"]
+    assert engine.register_count <= 3
+
+
+def test_zero_division_and_nodata(tmp_path):
+    """Zero denominators and nodata pixels come out as nodata, or a chosen fill."""
+    red = np.array([[0, 10, 20], [30, 40, 50]], dtype=np.uint16)
+    nir = np.array([[0, 30, 20], [0, 60, 80]], dtype=np.uint16)
+    paths = {}
+    for name, data in (("RED", red), ("NIR", nir)):
+        paths[name] = str(tmp_path / f"{name}.tif")
+        profile = {
+            "driver": "GTiff", "dtype": "uint16", "count": 1, "width": 3, "height": 2,
+            "crs": "EPSG:4326", "transform": from_origin(0, 2, 1, 1), "nodata": 50,
+        }
+        with rasterio.open(paths[name], "w", **profile) as dst:
+            dst.write(data, 1)
+
+    ndvi = BandMath("NDVI")
+    result = ndvi.evaluate(paths)
+    assert np.isnan(result[0, 0])  # 0 / 0
+    assert np.isnan(result[1, 2])  # RED is nodata
+    assert np.isclose(result[0, 1], 0.5)
+
+    filled = ndvi.evaluate(paths, zero_division=0.0, nodata=-9.0)
+    assert filled[0, 0] == 0.0 and filled[1, 2] == -9.0
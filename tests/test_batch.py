@@ -0,0 +1,88 @@
+import json
+import os
+import zipfile
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.__main__ import main
+from safe_ro.core.batch import discover_scenes, run_batch
+from safe_ro.core.cog import output_transform
+from safe_ro.core.safe_ro_core import RasterBand
+
+UTM = {"crs": "EPSG:32635", "transform": from_origin(500000, 5100000, 10, 10)}
+
+
+def _archive(tmp_path, write):
+    rng = np.random.default_rng(0)
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    write(archive / "A_RED.jp2", rng.integers(100, 2000, (96, 120)).astype(np.uint16), **UTM)
+    write(archive / "A_NIR.jp2", rng.integers(2000, 4000, (96, 120)).astype(np.uint16), **UTM)
+    write(archive / "B_VV.tiff", rng.uniform(0, 1, (64, 64)).astype(np.float32), **UTM)
+
+    red = write(tmp_path / "b04.tif", rng.integers(100, 2000, (48, 48)).astype(np.uint16), **UTM)
+    nir = write(tmp_path / "b08.tif", rng.integers(2000, 4000, (48, 48)).astype(np.uint16), **UTM)
+    with zipfile.ZipFile(archive / "S2X.zip", "w") as z:
+        z.write(red, "S2X.SAFE/GRANULE/L2A/IMG_DATA/R20m/T35_B04_20m.jp2")
+        z.write(red, "S2X.SAFE/GRANULE/L2A/IMG_DATA/R10m/T35_B04_10m.jp2")
+        z.write(nir, "S2X.SAFE/GRANULE/L2A/IMG_DATA/R10m/T35_B08_10m.jp2")
+        z.write(nir, "S2X.SAFE/GRANULE/L2A/IMG_DATA/R60m/T35_B08_60m.jp2")
+    return archive
+
+
+def test_discover_scenes(tmp_path, write_raster):
+    archive = _archive(tmp_path, write_raster)
+    scenes = {(s["id"], s["product"]): s for s in discover_scenes([str(archive)])}
+    assert set(scenes) == {("A", "ndvi"), ("B", "flood"), ("S2X", "ndvi")}
+    assert scenes[("A", "ndvi")]["sources"]["red"].endswith("A_RED.jp2")
+    zipped = scenes[("S2X", "ndvi")]["sources"]
+    assert zipped["red"].startswith("zip://") and "R10m/T35_B04_10m" in zipped["red"]
+    assert "R10m/T35_B08_10m" in zipped["nir"]
+
+    only_flood = discover_scenes([str(archive)], products=("flood",))
+    assert [(s["id"], s["product"]) for s in only_flood] == [("B", "flood")]
+
+
+def test_run_batch_writes_cogs_and_resumes(tmp_path, write_raster):
+    archive = _archive(tmp_path, write_raster)
+    out = tmp_path / "out"
+    summary = run_batch([str(archive)], str(out), workers=1, progress=lambda line: None)
+    assert (summary["processed"], summary["skipped"], summary["failed"]) == (3, 0, 0)
+
+    manifest = {(e["id"], e["product"]): e for e in json.load(open(out / "manifest.json"))["scenes"]}
+    assert abs(manifest[("B", "flood")]["stats"]["flooded_area_percent"] - 20.0) < 0.1
+    assert -1 <= manifest[("A", "ndvi")]["stats"]["mean"] <= 1
+    with rasterio.open(manifest[("A", "ndvi")]["output"]) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert src.shape == (96, 120) and src.crs.to_epsg() == 32635
+
+    summary = run_batch([str(archive)], str(out), workers=1, progress=lambda line: None)
+    assert (summary["processed"], summary["skipped"]) == (0, 3)
+
+    # A newer input makes only its scene stale.
+    future = os.path.getmtime(out / "A_NDVI.tif") + 10
+    os.utime(archive / "A_NIR.jp2", (future, future))
+    summary = run_batch([str(archive)], str(out), workers=1, progress=lambda line: None)
+    assert (summary["processed"], summary["skipped"]) == (1, 2)
+    assert len(json.load(open(out / "manifest.json"))["scenes"]) == 3
+
+
+def test_batch_cli_reports_failures(tmp_path, capsys):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    (archive / "C_VV.tiff").write_bytes(b"not a raster")
+    code = main(["batch", str(archive), "--out", str(tmp_path / "out"), "--workers", "1", "--json"])
+    assert code == 1
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["failed"] == 1
+
+
+def test_output_transform_scales_to_result_shape(tmp_path, write_raster):
+    band = RasterBand(write_raster(tmp_path / "band.tif", np.zeros((40, 60), np.uint16), **UTM))
+    band.probe()
+    assert output_transform(band, (40, 60)) == band.transform
+    half = output_transform(band, (20, 30))
+    assert (half.a, half.e) == (20.0, -20.0)
+    assert (half.c, half.f) == (band.transform.c, band.transform.f)
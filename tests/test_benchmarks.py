@@ -0,0 +1,50 @@
+import numpy as np
+import rasterio
+
+import synthetic
+from run_benchmarks import build_cases, case_id, compare
+
+
+def _results(**cases):
+    return {"cases": [{"id": k, **v} for k, v in cases.items()]}
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = _results(
+        a={"wall_s": 1.0, "tracemalloc_peak_mb": 100.0, "peak_rss_mb": 200.0},
+        b={"wall_s": 0.001, "tracemalloc_peak_mb": 0.1, "peak_rss_mb": 100.0},
+    )
+    current = _results(
+        a={"wall_s": 1.4, "tracemalloc_peak_mb": 110.0, "peak_rss_mb": 200.0},
+        # 3x slower but within the noise floor
+        b={"wall_s": 0.003, "tracemalloc_peak_mb": 0.3, "peak_rss_mb": 100.0},
+        new={"wall_s": 9.0, "tracemalloc_peak_mb": 1.0, "peak_rss_mb": 1.0},
+    )
+    regressions = compare(current, baseline, threshold=0.25)
+    assert [(r["id"], r["metric"]) for r in regressions] == [("a", "wall_s")]
+    assert regressions[0]["change"] == 0.4
+    assert compare(current, baseline, threshold=0.5) == []
+
+
+def test_compare_skips_failed_cases():
+    baseline = _results(a={"wall_s": 1.0, "tracemalloc_peak_mb": 1.0, "peak_rss_mb": 1.0})
+    assert compare(_results(a={"error": "exit code -9"}), baseline, 0.1) == []
+
+
+def test_build_cases_matrix():
+    cases = build_cases(["load", "map"], [1024], ["tiled", "striped"], ["deflate"])
+    assert [case_id(c) for c in cases] == [
+        "load/1024/tiled-deflate",
+        "load/1024/striped-deflate",
+        "map/1024",
+    ]
+
+
+def test_synthetic_rasters_are_deterministic(tmp_path):
+    paths = synthetic.ensure_dataset(str(tmp_path / "a"), 96, "striped", "none")
+    again = synthetic.ensure_dataset(str(tmp_path / "b"), 96, "striped", "none")
+    for kind in ("red", "nir", "vv", "nir_half"):
+        with rasterio.open(paths[kind]) as a, rasterio.open(again[kind]) as b:
+            assert np.array_equal(a.read(), b.read())
+    with rasterio.open(paths["nir_half"]) as src:
+        assert src.shape == (48, 48)
@@ -0,0 +1,140 @@
+import os
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+from rasterio.transform import from_origin
+
+from safe_ro.__main__ import main
+from safe_ro.core.catalog import Catalog, parse_scene_name
+
+S2_OLD = "S2A_MSIL2A_20240501T092031_N0510_R093_T35TMN_20240501T120000"
+S2_NEW = "S2B_MSIL2A_20240611T092029_N0510_R093_T35TMN_20240611T113000"
+IASI = from_origin(27.4, 47.4, 0.01, 0.01)
+
+
+@pytest.fixture
+def archive(tmp_path, write_raster):
+    write = partial(write_raster, transform=IASI)
+    rng = np.random.default_rng(7)
+    root = tmp_path / "archive"
+    root.mkdir()
+    for scene in (S2_OLD, S2_NEW):
+        write(root / f"{scene}_RED.tif", rng.integers(100, 2000, (60, 60)).astype(np.uint16))
+        write(root / f"{scene}_NIR.tif", rng.integers(2000, 4000, (60, 60)).astype(np.uint16))
+    # The newer scene is mostly cloud (SCL 9), the older one clear (SCL 4).
+    write(root / f"{S2_OLD}_SCL.tif", np.full((30, 30), 4, np.uint8))
+    scl = np.full((30, 30), 9, np.uint8)
+    scl[:5] = 4
+    write(root / f"{S2_NEW}_SCL.tif", scl)
+    return root
+
+
+def test_parse_scene_name():
+    assert parse_scene_name(S2_OLD) == ("S2", "2024-05-01T09:20:31Z")
+    assert parse_scene_name("scene") == (None, None)
+
+
+def test_index_local_and_query(archive, tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    assert catalog.index_local([str(archive)]) == {"indexed": 6, "unchanged": 0, "removed": 0, "failed": 0}
+
+    iasi = [27.5, 47.0, 27.8, 47.3]
+    newest = catalog.latest(bbox=iasi, sensor="S2")
+    assert newest["name"] == S2_NEW and newest["cloud_cover"] > 80
+    red = newest["bands"]["red"]
+    assert red["source"] == "local" and red["location"] == str(archive / f"{S2_NEW}_RED.tif")
+    assert red["crs"] == "EPSG:4326" and red["resolution"] == pytest.approx(0.01)
+    assert red["checksum"].startswith("sha256:")
+
+    assert catalog.latest(bbox=iasi, max_cloud=20)["name"] == S2_OLD
+    assert catalog.find(bbox=iasi, end="2024-05-01") == catalog.find(bbox=iasi, max_cloud=20)
+    assert catalog.find(bbox=[21.1, 45.6, 21.4, 45.9]) == []  # Timisoara is not covered
+    assert catalog.find(bands=("red", "nir", "vv")) == []
+
+    # Incremental: nothing changed, then a scene disappears.
+    assert catalog.index_local([str(archive)])["unchanged"] == 6
+    for band in ("RED", "NIR", "SCL"):
+        os.remove(archive / f"{S2_NEW}_{band}.tif")
+    assert catalog.index_local([str(archive)])["removed"] == 3
+    assert [s["name"] for s in catalog.find()] == [S2_OLD]
+
+    # Batch jobs take their scenes from the catalog.
+    (scene,) = catalog.batch_scenes(["ndvi"], bbox=iasi, max_cloud=20)
+    assert scene["id"] == S2_OLD and set(scene["sources"]) == {"red", "nir", "scl"}
+
+
+def test_a_band_and_its_jpeg2000_source_index_once(archive, tmp_path, write_raster):
+    write_raster(archive / f"{S2_OLD}_RED.jp2", np.ones((60, 60), np.uint16), transform=IASI)
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    assert catalog.index_local([str(archive)])["indexed"] == 6
+    assert catalog.index_local([str(archive)]) == {"indexed": 0, "unchanged": 6, "removed": 0, "failed": 0}
+    red = catalog.latest(max_cloud=20)["bands"]["red"]
+    assert red["location"] == str(archive / f"{S2_OLD}_RED.tif")
+
+
+def test_batch_cli_filters_through_the_catalog(archive, tmp_path):
+    out = tmp_path / "batch"
+    code = main([
+        "batch", str(archive), "--out", str(out), "--products", "ndvi", "--max-cloud", "20",
+        "--catalog", str(tmp_path / "catalog.sqlite"), "--workers", "1",
+    ])
+    assert code == 0
+    assert os.listdir(out) and all(S2_NEW not in name for name in os.listdir(out))
+    assert any(S2_OLD in name for name in os.listdir(out))
+
+
+def test_drive_and_cdse_sources():
+    catalog = Catalog(":memory:")
+    files = [
+        {"id": "r1", "title": f"Iasi_{S2_NEW}_RED.jp2", "md5Checksum": "ab", "fileSize": "10"},
+        {"id": "n1", "title": f"Iasi_{S2_NEW}_NIR.jp2"},
+        {"id": "v1", "title": "Baia Mare_S1A_IW_GRDH_1SDV_20240610T160000_VV.tiff"},
+        {"id": "x", "title": "notes.txt"},
+    ]
+    assert catalog.index_drive(files) == 3
+    scene = catalog.latest(bbox=[27.6, 47.1, 27.7, 47.2])
+    assert scene["name"] == S2_NEW and scene["footprint"] == pytest.approx([27.5, 47.0, 27.8, 47.3])
+    assert scene["bands"]["red"] == {
+        "source": "drive", "location": "gdrive:r1", "crs": None, "resolution": None,
+        "width": None, "height": None, "checksum": "md5:ab", "mtime": None,
+    }
+    assert catalog.latest(bands=("vv",), sensor="S1")["footprint"] == pytest.approx([23.4, 47.5, 23.7, 47.8])
+
+    catalog.index_cdse([{
+        "Id": "c-1", "Name": f"{S2_NEW}.SAFE", "ContentLength": 900,
+        "ContentDate": {"Start": "2024-06-11T09:20:29.024Z"},
+        "GeoFootprint": {"type": "Polygon", "coordinates": [[[26, 46], [29, 46], [29, 48], [26, 48], [26, 46]]]},
+        "Attributes": [{"Name": "cloudCover", "Value": 12.5}],
+        "Checksum": [{"Algorithm": "MD5", "Value": "ff"}],
+    }])
+    (cdse,) = catalog.find(bbox=[26.5, 46.5, 28.5, 47.5], sensor="S2", max_cloud=20)
+    assert cdse["name"] == f"{S2_NEW}.SAFE" and cdse["acquired"] == "2024-06-11T09:20:29Z"
+    assert cdse["bands"]["scl"]["location"] == "cdse:c-1" and cdse["bands"]["red"]["checksum"] == "md5:ff"
+
+    # Files no longer on Drive are dropped; CDSE results stay.
+    catalog.index_drive(files[2:])
+    assert [s["name"] for s in catalog.find()] == [f"{S2_NEW}.SAFE"]
+
+
+def test_queries_take_milliseconds():
+    catalog = Catalog(":memory:")
+    rng = np.random.default_rng(8)
+    products = []
+    for i in range(5000):
+        west, south = rng.uniform(20, 29), rng.uniform(43, 48)
+        day = 1 + i % 28
+        products.append({
+            "Id": f"id-{i}", "Name": f"S2A_MSIL2A_202405{day:02d}T0920{i % 60:02d}_N0510_R093_T{i:05d}",
+            "GeoFootprint": {"type": "Polygon", "coordinates": [[[west, south], [west + 1, south + 1]]]},
+            "Attributes": [{"Name": "cloudCover", "Value": float(rng.uniform(0, 100))}],
+        })
+    catalog.index_cdse(products)
+
+    started = time.perf_counter()
+    for _ in range(20):
+        scene = catalog.latest(bbox=[27.5, 47.0, 27.8, 47.3], sensor="S2", max_cloud=10)
+    elapsed = (time.perf_counter() - started) / 20
+    assert scene is not None and scene["cloud_cover"] <= 10
+    assert elapsed < 0.05
@@ -0,0 +1,144 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytest
+import requests
+
+from safe_ro.clients.cdse_client import S1_FILTER, S2_FILTER, CDSESearch
+from safe_ro.core.catalog import Catalog
+
+
+def _product(i, west, south, day, collection="SENTINEL-2"):
+    sensor = "S2A_MSIL2A" if collection == "SENTINEL-2" else "S1A_IW_GRDH_1SDV"
+    return {
+        "Id": f"id-{i}", "Name": f"{sensor}_202406{day:02d}T0920{i % 60:02d}_T{i:04d}.SAFE",
+        "Collection": collection,
+        "ContentDate": {"Start": f"2024-06-{day:02d}T09:20:{i % 60:02d}.000Z"},
+        "GeoFootprint": {"type": "Polygon", "coordinates": [[
+            [west, south], [west + 0.5, south], [west + 0.5, south + 0.5], [west, south + 0.5], [west, south],
+        ]]},
+        "Attributes": [{"Name": "cloudCover", "Value": 5.0}],
+    }
+
+
+class ODataStandIn:
+    """A local stand-in for the CDSE OData Products endpoint."""
+
+    def __init__(self, products):
+        self.products = products
+        self.requests = []
+        self.fail = False
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.requests.append(self.path)
+                if stand_in.fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                body = json.dumps(stand_in.page(parse_qs(urlparse(self.path).query))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/odata/v1/Products"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def page(self, params):
+        query = params["$filter"][0]
+        collection = re.search(r"Collection/Name eq '([^']+)'", query).group(1)
+        boxes = [
+            [float(v) for v in re.findall(r"-?[\d.]+", polygon)]
+            for polygon in re.findall(r"POLYGON\(\(([^)]*)\)\)", query)
+        ]
+        op, since = re.search(r"ContentDate/Start (ge|gt) (\S+?)\)?$", query).groups()
+
+        def matches(p):
+            (ring,) = p["GeoFootprint"]["coordinates"]
+            w, s = ring[0]
+            e, n = ring[2]
+            start = p["ContentDate"]["Start"]
+            return (
+                p["Collection"] == collection
+                and (start > since if op == "gt" else start >= since)
+                and any(w <= max(b[0::2]) and e >= min(b[0::2]) and s <= max(b[1::2]) and n >= min(b[1::2])
+                        for b in boxes)
+            )
+
+        found = sorted(filter(matches, self.products), key=lambda p: p["ContentDate"]["Start"])
+        top, skip = int(params["$top"][0]), int(params.get("$skip", ["0"])[0])
+        page = {"value": found[skip:skip + top]}
+        if skip + top < len(found):
+            page["@odata.nextLink"] = f"{self.url}?{urlencode({**{k: v[0] for k, v in params.items()}, '$skip': skip + top})}"
+        return page
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+REGIONS = {f"R{i}": [20.0 + i * 0.2, 44.0, 20.1 + i * 0.2, 44.1] for i in range(40)}
+
+
+@pytest.fixture
+def odata():
+    # One S2 scene over each of the first 30 regions on two days; nothing optical for the rest.
+    products = [_product(i, 20.0 + i * 0.2, 43.9, day) for day in (3, 9) for i in range(30)]
+    products = [{**p, "Id": f"{p['Id']}-{p['ContentDate']['Start'][8:10]}"} for p in products]
+    products += [_product(100 + i, 20.0 + i * 0.2, 43.9, 5, "SENTINEL-1") for i in range(30, 40)]
+    stand_in = ODataStandIn(products)
+    yield stand_in
+    stand_in.close()
+
+
+def test_forty_regions_take_a_handful_of_requests(odata, tmp_path):
+    search = CDSESearch(odata.url, cache_dir=str(tmp_path), page_size=25)
+    s2 = search.search(S2_FILTER, REGIONS, top=1)
+    # Two batches of 25 + 15 regions; the first needs two pages of 25 products.
+    assert len(odata.requests) == 3
+    newest = s2["R0"][0]
+    assert newest["ContentDate"]["Start"].startswith("2024-06-09") and len(s2["R0"]) == 1
+    assert not s2["R35"]
+
+    cloudy = {name: bbox for name, bbox in REGIONS.items() if not s2[name]}
+    s1 = search.search(S1_FILTER, cloudy, top=1)
+    assert len(odata.requests) == 4 and all(len(s1[name]) == 1 for name in cloudy)
+
+    # Search results feed the scene catalog.
+    catalog = Catalog(":memory:")
+    catalog.index_cdse(p for products in s2.values() for p in products)
+    assert catalog.latest(bbox=REGIONS["R0"])["bands"]["red"]["location"] == f"cdse:{newest['Id']}"
+
+
+def test_cached_results_refresh_incrementally(odata, tmp_path):
+    search = CDSESearch(odata.url, cache_dir=str(tmp_path))
+    first = search.search(S2_FILTER, REGIONS)
+    assert len(odata.requests) == 2
+
+    # Within max_age nothing is asked for.
+    assert search.search(S2_FILTER, REGIONS) == first
+    assert len(odata.requests) == 2
+
+    # Afterwards only products newer than the last one seen.
+    odata.products.append({**_product(7, 21.4, 43.9, 20), "Id": "new"})
+    search.max_age = 0
+    refreshed = search.search(S2_FILTER, REGIONS)
+    assert len(odata.requests) == 4
+    assert all("ContentDate/Start gt 2024-06-09T" in parse_qs(urlparse(path).query)["$filter"][0]
+               for path in odata.requests[2:])
+    assert refreshed["R7"][0]["Id"] == "new" and len(refreshed["R7"]) == len(first["R7"]) + 1
+
+    # An outage falls back to the cache.
+    odata.fail = True
+    assert search.search(S2_FILTER, REGIONS) == refreshed
+    with pytest.raises(requests.HTTPError):
+        CDSESearch(odata.url, cache_dir=str(tmp_path / "empty")).search(S2_FILTER, REGIONS)
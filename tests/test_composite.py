@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.__main__ import main
+from safe_ro.core.cog import CogWriter
+from safe_ro.core.composite import discover_composite_scenes, median_composite
+
+HEIGHT, WIDTH = 128, 160
+
+
+def _utm(resolution=10):
+    return {"crs": "EPSG:32635", "transform": from_origin(500000, 5100000, resolution, resolution)}
+
+
+def _scene(write, root, name, red, nir, cloud, width=WIDTH):
+    """A scene with constant reflectances and a 20 m SCL marking `cloud` (10 m slices) as cloud."""
+    shape = (HEIGHT, width)
+    scl = np.full((HEIGHT // 2, width // 2), 4, dtype=np.uint8)  # vegetation
+    rows, cols = cloud
+    scl[rows.start // 2 : rows.stop // 2, cols.start // 2 : cols.stop // 2] = 9
+    red_band = np.full(shape, red, dtype=np.uint16)
+    nir_band = np.full(shape, nir, dtype=np.uint16)
+    red_band[rows, cols] = nir_band[rows, cols] = 6000  # bright cloud tops
+    write(root / f"{name}_RED.jp2", red_band, **_utm())
+    write(root / f"{name}_NIR.jp2", nir_band, **_utm())
+    write(root / f"{name}_SCL.jp2", scl, **_utm(20))
+
+
+@pytest.fixture
+def archive(tmp_path, write_raster):
+    root = tmp_path / "Iasi"
+    root.mkdir()
+    _scene(write_raster, root, "A", 1000, 3000, (slice(0, 32), slice(0, WIDTH)))
+    _scene(write_raster, root, "B", 1000, 5000, (slice(0, 32), slice(0, WIDTH)))
+    # C only covers the left half of the grid and is cloudy on its left edge.
+    _scene(write_raster, root, "C", 2000, 3000, (slice(0, HEIGHT), slice(0, 40)), width=80)
+    return root
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_median_composite_masks_clouds(archive, tmp_path):
+    scenes = discover_composite_scenes([str(archive)])
+    assert [s["id"] for s in scenes] == ["A", "B", "C"]
+    assert all(s["sources"]["scl"].endswith("_SCL.jp2") for s in scenes)
+
+    out = tmp_path / "composite.tif"
+    summary = median_composite(scenes, str(out), window_size=48, workers=2)
+    assert (summary["width"], summary["height"], summary["scenes"]) == (WIDTH, HEIGHT, 3)
+
+    with rasterio.open(out) as src:
+        assert src.profile["tiled"] and src.crs.to_epsg() == 32635
+        ndvi = src.read(1)
+
+    # Cloudy in A and B, outside C or cloudy there too: no clear observation.
+    assert np.isnan(ndvi[:32, :40]).all() and np.isnan(ndvi[:32, 80:]).all()
+    # Only C is clear: (3000 - 2000) / 5000.
+    np.testing.assert_allclose(ndvi[:32, 40:80], 0.2, atol=1e-6)
+    # Median of all three: red 1000, nir 3000.
+    np.testing.assert_allclose(ndvi[32:, 40:80], 0.5, atol=1e-6)
+    # Median of A and B: red 1000, nir 4000.
+    np.testing.assert_allclose(ndvi[32:, :40], 0.6, atol=1e-6)
+    np.testing.assert_allclose(ndvi[32:, 80:], 0.6, atol=1e-6)
+
+    clear = (32 * 40 + 96 * WIDTH) / (HEIGHT * WIDTH)
+    assert summary["clear_fraction"] == pytest.approx(clear)
+
+
+def test_composite_cli(archive, tmp_path, capsys):
+    out = tmp_path / "cli" / "Iasi_NDVI.tif"
+    assert main(["composite", str(archive), "--out", str(out), "--workers", "1", "--json"]) == 0
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["output"] == str(out) and out.exists()
+    assert main(["composite", str(tmp_path / "empty")]) == 1
+
+
+def test_cog_writer_leaves_nothing_behind_on_error(tmp_path):
+    path = tmp_path / "partial.tif"
+    with pytest.raises(RuntimeError):
+        with CogWriter(str(path), 64, 64, np.float32, from_origin(0, 64, 1, 1), "EPSG:32635") as out:
+            out.write(np.zeros((64, 64), np.float32))
+            raise RuntimeError("window failed")
+    assert list(tmp_path.iterdir()) == []
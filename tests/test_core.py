@@ -1,3 +1,4 @@
+import io
 import os
 import sys
 import numpy as np
@@ -85,3 +86,102 @@ def test_flood_detection(create_dummy_raster):
     assert flood_mask.shape == (10, 10)
     assert np.all(np.isin(flood_mask, [0, 1]))
     print("✅ Flood detection test passed.")
+
+
+def test_raster_band_from_buffer(create_dummy_raster):
+    """Tests loading a band from an in-memory upload and from a spooled stream."""
+    dummy_path = create_dummy_raster("test_band_buffer")
+    with open(dummy_path, "rb") as f:
+        payload = f.read()
+
+    band = RasterBand(io.BytesIO(payload))
+    data = band.load()
+    assert data is not None
+    assert data.shape == (10, 10)
+    assert band.bounds is not None
+
+    # Stream-only sources take the chunked spool-to-disk path.
+    spooled = RasterBand(io.BufferedReader(io.BytesIO(payload)))
+    spooled.CHUNK_SIZE = 64
+    assert np.array_equal(spooled.load(), data)
+
+
+_PEAK_RSS_SCRIPT = """
+import resource, sys
+import numpy as np
+from rasterio.io import MemoryFile
+from safe_ro.core.safe_ro_core import RasterBand
+
+path, how = sys.argv[1:]
+with open(path, "rb") as f:
+    upload = bytearray(f.seek(0, 2))
+    f.seek(0)
+    f.readinto(upload)
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if how == "band":
+    data = RasterBand(upload).load()
+else:  # the previous upload path: the buffer copied into /vsimem, then a float32 copy
+    with MemoryFile(memoryview(upload)) as memfile, memfile.open() as src:
+        data = src.read(1).astype(np.float32)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="ru_maxrss is in kB on Linux only")
+def test_buffer_uploads_are_read_in_place(tmp_path):
+    """Loading an uploaded buffer costs at most half the peak memory of the MemoryFile copy."""
+    import subprocess
+
+    path = tmp_path / "band.tif"
+    data = np.random.default_rng(0).random((4096, 4096), dtype=np.float32)  # 64 MB
+    profile = {
+        "driver": "GTiff", "dtype": "float32", "count": 1, "width": 4096, "height": 4096,
+        "crs": "EPSG:4326", "transform": rasterio.transform.from_origin(24.0, 46.0, 1e-4, 1e-4),
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+    def peak_growth_kb(how):
+        out = subprocess.run(
+            [sys.executable, "-c", _PEAK_RSS_SCRIPT, str(path), how],
+            capture_output=True, text=True, check=True,
+            # A small GDAL block cache, so only the copies of the band are measured.
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path), "GDAL_CACHEMAX": "16"},
+        )
+        return int(out.stdout.split()[-1])
+
+    in_place, copied = peak_growth_kb("band"), peak_growth_kb("memoryfile")
+    assert in_place < 2 * data.nbytes / 1024  # the float32 result, plus the block cache
+    assert 2 * in_place <= copied
+
+
+def test_flood_detection_with_speckle_filter(create_dummy_raster):
+    """Tests that every local speckle filter runs and is seamless across tiles."""
+    from safe_ro.core.speckle import speckle_filter
+
+    s1_path = create_dummy_raster("test_s1_vv_speckle", dtype="float32", width=40, height=30)
+    detector = Sentinel1FloodDetector(s1_path)
+    data = RasterBand(s1_path).load()
+
+    for method in ("median", "lee", "refined_lee"):
+        flood_mask, _ = detector.detect(speckle_filter=method)
+        assert flood_mask.shape == (30, 40)
+        tiled = speckle_filter(data, method=method, tile_size=8)
+        whole = speckle_filter(data, method=method, tile_size=64)
+        assert np.allclose(tiled, whole, atol=1e-3)
+
+
+def test_quantized_median_is_close_to_the_exact_one():
+    from safe_ro.core.speckle import LEVELS, speckle_filter
+
+    rng = np.random.default_rng(8)
+    data = rng.gamma(4.4, 0.05, (300, 260)).astype(np.float32)
+    data[5, 7] = np.nan
+    fast = speckle_filter(data, method="median", tile_size=128)
+    exact = speckle_filter(data, method="median_exact", tile_size=128)
+    assert np.isnan(fast[5, 7])
+    valid = ~np.isnan(exact)
+    # Within the spacing of neighbouring quantization levels.
+    spacing = (np.nanmax(data) - np.nanmin(data)) / LEVELS
+    assert np.nanmax(np.abs(fast - exact)[valid]) < spacing
+    assert np.abs(fast - exact)[valid].mean() < spacing / 10
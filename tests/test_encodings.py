@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from safe_ro.core.encodings import (
+    NDVI_ENCODINGS,
+    EncodedRaster,
+    encode_mask,
+    encode_ndvi,
+)
+
+
+@pytest.mark.parametrize("encoding, tolerance", [("int16", 5e-5), ("uint8", 5e-3)])
+def test_ndvi_round_trip_accuracy(encoding, tolerance):
+    """Encoded NDVI decodes within half a quantization step and keeps nodata."""
+    rng = np.random.default_rng(42)
+    ndvi = rng.uniform(-1, 1, (64, 48)).astype(np.float32)
+    ndvi[3, 5] = np.nan
+
+    encoded = encode_ndvi(ndvi, encoding)
+    assert encoded.parts["data"].dtype == NDVI_ENCODINGS[encoding]["dtype"]
+
+    # Through the JSON serializer, as the API sends it.
+    decoded = EncodedRaster.from_dict(json.loads(json.dumps(encoded.to_dict()))).decode()
+    assert np.isnan(decoded[3, 5])
+    valid = ~np.isnan(ndvi)
+    assert np.abs(decoded[valid] - ndvi[valid]).max() <= tolerance + 1e-6
+
+
+@pytest.mark.parametrize("encoding", ["uint8", "packbits", "rle"])
+def test_mask_round_trip_is_lossless(encoding):
+    """Masks round-trip exactly, both local uint8 masks and GEE float masks with NaN."""
+    rng = np.random.default_rng(7)
+    mask = (rng.random((37, 29)) < 0.2).astype(np.uint8)
+
+    encoded = encode_mask(mask, encoding)
+    decoded = EncodedRaster.from_dict(json.loads(json.dumps(encoded.to_dict()))).decode()
+    assert decoded.dtype == np.uint8
+    assert np.array_equal(decoded, mask)
+    if encoding == "packbits":
+        assert encoded.nbytes == (mask.size + 7) // 8
+
+    gee_mask = mask.astype(np.float32)
+    gee_mask[gee_mask == 0] = np.nan  # selfMask()-ed GEE output
+    gee_mask[0, :3] = 0
+    decoded = encode_mask(gee_mask, encoding).decode()
+    assert np.array_equal(np.isnan(decoded), np.isnan(gee_mask))
+    assert np.array_equal(np.nan_to_num(decoded), np.nan_to_num(gee_mask))
+
+
+@pytest.mark.parametrize("encoding", ["uint8", "packbits", "rle"])
+def test_uniform_and_empty_masks(encoding):
+    for mask in (np.zeros((6, 4), np.uint8), np.ones((6, 4), np.uint8), np.zeros((0, 4), np.uint8)):
+        encoded = encode_mask(mask, encoding)
+        decoded = EncodedRaster.from_dict(json.loads(json.dumps(encoded.to_dict()))).decode()
+        assert decoded.shape == mask.shape and np.array_equal(decoded, mask)
+    if encoding == "rle":
+        assert len(encode_mask(np.zeros((6, 4), np.uint8), "rle").parts["lengths"]) == 1
+
+
+def test_api_rejects_unknown_encodings():
+    from fastapi.testclient import TestClient
+    from safe_ro.interfaces.safe_ro_api import app
+
+    client = TestClient(app)
+    response = client.post("/ndvi", json={"red_path": "r.tif", "nir_path": "n.tif", "encoding": "png"})
+    assert response.status_code == 422
+    response = client.post("/flood", json={"s1_path": "vv.tif", "encoding": "int16"})
+    assert response.status_code == 422
+    dates = {"start_date": "2024-05-01", "end_date": "2024-05-31", "regions": ["Iasi"]}
+    response = client.post("/gee", json={"product": "flood", "encoding": "int16", **dates})
+    assert "Unknown flood encoding" in response.json()["error"]
+    response = client.post("/flood/upload", files={"s1": ("vv.tif", b"II*\x00", "image/tiff")},
+                           data={"encoding": "bogus"})
+    assert response.status_code == 200 and "Unknown flood encoding" in response.json()["error"]
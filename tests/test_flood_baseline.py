@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+from rasterio.transform import from_origin
+
+from safe_ro.core.flood_baseline import BackscatterBaseline
+from safe_ro.core.safe_ro_core import Sentinel1FloodDetector
+from safe_ro.interfaces.safe_ro_api import app
+
+
+def _write_scene(path, data):
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "crs": "EPSG:4326",
+        "transform": from_origin(24.5, 46.0, 0.01, 0.01),
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data.astype(np.float32), 1)
+    return str(path)
+
+
+def test_change_detection_ignores_permanently_dark_areas(tmp_path):
+    """A permanently dark patch must not be flagged; a new drop elsewhere must be."""
+    rng = np.random.default_rng(0)
+    dry = np.full((40, 30), -8.0, dtype=np.float32)
+    dry[:10, :10] = -22.0  # permanent water / radar shadow
+
+    baseline = BackscatterBaseline("TestRegion", root=str(tmp_path / "baselines"))
+    for i in range(6):
+        scene = dry + rng.normal(0, 0.5, dry.shape)
+        assert baseline.update(_write_scene(tmp_path / f"dry_{i}.tif", scene), block_rows=7)
+    assert not baseline.update(str(tmp_path / "dry_0.tif"))  # already folded in
+
+    flood = dry + rng.normal(0, 0.5, dry.shape)
+    flood[25:35, 15:25] = -20.0
+    reopened = BackscatterBaseline("TestRegion", root=str(tmp_path / "baselines"))
+    detector = Sentinel1FloodDetector(_write_scene(tmp_path / "flood.tif", flood))
+    mask, bounds = detector.detect_change(reopened, k=3.0, min_drop=3.0, block_rows=7)
+
+    assert bounds is not None
+    assert mask[25:35, 15:25].all()
+    assert not mask[:10, :10].any()
+    assert mask.sum() == 100
+
+
+def test_baselines_are_read_only_and_replaced_whole(tmp_path):
+    root = tmp_path / "baselines"
+    with pytest.raises(ValueError, match="Invalid baseline region"):
+        BackscatterBaseline("../../etc", root=str(root))
+    response = TestClient(app).post(
+        "/flood/polygons", json={"s1_path": "x.tif", "baseline_region": "../outside"}
+    )
+    assert "Invalid baseline region" in response.json()["error"]
+
+    baseline = BackscatterBaseline("Baia Mare", root=str(root))
+    for i in range(2):
+        baseline.update(_write_scene(tmp_path / f"dry_{i}.tif", np.full((6, 5), -8.0 - i)))
+    region = root / "Baia Mare"
+    # Only the current version of the statistics is kept.
+    assert sorted(os.listdir(region)) == [
+        "baseline.json", "baseline.lock", "count.2.npy", "mean.2.npy", "std.2.npy",
+    ]
+
+    reader = BackscatterBaseline("Baia Mare", root=str(root))
+    reader.flag_drops(np.full((6, 5), -8.0, np.float32), slice(0, 6))
+    assert not reader._open()["mean"].flags.writeable
+    # A reader keeps the version it mapped while an update replaces it.
+    baseline.update(_write_scene(tmp_path / "dry_2.tif", np.full((6, 5), -10.0)))
+    assert reader._open()["count"].max() == 2
+    assert BackscatterBaseline("Baia Mare", root=str(root))._open()["count"].max() == 3
+
+
+def test_concurrent_updates_keep_every_scene(tmp_path):
+    """Sessions that opened the baseline before each other's updates all get folded in."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = str(tmp_path / "baselines")
+    scenes = [_write_scene(tmp_path / f"dry_{i}.tif", np.full((6, 5), -8.0 - i)) for i in range(8)]
+    baselines = [BackscatterBaseline("Shared", root=root) for _ in scenes]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(pool.map(lambda i: baselines[i].update(scenes[i]), range(8)))
+
+    baseline = BackscatterBaseline("Shared", root=root)
+    assert sorted(baseline.scenes) == sorted(scenes)
+    assert baseline._open()["count"].min() == 8
+    assert baseline._open()["mean"][0, 0] == pytest.approx(-11.5)
@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from safe_ro.core.regions import REGIONS
+from safe_ro.interfaces import safe_ro_api
+from safe_ro.interfaces.safe_ro_api import app
+
+
+class FakeGEEClient:
+    def __init__(self):
+        self.calls = []
+
+    def get_stats(self, product, regions, start_date, end_date, scale=None):
+        self.calls.append(("stats", product, dict(regions)))
+        return {name: {"mean": 0.5, "pixels": 100} for name in regions}, None
+
+    def get_ndvi(self, *args, **kwargs):
+        self.calls.append(("ndvi",))
+        raise AssertionError("no pixels should be downloaded for statistics")
+
+
+def test_gee_endpoint_uses_server_side_stats(monkeypatch):
+    fake = FakeGEEClient()
+    monkeypatch.setattr(safe_ro_api, "_gee_client", lambda: fake)
+    client = TestClient(app)
+
+    body = client.post("/gee", json={"start_date": "2024-05-01", "end_date": "2024-05-31"}).json()
+    assert set(body["regions"]) == set(REGIONS)
+    assert fake.calls == [("stats", "ndvi", REGIONS)]
+
+    body = client.post(
+        "/gee",
+        json={"product": "flood", "regions": ["Iasi", "Cluj"], "start_date": "2024-05-01", "end_date": "2024-05-31"},
+    ).json()
+    assert set(body["regions"]) == {"Iasi", "Cluj"}
+    assert fake.calls[-1][:2] == ("stats", "flood")
+
+
+def test_gee_endpoint_validation(monkeypatch):
+    monkeypatch.setattr(safe_ro_api, "_gee_client", FakeGEEClient)
+    client = TestClient(app)
+    dates = {"start_date": "2024-05-01", "end_date": "2024-05-31"}
+
+    assert "Unknown region" in client.post("/gee", json={"regions": ["Atlantis"], **dates}).json()["error"]
+    assert "Unknown product" in client.post("/gee", json={"product": "fire", **dates}).json()["error"]
+    # Rasters are only fetched for one region at a time.
+    assert "single region" in client.post("/gee", json={"encoding": "int16", **dates}).json()["error"]
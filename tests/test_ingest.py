@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+
+from safe_ro.core import ingest
+from safe_ro.core.batch import discover_scenes
+from safe_ro.core.ingest import transcode_band, transcode_bands, verify_identical
+
+
+def _jp2(path, data):
+    staged = f"{path}.tif"
+    with rasterio.open(
+        staged, "w", driver="GTiff", width=data.shape[1], height=data.shape[0], count=1,
+        dtype=data.dtype, crs="EPSG:32635", transform=from_origin(500000, 5100000, 10, 10),
+    ) as dst:
+        dst.write(data, 1)
+    rasterio.shutil.copy(staged, path, driver="JP2OpenJPEG", reversible="YES", quality="100")
+    os.remove(staged)
+    return str(path)
+
+
+@pytest.fixture
+def bands(tmp_path):
+    rng = np.random.default_rng(4)
+    return [
+        _jp2(tmp_path / "S2X_RED.jp2", rng.integers(1, 10000, (1100, 1300)).astype(np.uint16)),
+        _jp2(tmp_path / "S2X_NIR.jp2", rng.integers(1, 10000, (1100, 1300)).astype(np.uint16)),
+    ]
+
+
+def test_transcode_bands_to_identical_cogs(bands, tmp_path):
+    cogs = transcode_bands(bands, workers=2, remove_source=True)
+    assert cogs == [str(tmp_path / "S2X_RED.tif"), str(tmp_path / "S2X_NIR.tif")]
+    assert not any(os.path.exists(band) for band in bands)
+
+    with rasterio.open(cogs[0]) as cog:
+        assert cog.driver == "GTiff" and cog.profile["tiled"]
+        assert cog.overviews(1)  # previews read from overviews
+        assert cog.crs.to_epsg() == 32635 and cog.dtypes[0] == "uint16"
+
+    # The COGs are what later stages find and analyse.
+    (scene,) = discover_scenes([str(tmp_path)])
+    assert scene["sources"] == {"red": cogs[0], "nir": cogs[1]}
+
+
+def test_transcode_verifies_pixels(bands, tmp_path, monkeypatch):
+    cog = transcode_band(bands[0])
+    assert verify_identical(bands[0], cog)
+    assert not verify_identical(bands[1], cog)
+
+    digests = iter([b"written"] + [b"other"] * 10)
+    monkeypatch.setattr(ingest, "_digest", lambda block: next(digests))
+    with pytest.raises(ValueError, match="pixel for pixel"):
+        transcode_band(bands[1], str(tmp_path / "bad.tif"))
+    assert not (tmp_path / "bad.tif").exists()
+
+
+def test_failed_bands_keep_their_source(bands, tmp_path):
+    broken = tmp_path / "S2Y_RED.jp2"
+    broken.write_bytes(b"not a raster")
+    out_dir = tmp_path / "cogs"
+    result = transcode_bands([bands[0], str(broken)], out_dir=str(out_dir))
+    assert result == [str(out_dir / "S2X_RED.tif"), str(broken)]
+    assert broken.exists() and os.path.exists(bands[0])
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from safe_ro.core import instrumentation
+from safe_ro.core.instrumentation import Registry, begin_trace, count, span
+
+
+def test_spans_feed_registry_and_trace():
+    trace = begin_trace()
+    with span("test.ok"):
+        pass
+    with pytest.raises(ValueError):
+        with span("test.fail"):
+            raise ValueError("boom")
+
+    assert [(stage, ok) for stage, _, ok in trace] == [("test.ok", True), ("test.fail", False)]
+    summary = instrumentation.stage_summary()
+    assert summary["test.ok"]["count"] == 1 and summary["test.ok"]["errors"] == 0
+    assert summary["test.fail"]["errors"] == 1
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    registry.observe("ndvi.index", 0.02)
+    registry.observe("ndvi.index", 3.0)
+    registry.inc("safe_ro_http_requests_total", path="/ndvi", status="200")
+    registry.inc("safe_ro_http_requests_total", path="/ndvi", status="200")
+    text = registry.render_prometheus()
+
+    assert "# TYPE safe_ro_stage_seconds histogram" in text
+    assert 'safe_ro_stage_seconds_bucket{stage="ndvi.index",le="0.01"} 0' in text
+    assert 'safe_ro_stage_seconds_bucket{stage="ndvi.index",le="0.025"} 1' in text
+    assert 'safe_ro_stage_seconds_bucket{stage="ndvi.index",le="+Inf"} 2' in text
+    assert 'safe_ro_stage_seconds_count{stage="ndvi.index"} 2' in text
+    assert "# TYPE safe_ro_http_requests_total counter" in text
+    assert 'safe_ro_http_requests_total{path="/ndvi",status="200"} 2' in text
+
+
+def test_slow_calls_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "PROFILE_ENABLED", True)
+    monkeypatch.setattr(instrumentation, "PROFILE_SLOW_MS", 0.0)
+    monkeypatch.setattr(instrumentation, "PROFILE_DIR", str(tmp_path))
+
+    @instrumentation.profiled("/ndvi")
+    def handler(n):
+        count("test_profiled_calls_total")
+        return sum(range(n))
+
+    assert handler(1000) == sum(range(1000))
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 2
+    assert names[0].endswith(".prof") and names[1].endswith(".tracemalloc.txt")
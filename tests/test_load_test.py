@@ -0,0 +1,79 @@
+import io
+
+import pandas as pd
+import pytest
+import requests
+
+from load_test import load_scenario, percentile, run_scenario, summarize
+from safe_ro.clients.cdse_client import S2_FILTER, CDSESearch
+from safe_ro.core.catalog import Catalog
+from safe_ro.core.regions import REGIONS
+from stand_ins import Profile, StandIns
+
+
+@pytest.fixture
+def stand_ins(tmp_path):
+    with StandIns(str(tmp_path / "data"), {"firms": Profile(failure_rate=1.0)}, size=128) as s:
+        yield s
+
+
+def test_summarize_percentiles_and_errors():
+    samples = [(i / 1000, True, "200") for i in range(1, 101)] + [(0.5, False, "503")]
+    summary = summarize(samples, seconds=2.0)
+    assert summary["requests"] == 101 and summary["throughput_rps"] == 50.5
+    assert (summary["p50_ms"], summary["p99_ms"]) == (51.0, 100.0)
+    assert summary["errors"] == {"503": 1} and summary["error_rate"] == pytest.approx(1 / 101, abs=1e-4)
+    assert percentile([], 50) is None
+
+
+def test_stand_ins_feed_the_clients(stand_ins, tmp_path):
+    # Range reads, as GDAL's /vsicurl/ does them.
+    r = requests.get(stand_ins.url("gee", "red.tif"), headers={"Range": "bytes=0-3"})
+    assert r.status_code == 206 and r.content in (b"II*\x00", b"II+\x00")
+
+    # CDSE search, paged and cached by the client.
+    search = CDSESearch(stand_ins.url("cdse"), cache_dir=str(tmp_path / "cache"), page_size=10)
+    found = search.search(S2_FILTER, REGIONS, top=2)
+    assert all(len(products) == 2 for products in found.values())
+    assert stand_ins.stats["cdse"]["requests"] > 1
+
+    # The Drive listing, as the Local Analysis tab catalogues it.
+    catalog = Catalog(":memory:")
+    catalog.index_drive(requests.get(stand_ins.url("drive")).json()["items"])
+    assert catalog.latest(bbox=REGIONS["Iasi"], covering=False, sources=("drive",)) is not None
+
+    # FIRMS is set to always fail.
+    r = requests.get(stand_ins.url("firms", "KEY/VIIRS_SNPP_NRT/27.5,47.0,27.8,47.3/1"))
+    assert r.status_code == 503 and stand_ins.stats["firms"] == {"requests": 1, "failures": 1}
+    stand_ins.profiles["firms"] = Profile()
+    fires = pd.read_csv(io.StringIO(requests.get(stand_ins.url("firms", "KEY/VIIRS_SNPP_NRT/27.5,47.0,27.8,47.3/1")).text))
+    assert list(fires.columns[:4]) == ["latitude", "longitude", "bright_ti4", "confidence"]
+    assert fires["latitude"].between(47.0, 47.3).all()
+
+
+def test_run_scenario_against_a_started_api(tmp_path):
+    scenario = {
+        "stand_ins": {"gee": {"latency_ms": 5}},
+        "requests": {"root": {"method": "GET", "path": "/"}},
+        "phases": [{"name": "smoke", "duration_s": 1.0, "concurrency": 2,
+                    "mix": {"ndvi": 1, "flood": 1, "root": 1}}],
+    }
+    report = run_scenario(scenario, data_dir=str(tmp_path / "data"), size=128, progress=lambda _: None)
+    (phase,) = report["phases"]
+    assert phase["total"]["requests"] > 0 and phase["total"]["error_rate"] == 0.0
+    assert set(phase["requests"]) <= {"ndvi", "flood", "root"}
+    assert report["worker_peak_rss_mb"] and all(mb > 0 for mb in report["worker_peak_rss_mb"].values())
+    assert report["stand_ins"]["gee"]["requests"] > 0
+
+    # Drive rasters, zonal statistics, polled previews and uploads.
+    names = ("ndvi_drive", "zonal_flood", "flood_preview", "ndvi_upload")
+    scenario = {"phases": [{"name": name, "duration_s": 0.5, "concurrency": 2, "mix": {name: 1}} for name in names]}
+    report = run_scenario(scenario, data_dir=str(tmp_path / "data"), size=128, progress=lambda _: None)
+    for name, phase in zip(names, report["phases"]):
+        summary = phase["requests"][name]
+        assert summary["requests"] > 0 and summary["error_rate"] == 0.0, (name, summary)
+    assert report["stand_ins"]["drive"]["requests"] > 0
+
+    with pytest.raises(ValueError, match="unknown request"):
+        run_scenario({"phases": [{"name": "x", "duration_s": 1, "concurrency": 1, "mix": {"nope": 1}}]})
+    assert load_scenario("flood_event")["phases"][1]["name"] == "spike"
@@ -0,0 +1,122 @@
+import io
+import os
+import threading
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.core import memoize
+from safe_ro.core.instrumentation import REGISTRY
+from safe_ro.core.memoize import DiskMemo
+from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+
+
+def _raster(path, seed, size=64, dtype="uint16"):
+    data = np.random.default_rng(seed).integers(1, 4000, (size, size)).astype(dtype)
+    with rasterio.open(
+        path, "w", driver="GTiff", width=size, height=size, count=1, dtype=dtype,
+        crs="EPSG:32635", transform=from_origin(500000, 5000000, 10, 10),
+    ) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+def _hits(operation):
+    return REGISTRY.counter(memoize.METRIC, operation=operation, result="hit")
+
+
+@pytest.fixture
+def bands(tmp_path):
+    return _raster(tmp_path / "red.tif", 1), _raster(tmp_path / "nir.tif", 2)
+
+
+def test_repeat_ndvi_is_served_from_the_memo(tmp_path, bands):
+    memo = DiskMemo(str(tmp_path / "memo"))
+    ndvi, bounds = NDVIProcessor(*bands, memo=memo).compute_ndvi()
+    assert len(os.listdir(memo.root)) == 1
+
+    hits = _hits("ndvi")
+    again, again_bounds = NDVIProcessor(*bands, memo=memo).compute_ndvi()
+    assert _hits("ndvi") == hits + 1
+    np.testing.assert_array_equal(again, ndvi)
+    assert again_bounds == bounds
+
+    # Encodings are applied to the memoized result, not part of the key.
+    encoded, _ = NDVIProcessor(*bands, memo=memo).compute_ndvi(encoding="int16")
+    assert _hits("ndvi") == hits + 2 and encoded.encoding == "int16"
+
+    # The stored COG keeps the result's georeferencing.
+    (stored,) = os.listdir(memo.root)
+    with rasterio.open(os.path.join(memo.root, stored)) as src:
+        assert src.bounds == bounds and src.crs == "EPSG:32635"
+
+    # Previews are another result.
+    preview, _ = NDVIProcessor(*bands, memo=memo).compute_ndvi(downsample_factor=2)
+    assert preview.shape == (32, 32) and len(os.listdir(memo.root)) == 2
+
+
+def test_keys_follow_inputs_parameters_and_version(tmp_path, bands):
+    memo = DiskMemo(str(tmp_path / "memo"))
+    red, nir = bands
+    key = memo.key("ndvi", {"red": red, "nir": nir}, version=1, downsample_factor=1)
+    assert memo.key("ndvi", {"nir": nir, "red": red}, downsample_factor=1, version=1) == key
+    assert memo.key("ndvi", {"red": red, "nir": nir}, version=2, downsample_factor=1) != key
+    assert memo.key("ndvi", {"red": red, "nir": nir}, version=1, downsample_factor=2) != key
+
+    os.utime(red, ns=(0, 0))  # a rewritten input is a different analysis
+    assert memo.key("ndvi", {"red": red, "nir": nir}, version=1, downsample_factor=1) != key
+
+    # Buffers are keyed by content; streams and remote files are not cached.
+    with open(red, "rb") as f:
+        content = f.read()
+    assert memo.key("x", {"b": content}) == memo.key("x", {"b": io.BytesIO(content)})
+    assert memo.key("x", {"b": io.BufferedReader(io.BytesIO(content))}) is None
+    assert memo.key("x", {"b": "/vsicurl/http://example.com/red.tif"}) is None
+
+
+def test_flood_masks_are_keyed_by_threshold(tmp_path):
+    memo = DiskMemo(str(tmp_path / "memo"))
+    vv = _raster(tmp_path / "vv.tif", 3, dtype="float32")
+    first, _ = Sentinel1FloodDetector(vv, memo=memo).detect(threshold=1000)
+    other, _ = Sentinel1FloodDetector(vv, memo=memo).detect(threshold=2000)
+    assert not np.array_equal(first, other) and len(os.listdir(memo.root)) == 2
+
+    hits = _hits("flood")
+    again, _ = Sentinel1FloodDetector(vv, memo=memo).detect(threshold=1000)
+    assert _hits("flood") == hits + 1
+    assert again.dtype == np.uint8 and np.array_equal(again, first)
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    memo = DiskMemo(str(tmp_path))
+    data = np.random.default_rng(0).random((64, 64), dtype=np.float32)
+    transform = from_origin(0, 64, 1, 1)
+    for i, key in enumerate(("a-1", "b-1", "c-1")):
+        memo.save(key, data + i, transform, None)
+        os.utime(memo._path(key), (1000 + i, 1000 + i))
+    assert memo.load("a-1") is not None  # now the most recently used
+
+    memo.max_bytes = sum(os.path.getsize(memo._path(k)) for k in ("a-1", "c-1")) + 1
+    stale = tmp_path / "d-1.123.tmp.tif"
+    stale.write_bytes(b"partial")
+    os.utime(stale, (0, 0))
+    memo.save("c-1", data + 2, transform, None)
+    assert sorted(os.listdir(tmp_path)) == ["a-1.tif", "c-1.tif"]
+    assert memo.load("b-1") is None
+
+
+def test_concurrent_writers_leave_one_complete_result(tmp_path):
+    memo = DiskMemo(str(tmp_path))
+    data = np.random.default_rng(0).random((256, 256), dtype=np.float32)
+    threads = [
+        threading.Thread(target=memo.save, args=("k-1", data, from_origin(0, 256, 1, 1), None))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert os.listdir(tmp_path) == ["k-1.tif"]
+    np.testing.assert_array_equal(memo.load("k-1"), data)
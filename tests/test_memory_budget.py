@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from safe_ro.core import memory_budget
+from safe_ro.core.instrumentation import REGISTRY
+from safe_ro.core.memory_budget import MB, MemoryBudgetExceeded, plan
+from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+from safe_ro.interfaces.safe_ro_api import app
+
+
+def _strategies(operation):
+    return {
+        strategy: REGISTRY.counter(memory_budget.METRIC, operation=operation, strategy=strategy)
+        for strategy in ("full", "windowed", "downsample", "reject")
+    }
+
+
+def test_plan_prefers_the_first_strategy_that_fits():
+    estimates = {"full": 800 * MB, "windowed": 100 * MB}
+    assert plan("t.plan", estimates, budget=1024 * MB).strategy == "full"
+    assert plan("t.plan", estimates, budget=200 * MB).strategy == "windowed"
+
+    chosen = plan("t.plan", estimates, scaled=lambda f: 800 * MB / f**2, budget=60 * MB)
+    assert (chosen.strategy, chosen.downsample_factor) == ("downsample", 4)
+
+    before = _strategies("t.plan")
+    with pytest.raises(MemoryBudgetExceeded) as info:
+        plan("t.plan", estimates, scaled=lambda f: 800 * MB / f**2, budget=1 * MB)
+    assert info.value.budget == 1 * MB and "memory budget" in str(info.value)
+    assert _strategies("t.plan")["reject"] == before["reject"] + 1
+
+    assert plan("t.plan", estimates, budget=0).strategy == "full"  # guard disabled
+
+
+@pytest.mark.parametrize("threshold", [None, 0.3])
+def test_windowed_flood_detection_matches_full(tmp_path, monkeypatch, threshold, write_raster):
+    rng = np.random.default_rng(5)
+    path = write_raster(tmp_path / "vv.tif", rng.uniform(0, 1, (600, 500)).astype(np.float32))
+    expected, _ = Sentinel1FloodDetector(path).detect(threshold=threshold, speckle_filter="median")
+
+    # Too small for the 4-5 MB in-memory run, enough for 100-row blocks.
+    monkeypatch.setattr(memory_budget, "BUDGET_MB", 3.5)
+    monkeypatch.setattr(Sentinel1FloodDetector, "WINDOW_PIXELS", 100 * 500)
+    detector = Sentinel1FloodDetector(path)
+    mask, bounds = detector.detect(threshold=threshold, speckle_filter="median")
+    assert detector.memory_plan.strategy == "windowed"
+    assert bounds is not None
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_ndvi_downsamples_or_rejects(tmp_path, monkeypatch, write_raster):
+    rng = np.random.default_rng(6)
+    red = write_raster(tmp_path / "red.tif", rng.integers(100, 2000, (400, 400)).astype(np.uint16))
+    nir = write_raster(tmp_path / "nir.tif", rng.integers(2000, 4000, (400, 400)).astype(np.uint16))
+
+    monkeypatch.setattr(memory_budget, "BUDGET_MB", 1)
+    proc = NDVIProcessor(red, nir)
+    ndvi, _ = proc.compute_ndvi()
+    assert proc.memory_plan.strategy == "downsample"
+    assert ndvi.shape == (400 // proc.memory_plan.downsample_factor,) * 2
+
+    monkeypatch.setattr(memory_budget, "BUDGET_MB", 0.001)
+    with pytest.raises(MemoryBudgetExceeded):
+        NDVIProcessor(red, nir).compute_ndvi()
+
+    response = TestClient(app).post("/ndvi", json={"red_path": red, "nir_path": nir})
+    assert response.status_code == 413 and "memory budget" in response.json()["error"]
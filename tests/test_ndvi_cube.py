@@ -0,0 +1,53 @@
+import datetime
+import os
+
+import numpy as np
+
+from safe_ro.core.ndvi_cube import NDVICube
+
+
+def test_cube_append_and_queries(tmp_path):
+    """Appends a linear NDVI ramp and checks mean, trend and anomaly per pixel."""
+    cube = NDVICube("TestRegion", root=str(tmp_path))
+    cube.CHUNK_ROWS = 3  # exercise several row blocks on a small raster
+    start = datetime.date(2024, 4, 1)
+    bounds = [24.5, 45.5, 25.5, 46.0]
+    for i in range(5):
+        ndvi = np.full((7, 5), 0.1 * i, dtype=np.float32)
+        ndvi[0, 0] = np.nan
+        cube.append(ndvi, bounds, start + datetime.timedelta(days=73 * i))
+
+    reopened = NDVICube("TestRegion", root=str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.bounds == bounds
+
+    mean = reopened.mean()
+    assert np.isnan(mean[0, 0])
+    assert np.allclose(mean[1:], 0.2, atol=1e-3)
+
+    # 0.1 NDVI every 73 days is 0.5 NDVI per year.
+    assert np.allclose(reopened.trend()[1:], 0.5, atol=1e-2)
+
+    z = reopened.anomaly(start + datetime.timedelta(days=292))
+    assert np.all(z[1:] > 1.0)
+
+
+def test_concurrent_appends_keep_every_slice(tmp_path):
+    """Sessions that opened the cube before each other's appends all land in the index."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    start = datetime.date(2024, 4, 1)
+    cubes = [NDVICube("Shared", root=str(tmp_path)) for _ in range(12)]
+
+    def append(i):
+        ndvi = np.full((4, 3), 0.05 * i, np.float32)
+        cubes[i].append(ndvi, [24, 45, 25, 46], start + datetime.timedelta(days=i))
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(append, range(12)))
+
+    cube = NDVICube("Shared", root=str(tmp_path))
+    assert cube.dates == [start + datetime.timedelta(days=i) for i in range(12)]
+    assert sorted(os.listdir(tmp_path / "Shared")) == sorted(
+        ["cube.json", "cube.lock"] + [f"{d.isoformat()}.npy" for d in cube.dates]
+    )
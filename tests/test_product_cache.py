@@ -0,0 +1,32 @@
+import numpy as np
+
+from safe_ro.clients.product_cache import ProductCache
+from safe_ro.core.encodings import encode_ndvi
+
+
+def _product(mb):
+    return np.zeros(int(mb * 1024 * 1024) // 4, np.float32), [0, 0, 1, 1], None
+
+
+def test_least_recently_used_products_are_evicted_by_count_and_bytes():
+    cache = ProductCache(max_entries=3, max_bytes=10 * 1024 * 1024)
+    for key in "abc":
+        cache.put(key, _product(1))
+    assert cache.get("a") is not None  # now the most recently used
+    cache.put("d", _product(1))
+    assert "b" not in cache and len(cache) == 3
+
+    # Bytes bound too: a large product pushes out older ones.
+    cache.put("e", _product(9))
+    assert list(cache._entries) == ["d", "e"] and cache.nbytes == 10 * 1024 * 1024
+
+    # Replacing an entry does not count it twice; an oversized one is still kept alone.
+    cache.put("e", _product(1))
+    assert cache.nbytes == 2 * 1024 * 1024
+    cache.put("f", _product(20))
+    assert list(cache._entries) == ["f"] and cache.get("d") is None
+
+    # Encoded products are counted by their encoded size.
+    encoded = encode_ndvi(np.zeros((100, 100), np.float32), "uint8")
+    cache.put("g", (encoded, None, None))
+    assert cache.nbytes == encoded.nbytes
@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import pytest
+
+from safe_ro.core.progressive import ProgressiveJob, get_job, preview_factor, register
+from safe_ro.core.safe_ro_core import NDVIProcessor, Sentinel1FloodDetector
+
+
+def test_preview_factor():
+    assert preview_factor((1000, 2048)) == 1
+    assert preview_factor((5000, 8192)) == 4
+    assert preview_factor((10980, 10980)) == 8
+
+
+def test_processor_previews(tmp_path, write_raster):
+    rng = np.random.default_rng(1)
+    red = write_raster(tmp_path / "red.tif", rng.uniform(0.05, 0.2, (64, 80)).astype(np.float32))
+    nir = write_raster(tmp_path / "nir.tif", rng.uniform(0.3, 0.6, (64, 80)).astype(np.float32))
+    nir_half = write_raster(tmp_path / "nir_half.tif", rng.uniform(0.3, 0.6, (32, 40)).astype(np.float32))
+
+    full, bounds = NDVIProcessor(red, nir).compute_ndvi()
+    preview, preview_bounds = NDVIProcessor(red, nir).compute_ndvi(downsample_factor=4)
+    assert preview.shape == (16, 20) and preview_bounds == bounds
+    assert abs(preview.mean() - full.mean()) < 0.05
+
+    # Bands of different resolution are both read at the preview size.
+    mixed, _ = NDVIProcessor(red, nir_half).compute_ndvi(downsample_factor=8)
+    assert mixed.shape == (8, 10)
+
+    mask, _ = Sentinel1FloodDetector(red).detect(downsample_factor=4, encoding="packbits")
+    assert mask.shape == (16, 20)
+
+
+def test_progressive_job_refines_in_background(tmp_path):
+    calls = []
+
+    def run(factor):
+        calls.append(factor)
+        if factor == 1:
+            time.sleep(0.05)
+        return np.full((64 // factor, 64 // factor), float(factor)), [0, 0, 1, 1]
+
+    job = ProgressiveJob(run, (64, 64), factor=4, product="test")
+    assert job.preview.shape == (16, 16) and job.meta == {"product": "test"}
+    assert register(job) == job.id and get_job(job.id) is job
+
+    data, bounds = job.result(timeout=5)
+    assert data.shape == (64, 64) and bounds == [0, 0, 1, 1]
+    assert job.done and not job.failed
+    assert job.latest()[2] is True
+    assert calls == [4, 1]
+
+    # Small scenes skip the preview and are complete right away.
+    small = ProgressiveJob(run, (64, 64))
+    assert small.factor == 1 and small.done and small.preview.shape == (64, 64)
+
+
+def test_api_preview_and_polling(tmp_path, write_raster):
+    from fastapi.testclient import TestClient
+
+    from safe_ro.interfaces.safe_ro_api import app
+
+    rng = np.random.default_rng(2)
+    vv = write_raster(tmp_path / "vv.tif", rng.uniform(0.0, 0.2, (40, 40)).astype(np.float32))
+    client = TestClient(app)
+
+    response = client.post("/flood", json={"s1_path": vv, "preview": True}).json()
+    # Too small for a preview: answered at full resolution straight away.
+    assert response["status"] == "done" and response["downsample_factor"] == 1
+    assert client.get(f"/jobs/{response['job_id']}").json() == response
+    # Once answered in full, the job only keeps its response.
+    assert get_job(response["job_id"]).preview is None
+    assert "error" in client.get("/jobs/unknown").json()
+
+
+def test_overlay_png_decodes_to_colormap():
+    import base64
+    import io
+
+    from matplotlib import cm
+    from PIL import Image
+
+    from safe_ro.interfaces.map_render import overlay_png
+
+    ndvi = np.array([[-1.0, 0.0, np.nan], [1.0, 0.5, np.nan]], dtype=np.float32)
+    url = overlay_png(ndvi, "ndvi")
+    assert url.startswith("data:image/png;base64,")
+
+    image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+    assert image.mode == "P" and image.size == (3, 2)
+    rgba = np.asarray(image.convert("RGBA")).astype(int)
+    expected = (cm.RdYlGn((ndvi + 1) / 2) * 255).astype(int)
+    valid = ~np.isnan(ndvi)
+    assert np.abs(rgba[valid, :3] - expected[valid, :3]).max() <= 2
+    assert (rgba[~valid, 3] == 0).all() and (rgba[valid, 3] == 255).all()
+
+
+def test_registry_is_bounded_by_bytes_and_idle_time(monkeypatch):
+    from safe_ro.core import progressive
+
+    def run(factor):
+        return np.zeros((256 // factor, 256 // factor), np.float32), [0, 0, 1, 1]
+
+    monkeypatch.setattr(progressive, "_jobs", type(progressive._jobs)())
+    monkeypatch.setattr(progressive, "MAX_JOB_MB", 0.5)  # two 256 KB results
+    first, second, third = (ProgressiveJob(run, (256, 256)) for _ in range(3))
+    register(first)
+    register(second)
+    assert get_job(first.id) is first  # polled: now the most recently used
+    register(third)
+    assert get_job(second.id) is None and get_job(first.id) is first
+
+    # Released jobs only count what the caller kept.
+    first.release(kept_nbytes=100)
+    assert first.preview is None and first.nbytes == 100
+    with pytest.raises(RuntimeError, match="released"):
+        first.result()
+
+    monkeypatch.setattr(progressive, "JOB_TTL", 0.0)
+    time.sleep(0.01)
+    assert get_job(third.id) is None
@@ -0,0 +1,87 @@
+import gc
+import os
+
+import numpy as np
+import pytest
+
+from safe_ro.core.encodings import EncodedRaster, encode_ndvi
+from safe_ro.core.result_store import ResultStore
+
+BOUNDS = [26.0, 44.3, 26.2, 44.5]
+
+
+def _ndvi(seed=0, size=64):
+    return np.random.default_rng(seed).uniform(-1, 1, (size, size)).astype(np.float32)
+
+
+def test_identical_results_are_stored_once_and_mapped(tmp_path):
+    store = ResultStore(str(tmp_path))
+    first = store.put(_ndvi(), BOUNDS, "ndvi")
+    second = store.put(_ndvi(), BOUNDS, "ndvi")
+    assert first.key == second.key and store.refcount(first.key) == 2
+    assert len(os.listdir(tmp_path)) == 1
+
+    data, bounds = store.get(first)
+    assert isinstance(data, np.memmap) and not data.flags.writeable
+    assert bounds == BOUNDS and np.array_equal(data, _ndvi())
+    # Every session reads the same mapping.
+    assert store.get(second)[0] is data
+
+    # Other bounds are another result.
+    assert store.put(_ndvi(), [0, 0, 1, 1], "ndvi").key != first.key
+
+
+def test_encoded_rasters_round_trip(tmp_path):
+    store = ResultStore(str(tmp_path))
+    encoded = encode_ndvi(_ndvi(1), "int16")
+    handle = store.put(encoded, BOUNDS, "ndvi")
+    assert handle.shape == (64, 64) and handle.nbytes == encoded.nbytes
+
+    data, _ = store.get(handle.key)
+    assert isinstance(data, EncodedRaster) and data.encoding == "int16"
+    np.testing.assert_array_equal(data.decode(), encoded.decode())
+
+
+def test_handles_release_their_references(tmp_path):
+    store = ResultStore(str(tmp_path))
+    handle = store.put(_ndvi(), BOUNDS, "ndvi")
+    other = store.put(_ndvi(), BOUNDS, "ndvi")
+    key = handle.key
+
+    other.release()
+    other.release()  # releasing twice is harmless
+    assert store.refcount(key) == 1
+    del handle
+    gc.collect()
+    assert store.refcount(key) == 0 and key in store
+
+
+def test_least_recently_used_unreferenced_results_are_evicted(tmp_path):
+    size = _ndvi().nbytes
+    store = ResultStore(str(tmp_path), max_bytes=int(size * 3.5))
+    kept = store.put(_ndvi(0), BOUNDS, "ndvi")
+    old = store.put(_ndvi(1), BOUNDS, "ndvi")
+    recent = store.put(_ndvi(2), BOUNDS, "ndvi")
+    old_key, recent_key = old.key, recent.key
+    old.release()
+    recent.release()
+    store.get(recent_key)
+
+    # Over the cap: the oldest unreferenced result goes, the referenced one never does.
+    store.put(_ndvi(3), BOUNDS, "ndvi")
+    assert kept.key in store and recent_key in store and old_key not in store
+    assert not os.path.exists(tmp_path / old_key)
+    assert store.nbytes <= store.max_bytes
+
+
+def test_reopened_store_finds_results_and_drops_partial_writes(tmp_path):
+    store = ResultStore(str(tmp_path))
+    handle = store.put(_ndvi(), BOUNDS, "water")
+    (tmp_path / f"{handle.key}.tmp-abc").mkdir()
+
+    reopened = ResultStore(str(tmp_path))
+    assert handle.key in reopened and reopened.nbytes == store.nbytes
+    assert sorted(os.listdir(tmp_path)) == [handle.key]
+    assert np.array_equal(reopened.get(handle.key)[0], _ndvi())
+    with pytest.raises(FileNotFoundError):
+        reopened.get("0" * 40)
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from safe_ro.core import singleflight
+from safe_ro.core.instrumentation import REGISTRY
+from safe_ro.core.singleflight import SingleFlight, make_key
+
+
+def _outcomes(name):
+    return {
+        outcome: REGISTRY.counter(singleflight.METRIC, call=name, outcome=outcome)
+        for outcome in ("leader", "coalesced_thread", "coalesced_process", "timeout")
+    }
+
+
+def test_key_normalizes_paths(tmp_path, monkeypatch):
+    band = tmp_path / "red.tif"
+    band.write_bytes(b"v1")
+    monkeypatch.chdir(tmp_path)
+    key = make_key("ndvi", {"red": str(band), "threshold": None})
+    assert make_key("ndvi", {"threshold": None, "red": "red.tif"}) == key
+    assert make_key("flood", {"red": str(band), "threshold": None}) != key
+
+    os.utime(band, ns=(0, 0))  # a rewritten input is a different analysis
+    assert make_key("ndvi", {"red": str(band), "threshold": None}) != key
+
+
+def test_concurrent_threads_share_one_run(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+    runs = []
+    before = _outcomes("t.share")
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.3)
+        return np.arange(4), [0, 0, 1, 1]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: flights.do("t.share", {"x": 1}, compute), range(5)))
+
+    assert len(runs) == 1
+    assert all(r is results[0] for r in results)
+    after = _outcomes("t.share")
+    assert after["leader"] - before["leader"] == 1
+    assert after["coalesced_thread"] - before["coalesced_thread"] == 4
+
+    # Once finished, the next call computes again: coalescing is not caching.
+    flights.do("t.share", {"x": 1}, compute)
+    assert len(runs) == 2
+
+
+def test_errors_reach_every_waiter(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+
+    def fail():
+        time.sleep(0.2)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flights.do, "t.error", {}, fail) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="boom"):
+            future.result()
+
+
+@pytest.mark.parametrize("cross_process", [False, True])
+def test_waiters_stop_waiting_for_a_stuck_leader(tmp_path, cross_process):
+    if cross_process and singleflight.fcntl is None:
+        pytest.skip("needs fcntl")
+    waiter_flights = SingleFlight(str(tmp_path), cross_process=cross_process, timeout=0.2)
+    # Threads share the leader's instance; processes have their own.
+    leader_flights = SingleFlight(str(tmp_path)) if cross_process else waiter_flights
+    started, release = threading.Event(), threading.Event()
+    name = f"t.timeout.{cross_process}"
+    before = _outcomes(name)
+
+    def stuck():
+        started.set()
+        release.wait(10)
+        return "leader", None
+
+    leader = threading.Thread(target=lambda: leader_flights.do(name, {}, stuck))
+    leader.start()
+    started.wait()
+    t0 = time.perf_counter()
+    assert waiter_flights.do(name, {}, lambda: ("waiter", None)) == ("waiter", None)
+    assert time.perf_counter() - t0 < 2
+    release.set()
+    leader.join()
+    assert _outcomes(name)["timeout"] - before["timeout"] == 1
+
+
+@pytest.mark.skipif(singleflight.fcntl is None, reason="needs fcntl")
+def test_other_processes_wait_for_the_leader(tmp_path):
+    # Separate SingleFlight instances hold separate lock file descriptions,
+    # exactly like two API worker processes.
+    worker_a, worker_b = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    started = threading.Event()
+    runs = []
+    before = _outcomes("t.proc")
+
+    def slow():
+        runs.append("a")
+        started.set()
+        time.sleep(0.4)
+        return np.ones(3), [0, 0, 1, 1]
+
+    leader = threading.Thread(target=lambda: worker_a.do("t.proc", {"scene": 7}, slow))
+    leader.start()
+    started.wait()
+    data, bounds = worker_b.do("t.proc", {"scene": 7}, lambda: runs.append("b") or (None, None))
+    leader.join()
+
+    assert runs == ["a"]
+    assert data.tolist() == [1.0, 1.0, 1.0] and bounds == [0, 0, 1, 1]
+    assert _outcomes("t.proc")["coalesced_process"] - before["coalesced_process"] == 1
+
+
+@pytest.mark.skipif(singleflight.fcntl is None, reason="needs fcntl")
+def test_failed_results_are_not_shared_across_processes(tmp_path):
+    worker_a, worker_b = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.3)
+        return None, None
+
+    leader = threading.Thread(target=lambda: worker_a.do("t.fail", {}, failing))
+    leader.start()
+    started.wait()
+    result = worker_b.do("t.fail", {}, lambda: ("retried", None))
+    leader.join()
+    assert result == ("retried", None)
+
+
+@pytest.mark.skipif(singleflight.fcntl is None, reason="needs fcntl")
+def test_nothing_is_left_on_disk(tmp_path):
+    root = tmp_path / "flights"
+    workers = [SingleFlight(str(root)) for _ in range(3)]
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.4)
+        return np.arange(3), None
+
+    leader = threading.Thread(target=lambda: workers[0].do("t.clean", {}, slow))
+    leader.start()
+    started.wait()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(lambda w: w.do("t.clean", {}, lambda: ("recomputed", None)), workers[1:]))
+    leader.join()
+
+    assert all(data.tolist() == [0, 1, 2] for data, _ in results)
+    assert os.listdir(root) == []
+    assert os.stat(root).st_mode & 0o777 == 0o700
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+def _loaded_after_import(module, candidates):
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {candidates!r} if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=SRC)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def test_api_import_defers_processing_dependencies():
+    """Workers must answer /health without loading numpy, rasterio or OpenCV."""
+    heavy = ["numpy", "rasterio", "cv2", "cProfile", "safe_ro.core.safe_ro_core"]
+    assert _loaded_after_import("safe_ro.interfaces.safe_ro_api", heavy) == []
+
+
+def test_core_import_defers_opencv():
+    assert _loaded_after_import("safe_ro.core.safe_ro_core", ["cv2", "safe_ro.core.speckle"]) == []
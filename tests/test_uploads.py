@@ -0,0 +1,117 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from fastapi.testclient import TestClient
+
+from safe_ro.core.instrumentation import REGISTRY
+from safe_ro.core.safe_ro_core import NDVIProcessor
+from safe_ro.interfaces import uploads
+from safe_ro.interfaces.safe_ro_api import app
+
+
+@pytest.fixture
+def bands(tmp_path, write_raster):
+    rng = np.random.default_rng(3)
+    return {
+        "red": write_raster(tmp_path / "red.tif", rng.uniform(0.05, 0.2, (200, 150)).astype(np.float32)),
+        "nir": write_raster(tmp_path / "nir.tif", rng.uniform(0.3, 0.6, (200, 150)).astype(np.float32)),
+        "s1": write_raster(tmp_path / "vv.tif", rng.uniform(0.0, 1.0, (200, 150)).astype(np.float32)),
+    }
+
+
+def _files(bands, *names):
+    return {name: (os.path.basename(bands[name]), open(bands[name], "rb"), "image/tiff") for name in names}
+
+
+def test_ndvi_upload_matches_path_request(bands):
+    client = TestClient(app)
+    response = client.post("/ndvi/upload", files=_files(bands, "red", "nir"), data={"encoding": "int16"})
+    assert response.status_code == 200
+    body = response.json()
+    expected, _ = NDVIProcessor(bands["red"], bands["nir"]).compute_ndvi()
+    assert body["stats"]["mean"] == pytest.approx(float(expected.mean()))
+    assert body["raster"]["shape"] == [200, 150]
+
+
+def test_large_uploads_spill_to_disk(bands, tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    monkeypatch.setattr(uploads, "MEMORY_LIMIT_BYTES", 4096)
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(spool))
+    spills = REGISTRY.counter("safe_ro_upload_spills_total")
+
+    response = TestClient(app).post("/flood/upload", files=_files(bands, "s1"), data={"threshold": "0.25"})
+    assert response.status_code == 200
+    assert response.json()["flooded_area_percent"] == pytest.approx(25.0, abs=1.0)
+    assert REGISTRY.counter("safe_ro_upload_spills_total") == spills + 1
+    assert os.listdir(spool) == []  # spooled files are removed after the request
+
+
+def test_upload_limits(bands, monkeypatch):
+    client = TestClient(app)
+    response = client.post("/ndvi/upload", files=_files(bands, "red"))
+    assert response.status_code == 422 and "nir" in response.json()["error"]
+
+    response = client.post("/flood/upload", data={"threshold": "0.2"})
+    assert response.status_code in (415, 422)
+
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 10_000)
+    response = client.post("/flood/upload", files=_files(bands, "s1"))
+    assert response.status_code == 413
+
+    monkeypatch.setattr(uploads, "_slots", asyncio.Semaphore(0))
+    response = client.post("/flood/upload", files=_files(bands, "s1"))
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+
+
+def test_nodata_pixels_are_left_out_of_the_stats(tmp_path, write_raster):
+    red = np.full((50, 40), 800, dtype=np.uint16)
+    nir = np.full((50, 40), 2400, dtype=np.uint16)
+    red[:10], nir[:10] = 0, 0
+    paths = {}
+    for name, data in (("red", red), ("nir", nir)):
+        paths[name] = write_raster(tmp_path / f"{name}.tif", data)
+        with rasterio.open(paths[name], "r+") as dst:
+            dst.nodata = 0
+
+    client = TestClient(app)
+    response = client.post("/ndvi", json={"red_path": paths["red"], "nir_path": paths["nir"]})
+    assert response.status_code == 200
+    assert response.json()["stats"] == pytest.approx({"min": 0.5, "max": 0.5, "mean": 0.5})
+    response = client.post("/ndvi/upload", files=_files(paths, "red", "nir"))
+    assert response.status_code == 200 and response.json()["stats"]["mean"] == pytest.approx(0.5)
+
+    empty = write_raster(tmp_path / "empty.tif", np.zeros((20, 20), dtype=np.uint16))
+    with rasterio.open(empty, "r+") as dst:
+        dst.nodata = 0
+    response = client.post("/ndvi", json={"red_path": empty, "nir_path": empty})
+    assert response.status_code == 200 and "nodata" in response.json()["error"]
+
+
+def test_repeated_file_fields_are_rejected(bands, tmp_path, monkeypatch):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    monkeypatch.setattr(uploads, "MEMORY_LIMIT_BYTES", 4096)
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(spool))
+
+    files = [("s1", (name, open(bands["s1"], "rb"), "image/tiff")) for name in ("a.tif", "b.tif")]
+    response = TestClient(app).post("/flood/upload", files=files)
+    assert response.status_code == 400 and "more than once" in response.json()["error"]
+    assert os.listdir(spool) == []
+
+
+def test_unknown_speckle_filters_are_rejected(bands):
+    client = TestClient(app)
+    for path in ("/flood", "/flood/polygons"):
+        response = client.post(path, json={"s1_path": bands["s1"], "speckle_filter": "gaussian"})
+        assert response.status_code == 422
+    body = {"s1_path": bands["s1"], "speckle_filter": "gaussian", "preview": True}
+    assert client.post("/flood", json=body).status_code == 422
+
+    response = client.post("/flood/upload", files=_files(bands, "s1"), data={"speckle_filter": "gaussian"})
+    assert response.status_code == 200 and "Unknown speckle filter" in response.json()["error"]
+    response = client.post("/flood/upload", files=_files(bands, "s1"), data={"speckle_filter": "lee"})
+    assert "flooded_area_percent" in response.json()
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+from safe_ro.core.vectorize import polygonize_mask
+
+
+def test_polygonize_merges_seams_and_drops_small_areas():
+    """A blob spanning several strips is one feature; specks below min area vanish."""
+    mask = np.zeros((60, 50), dtype=np.uint8)
+    mask[5:45, 10:30] = 1  # crosses the seams at rows 16, 32
+    mask[20:25, 15:20] = 0  # a hole
+    mask[50:52, 40:42] = 1  # 4 px speck
+    mask[0:10, 45:50] = 1  # 50 px blob touching the edge
+
+    bounds = [24.0, 45.0, 24.05, 45.06]  # 0.001 deg pixels, ~79 m x 111 m
+    result = polygonize_mask(mask, bounds, min_area_m2=100000, strip_rows=16)
+
+    features = result["features"]
+    assert len(features) == 2
+    big = max(features, key=lambda f: f["properties"]["pixels"])
+    assert big["properties"]["pixels"] == 40 * 20 - 25
+    assert len(big["geometry"]["coordinates"][0]) == 2  # outer ring + hole
+    lon, lat = big["properties"]["centroid"]
+    assert 24.01 < lon < 24.03 and 45.01 < lat < 45.06
+    assert big["properties"]["area_ha"] > 0
+
+    # Compact: a few hundred bytes instead of a full raster.
+    assert len(json.dumps(result)) < 2000
+
+
+def test_pixels_and_lines_are_kept_as_their_footprint():
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2, 2] = 1  # single pixel
+    mask[6, 3:8] = 1  # one-pixel-high line
+
+    result = polygonize_mask(mask, [0.0, 0.0, 0.01, 0.01], min_area_m2=0)
+    footprints = {}
+    for feature in result["features"]:
+        (ring,) = feature["geometry"]["coordinates"][0]
+        lons, lats = zip(*ring)
+        footprints[feature["properties"]["pixels"]] = [min(lons), min(lats), max(lons), max(lats)]
+    assert footprints[1] == pytest.approx([0.002, 0.007, 0.003, 0.008])
+    assert footprints[5] == pytest.approx([0.003, 0.003, 0.008, 0.004])
+
+
+def test_outlines_follow_pixel_edges():
+    """A 10x10 pixel block is drawn 10 pixels wide, enclosing the area it reports."""
+    mask = np.zeros((30, 30), dtype=np.uint8)
+    mask[5:15, 5:15] = 1
+    mask[20:22, 3:25] = 1  # two pixels high
+
+    result = polygonize_mask(mask, [0.0, 0.0, 0.03, 0.03], min_area_m2=0, simplify=0)
+    for feature in result["features"]:
+        (ring,) = feature["geometry"]["coordinates"][0]
+        x, y = np.array(ring).T
+        shoelace = 0.5 * abs(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+        assert shoelace == pytest.approx(feature["properties"]["pixels"] * 1e-6)
+    block = max(result["features"], key=lambda f: f["properties"]["pixels"])
+    lons = [lon for lon, _ in block["geometry"]["coordinates"][0][0]]
+    assert (min(lons), max(lons)) == pytest.approx((0.005, 0.015))
+
+
+def test_small_components_are_dropped_before_reprojection(monkeypatch):
+    from safe_ro.core import vectorize
+
+    calls = []
+    reproject = vectorize.transform_geom
+    monkeypatch.setattr(vectorize, "transform_geom", lambda *args: calls.append(1) or reproject(*args))
+    mask = np.zeros((100, 100), dtype=np.uint8)
+    mask[::4, ::4] = 1  # 625 single-pixel specks
+    mask[40:80, 40:80] = 1
+
+    bounds = [500000, 5100000, 501000, 5101000]  # 10 m pixels in UTM 35N
+    result = polygonize_mask(mask, bounds, crs="EPSG:32635", min_area_m2=1000)
+    assert len(result["features"]) == 1
+    assert len(calls) == 2  # the kept feature's centroid and outline
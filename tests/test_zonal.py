@@ -0,0 +1,110 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from safe_ro.core import zonal
+from safe_ro.core.zonal import ZoneLayer, zonal_stats
+
+
+def _square(x0, y0, x1, y1):
+    return {"type": "Polygon", "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]}
+
+
+def test_zonal_stats_from_array_and_raster(tmp_path):
+    """Per-zone stats from an in-memory array match those from a windowed raster read."""
+    zones_path = tmp_path / "zones.geojson"
+    zones_path.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "id": "A", "properties": {"name": "West"}, "geometry": _square(0, 0, 5, 10)},
+                    {"type": "Feature", "id": "B", "properties": {"name": "East"}, "geometry": _square(5, 0, 10, 10)},
+                    {"type": "Feature", "id": "C", "properties": {"name": "Away"}, "geometry": _square(50, 50, 60, 60)},
+                ],
+            }
+        )
+    )
+    values = np.tile(np.linspace(-0.9, 0.9, 10, dtype=np.float32), (10, 1))
+    values[0, 0] = np.nan
+
+    zones = ZoneLayer(str(zones_path))
+    from_array = zonal_stats(zones, values, bounds=[0, 0, 10, 10], block_rows=3)
+
+    west, east, away = from_array
+    assert (west["id"], west["name"]) == ("A", "West")
+    assert west["count"] == 49 and east["count"] == 50
+    assert np.isclose(east["mean"], values[:, 5:].mean())
+    assert np.isclose(west["min"], -0.9) and np.isclose(east["max"], 0.9)
+    assert sum(east["histogram"]) == 50
+    assert away["count"] == 0 and away["mean"] is None
+
+    raster_path = tmp_path / "ndvi.tif"
+    profile = {
+        "driver": "GTiff", "dtype": "float32", "count": 1, "width": 10, "height": 10,
+        "crs": "EPSG:4326", "transform": from_origin(0, 10, 1, 1), "nodata": np.nan,
+    }
+    with rasterio.open(raster_path, "w", **profile) as dst:
+        dst.write(values, 1)
+    from_raster = zonal_stats(zones, str(raster_path), block_rows=4)
+    assert [z["count"] for z in from_raster] == [z["count"] for z in from_array]
+    assert np.isclose(from_raster[1]["sum"], from_array[1]["sum"])
+
+
+def test_label_cache_maps_labels_and_is_bounded(tmp_path, monkeypatch):
+    zones_path = tmp_path / "zones.geojson"
+    feature = {"type": "Feature", "properties": {}, "geometry": _square(0, 0, 10, 10)}
+    zones_path.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    zones = ZoneLayer(str(zones_path))
+    monkeypatch.setattr(zonal, "_LABEL_CACHE", OrderedDict())
+    # Labels held in memory count against SAFE_RO_ZONE_CACHE_MB, here 200 bytes.
+    monkeypatch.setattr(zonal, "LABEL_CACHE_MB", 200 / (1024 * 1024))
+
+    def labels(size, cache_dir):
+        transform = from_origin(0, 10, 10 / size, 10 / size)
+        return zones.label_raster(transform, (size, size), "EPSG:4326", cache_dir)
+
+    assert labels(8, "").nbytes == 128
+    mapped = labels(10, str(tmp_path / "labels"))
+    assert isinstance(mapped, np.memmap) and mapped.sum() == 100
+    labels(9, "")
+    # The 8x8 labels were dropped to make room; mapped ones do not count.
+    assert [a.shape for a in zonal._LABEL_CACHE.values()] == [(10, 10), (9, 9)]
+
+
+def test_zonal_endpoint_reports_bad_zone_files(tmp_path):
+    from fastapi.testclient import TestClient
+    from safe_ro.interfaces.safe_ro_api import app
+
+    client = TestClient(app)
+    broken = tmp_path / "broken.geojson"
+    broken.write_text("{not json")
+    for zones_path in (str(tmp_path / "missing.geojson"), str(broken), str(tmp_path / "zones.shp")):
+        response = client.post("/zonal", json={"zones_path": zones_path, "product": "flood", "s1_path": "vv.tif"})
+        assert response.status_code == 200 and "Could not read zones" in response.json()["error"]
+    response = client.post("/zonal", json={"zones_path": str(broken), "product": "ndwi"})
+    assert response.json() == {"error": "Unknown product 'ndwi'"}
+
+
+def test_label_cache_is_shared_safely_between_threads(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    zones_path = tmp_path / "zones.geojson"
+    feature = {"type": "Feature", "properties": {}, "geometry": _square(0, 0, 10, 10)}
+    zones_path.write_text(json.dumps({"type": "FeatureCollection", "features": [feature]}))
+    zones = ZoneLayer(str(zones_path))
+    monkeypatch.setattr(zonal, "_LABEL_CACHE", OrderedDict())
+    monkeypatch.setattr(zonal, "_LABEL_CACHE_SIZE", 2)
+
+    def lookup(i):
+        size = 8 + i % 3  # three grids through a two-entry cache
+        transform = from_origin(0, 10, 10 / size, 10 / size)
+        return zones.label_raster(transform, (size, size), "EPSG:4326", str(tmp_path / "labels")).sum()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sums = list(pool.map(lookup, range(300)))
+    assert sums == [(8 + i % 3) ** 2 for i in range(300)]
+    assert len(zonal._LABEL_CACHE) == 2